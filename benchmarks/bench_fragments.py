@@ -0,0 +1,50 @@
+from __future__ import annotations
+import argparse
+import concurrent.futures
+import os
+import tempfile
+import urllib.request
+from time import perf_counter
+from typing import Optional
+from typing import Sequence
+
+from crunchy_dl.fragments import FragmentPool, parse_m3u8
+from benchmarks.media_server import MediaServer
+
+def fetch(url: str) -> bytes:
+	with urllib.request.urlopen(url) as response:
+		return response.read()
+
+def run(server: MediaServer, episodes: int, workers: int, in_flight: int) -> float:
+	pool = FragmentPool(workers, in_flight)
+	with tempfile.TemporaryDirectory() as tmp:
+		start = perf_counter()
+		with concurrent.futures.ThreadPoolExecutor(max_workers = episodes) as executor:
+			futures = []
+			for episode in range(episodes):
+				url = server.playlist_url(f"ep{episode}")
+				urls = parse_m3u8(fetch(url).decode(), url)
+				futures.append(executor.submit(pool.download, urls, os.path.join(tmp, f"ep{episode}.ts"), fetch))
+			for future in futures: future.result()
+		elapsed = perf_counter() - start
+	pool.close()
+	return elapsed
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+	parser = argparse.ArgumentParser(description="Episode-level vs fragment-level parallelism on a synthetic HLS stream")
+	parser.add_argument("--episodes", type=int, default=3)
+	parser.add_argument("--fragments", type=int, default=40)
+	parser.add_argument("--fragment-size", type=int, default=256 * 1024)
+	parser.add_argument("--latency", type=float, default=0.05)
+	parser.add_argument("--workers", type=int, default=10)
+	args = parser.parse_args(argv)
+
+	with MediaServer(args.fragments, args.fragment_size, args.latency) as server:
+		size = args.episodes * args.fragments * args.fragment_size
+		for label, workers, in_flight in (("per-episode", 1, 1), ("fragments", args.workers, args.workers)):
+			elapsed = run(server, args.episodes, workers, in_flight)
+			print(f"{label:12} workers={workers:3} {elapsed:7.2f}s {size / elapsed / 1e6:8.2f} MB/s")
+	return 0
+
+if __name__ == "__main__":
+	raise SystemExit(main())
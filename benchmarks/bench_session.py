@@ -0,0 +1,228 @@
+from __future__ import annotations
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+from datetime import datetime
+from time import perf_counter
+from time import sleep
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+import yt_dlp
+from crunchy_dl import main as crunchy
+from crunchy_dl.cli import worker_range_type
+from crunchy_dl.pool import SessionPool
+from benchmarks.media_server import MediaServer
+
+SERIES_URL = "https://beta.crunchyroll.com/series/GBENCH/benchmark"
+
+class FakeCrunchyrollIE(yt_dlp.extractor.common.InfoExtractor):
+	"""
+	Stands in for CrunchyrollBetaIE: episode pages resolve to the local media server.
+	"""
+	_VALID_URL = r"https?://beta\.crunchyroll\.com/(?:\w{1,2}/)?watch/(?P<id>\w+)"
+	server_url = None
+	media = "hls"
+	subtitles = False
+	latency = 0.0
+
+	@classmethod
+	def ie_key(cls) -> str:
+		return "CrunchyrollBeta"
+
+	def _real_extract(self, url: str) -> Dict[str, Any]:
+		episode_id = self._match_id(url)
+		if self.latency: sleep(self.latency)
+		if self.media == "hls":
+			media_format = {
+				"format_id": "hls", "url": f"{self.server_url}/{episode_id}/playlist.m3u8",
+				"protocol": "m3u8_native", "ext": "mp4",
+			}
+		else:
+			media_format = {"format_id": "mp4", "url": f"{self.server_url}/{episode_id}/video.mp4", "ext": "mp4"}
+		info = {"id": episode_id, "title": f"Benchmark {episode_id}", "formats": [media_format]}
+		if self.subtitles:
+			info["subtitles"] = {"en": [{"url": f"{self.server_url}/{episode_id}/en.vtt", "ext": "vtt"}]}
+		return info
+
+class FakeShowIE(crunchy.CrunchyrollSeasonShowIE):
+	"""
+	Lists `episodes` synthetic episodes in season 1 of any series.
+	"""
+	episodes = 0
+	latency = 0.0
+
+	def season_entries(self, url, seasons):
+		if self.latency: sleep(self.latency)
+		return (
+			{
+				"id": f"GBENCH{number:05d}", "url": f"https://beta.crunchyroll.com/watch/GBENCH{number:05d}/episode",
+				"title": f"Episode {number}", "season_number": 1, "episode_number": number,
+			}
+			for number in range(1, self.episodes + 1) if seasons is None or 1 in seasons
+		)
+
+class FakeSessionPool(SessionPool):
+	"""
+	SessionPool without Crunchyroll: login is a no-op and extractors are swapped for fakes.
+	"""
+	FAKES = {
+		crunchy.CrunchyrollSeasonShowIE: FakeShowIE,
+		yt_dlp.extractor.crunchyroll.CrunchyrollBetaIE: FakeCrunchyrollIE,
+	}
+
+	def downloader(self, args: Optional[List[Any]] = None) -> Any:
+		downloader = super().downloader(args)
+		# registered as an instance, yt-dlp would otherwise instantiate the real class by its key
+		if not isinstance(downloader._ies.get(FakeCrunchyrollIE.ie_key()), FakeCrunchyrollIE):
+			downloader.add_info_extractor(FakeCrunchyrollIE())
+		return downloader
+
+	def login(self, extractor: Any) -> None:
+		with self._lock:
+			if self.expired:
+				self._logged_in_at = perf_counter()
+				self.logins += 1
+
+	def extractor(self, ie_class: Any, args: Optional[List[Any]] = None) -> Any:
+		return super().extractor(self.FAKES.get(ie_class, ie_class), args)
+
+class Sampler(threading.Thread):
+	def __init__(self, interval: float = 0.01) -> None:
+		super().__init__(daemon=True)
+		self.interval = interval
+		self.peak_threads = threading.active_count()
+		self._done = threading.Event()
+
+	def run(self) -> None:
+		while not self._done.wait(self.interval):
+			self.peak_threads = max(self.peak_threads, threading.active_count())
+
+	def stop(self) -> int:
+		self._done.set()
+		self.join()
+		return self.peak_threads
+
+def trial(server_url: str, options: Dict[str, Any]) -> Dict[str, Any]:
+	"""
+	One session() run in a fresh process, so peak RSS and thread counts are its own.
+	"""
+	FakeCrunchyrollIE.server_url = server_url
+	FakeCrunchyrollIE.media = options["media"]
+	FakeCrunchyrollIE.subtitles = options["subtitles"]
+	FakeCrunchyrollIE.latency = options["extract_latency"]
+	FakeShowIE.episodes = options["episodes"]
+	FakeShowIE.latency = options["extract_latency"]
+	with tempfile.TemporaryDirectory() as destination, tempfile.TemporaryDirectory() as state:
+		config = {
+			"username": "benchmark", "password": "benchmark", "ffmpeg_location": "ffmpeg",
+			"destination": destination, "verbosity": False, "threads": options["threads"], "yes": True,
+			"engine": options["engine"], "concurrency": options["threads"],
+			"cache": {"enabled": False}, "journal": {"enabled": False}, "index": {"enabled": False},
+			"progress": {"format": "none"}, "postprocess": {"workers": 0},
+			# nothing a trial does may touch the real state under ~/.cache/crunchy_dl; staging is off unless given a path
+			"retry": {"dead_letter": os.path.join(state, "dead_letter.json")},
+			"queue": {"path": os.path.join(state, "queue.sqlite3")},
+			"watermarks": {"path": os.path.join(state, "sync.sqlite3")},
+			"download": {"series": [{
+				"url": SERIES_URL, "seasons": "1", "episodes": f"1-{options['episodes']}",
+				"args": [{"fixup": "never", "quiet": True, "noprogress": True}],
+			}]},
+		}
+		if options["fragment_threads"]:
+			config["fragments"] = {"threads": options["fragment_threads"]}
+		if options["autoscale"]:
+			low, high = options["autoscale"]
+			config["autoscale"] = {"min_workers": low, "max_workers": high, "interval": 0.5}
+		sampler = Sampler()
+		sampler.start()
+		start = perf_counter()
+		crunchy.session(config, pool_class=FakeSessionPool)
+		elapsed = perf_counter() - start
+		peak_threads = sampler.stop()
+		files = [name for name in os.listdir(destination) if name.endswith(".mp4")]
+		size = sum(os.path.getsize(os.path.join(destination, name)) for name in files)
+	# ru_maxrss is KiB on Linux and bytes on macOS
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+	return {
+		**options,
+		"seconds": round(elapsed, 3),
+		"completed": len(files),
+		"episodes_per_min": round(len(files) / elapsed * 60, 2),
+		"bytes_per_sec": round(size / elapsed),
+		"peak_rss_bytes": rss,
+		"peak_threads": peak_threads,
+	}
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+	with open(baseline_path) as f:
+		baseline = {
+			(result["engine"], result["threads"]): result for result in json.load(f)["results"]
+		}
+	for result in results:
+		previous = baseline.get((result["engine"], result["threads"]))
+		if not previous: continue
+		change = (result["episodes_per_min"] / previous["episodes_per_min"] - 1) * 100 if previous["episodes_per_min"] else 0
+		print(f"{result['engine']:8} threads={result['threads']:3} episodes/min {change:+7.1f}% vs baseline")
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+	parser = argparse.ArgumentParser(description="End to end session() throughput against a local media server")
+	parser.add_argument("--threads", type=int, nargs="+", default=[1, 5, 10])
+	parser.add_argument("--engine", choices=("threads", "async"), default="threads")
+	parser.add_argument("--episodes", type=int, default=20)
+	parser.add_argument("--media", choices=("hls", "mp4"), default="hls")
+	parser.add_argument("--subtitles", action="store_true")
+	parser.add_argument("--fragments", type=int, default=10)
+	parser.add_argument("--fragment-size", type=int, default=128 * 1024)
+	parser.add_argument("--fragment-threads", type=int, default=None)
+	parser.add_argument("--latency", type=float, default=0.02, help="Seconds before each media response")
+	parser.add_argument("--bandwidth", type=float, default=None, help="Bytes/sec per media response")
+	parser.add_argument("--extract-latency", type=float, default=0.05, help="Seconds per simulated extraction")
+	parser.add_argument("--autoscale", type=worker_range_type, help="MIN-MAX download workers chosen by the autoscaler")
+	parser.add_argument("--output", default="bench_session.json", help="Machine-readable results")
+	parser.add_argument("--compare", help="Earlier --output file to report changes against")
+	args = parser.parse_args(argv)
+
+	results = []
+	with MediaServer(args.fragments, args.fragment_size, args.latency, args.bandwidth) as server:
+		for threads in args.threads:
+			options = {
+				"engine": args.engine, "threads": threads, "episodes": args.episodes, "media": args.media,
+				"subtitles": args.subtitles, "fragment_threads": args.fragment_threads,
+				"extract_latency": args.extract_latency, "autoscale": args.autoscale,
+			}
+			with concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+				result = executor.submit(trial, server.url, options).result()
+			results.append(result)
+			print(
+				f"{args.engine:8} threads={threads:3} {result['seconds']:7.2f}s "
+				f"{result['episodes_per_min']:8.1f} episodes/min {result['bytes_per_sec'] / 1e6:7.2f} MB/s "
+				f"rss={result['peak_rss_bytes'] / 2 ** 20:6.1f} MiB threads={result['peak_threads']}"
+			)
+
+	with open(args.output, "w") as f:
+		json.dump({
+			"date": datetime.now().isoformat(timespec="seconds"),
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"server": {
+				"fragments": args.fragments, "fragment_size": args.fragment_size,
+				"latency": args.latency, "bandwidth": args.bandwidth,
+			},
+			"results": results,
+		}, f, indent=2)
+	if args.compare: compare(results, args.compare)
+	return 0
+
+if __name__ == "__main__":
+	raise SystemExit(main())
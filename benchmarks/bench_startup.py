@@ -0,0 +1,127 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+	"version": ["--version"],
+	"check": ["config", "{config}", "--check"],
+	"dry-run": ["config", "{config}", "--dry-run"],
+}
+
+def write_config(directory: str, series: int) -> str:
+	"""
+	A config with `series` entries; the urls are never fetched, every command stops at its first line.
+	"""
+	path = os.path.join(directory, "config.yaml")
+	lines = [
+		"username: benchmark", "password: benchmark", "ffmpeg_location: ffmpeg", f"destination: {directory}",
+		"cache: {enabled: false}", "journal: {enabled: false}", "index: {enabled: false}", "download:", "  series:",
+	]
+	for number in range(series):
+		lines += [f"    - url: https://beta.crunchyroll.com/series/GBENCH{number:05d}/benchmark", "      episodes: 1-12"]
+	with open(path, "w") as f:
+		f.write("\n".join(lines) + "\n")
+	return path
+
+def first_output(argv: List[str], importtime: bool = False) -> Tuple[float, str]:
+	"""
+	Seconds from spawning `crunchy` until its first line of output; the process is then stopped.
+	With `importtime` the -X importtime report is returned as well.
+	"""
+	command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-m", "crunchy_dl.cli"] + argv
+	# stderr goes to a file: the import report can be larger than a pipe buffer
+	with tempfile.TemporaryFile("w+") as stderr:
+		start = perf_counter()
+		process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, stderr=stderr, text=True)
+		line = process.stdout.readline()
+		elapsed = perf_counter() - start
+		process.kill()
+		process.communicate()
+		stderr.seek(0)
+		report = stderr.read()
+	if not line:
+		raise RuntimeError(f"{' '.join(argv)} printed nothing:\n{report[-2000:]}")
+	return elapsed, report
+
+def heaviest_imports(report: str, count: int = 8) -> List[Dict[str, Any]]:
+	"""
+	Top-level packages by cumulative import time from a -X importtime report.
+	"""
+	packages = {}
+	for line in report.splitlines():
+		if not line.startswith("import time:"): continue
+		_, cumulative, name = line.split("|")
+		module = name.strip()
+		# the header line and submodules, which are counted in their package
+		if not cumulative.strip().isdigit() or "." in module: continue
+		packages[module] = max(packages.get(module, 0), int(cumulative))
+	return [
+		{"module": module, "ms": round(micros / 1000, 1)}
+		for module, micros in sorted(packages.items(), key=lambda item: -item[1])[:count]
+	]
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+	with open(baseline_path) as f:
+		baseline = {result["command"]: result for result in json.load(f)["results"]}
+	for result in results:
+		previous = baseline.get(result["command"])
+		if not previous: continue
+		change = (result["seconds"] / previous["seconds"] - 1) * 100
+		print(f"{result['command']:8} time to first output {change:+7.1f}% vs baseline")
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+	parser = argparse.ArgumentParser(description="Time to first output of the crunchy command line")
+	parser.add_argument("--commands", nargs="+", choices=tuple(COMMANDS), default=list(COMMANDS))
+	parser.add_argument("--repeat", type=int, default=5, help="Runs per command, the median is reported")
+	parser.add_argument("--series", type=int, default=50, help="Series entries in the generated config")
+	parser.add_argument("--output", default="bench_startup.json", help="Machine-readable results")
+	parser.add_argument("--compare", help="Earlier --output file to report changes against")
+	args = parser.parse_args(argv)
+
+	results = []
+	with tempfile.TemporaryDirectory() as directory:
+		config = write_config(directory, args.series)
+		for name in args.commands:
+			command = [part.format(config=config) for part in COMMANDS[name]]
+			times = [first_output(command)[0] for _ in range(args.repeat)]
+			_, report = first_output(command, importtime=True)
+			imports = heaviest_imports(report)
+			result = {
+				"command": name, "seconds": round(statistics.median(times), 4),
+				"min_seconds": round(min(times), 4), "imports": imports,
+			}
+			results.append(result)
+			print(
+				f"{name:8} {result['seconds'] * 1000:7.1f} ms to first output  heaviest: "
+				+ ", ".join(f"{item['module']} {item['ms']:.0f}ms" for item in imports[:4])
+			)
+
+	with open(args.output, "w") as f:
+		json.dump({
+			"date": datetime.now().isoformat(timespec="seconds"),
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"series": args.series,
+			"results": results,
+		}, f, indent=2)
+	if args.compare: compare(results, args.compare)
+	return 0
+
+if __name__ == "__main__":
+	raise SystemExit(main())
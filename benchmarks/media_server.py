@@ -0,0 +1,107 @@
+from __future__ import annotations
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from time import sleep
+from typing import Dict
+from typing import Optional
+
+class MediaServer:
+	"""
+	Local HTTP server for synthetic HLS streams.
+	`/<episode>/playlist.m3u8` lists `fragments` segments of `fragment_size` bytes and
+	`/<episode>/video.mp4` serves the same bytes as one file. Every response is sent
+	after `latency` seconds and paced to `bandwidth` bytes/sec when set.
+	Paths listed in `failures` answer 503 that many times before succeeding.
+	"""
+	def __init__(
+		self, fragments: int = 10, fragment_size: int = 64 * 1024, latency: float = 0.0,
+		bandwidth: Optional[float] = None, failures: Optional[Dict[str, int]] = None
+	) -> None:
+		self.fragments = fragments
+		self.fragment_size = fragment_size
+		self.latency = latency
+		self.bandwidth = bandwidth
+		self.failures = dict(failures or {})
+		self.requests = 0
+		self.bytes_sent = 0
+		self._lock = threading.Lock()
+		self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+		self._server.daemon_threads = True
+		self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+	@property
+	def url(self) -> str:
+		return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+	def playlist_url(self, episode: str = "episode") -> str:
+		return f"{self.url}/{episode}/playlist.m3u8"
+
+	@staticmethod
+	def fragment(episode: str, index: int, size: int) -> bytes:
+		pattern = f"{episode}:{index:06d};".encode()
+		return (pattern * (size // len(pattern) + 1))[:size]
+
+	def video_url(self, episode: str = "episode") -> str:
+		return f"{self.url}/{episode}/video.mp4"
+
+	def video(self, episode: str) -> bytes:
+		return b"".join(self.fragment(episode, index, self.fragment_size) for index in range(self.fragments))
+
+	def playlist(self) -> str:
+		lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:4", "#EXT-X-MEDIA-SEQUENCE:0"]
+		for index in range(self.fragments):
+			lines += ["#EXTINF:4.0,", f"segment{index}.ts"]
+		return "\n".join(lines + ["#EXT-X-ENDLIST", ""])
+
+	def _handler(self) -> type:
+		server = self
+
+		class Handler(BaseHTTPRequestHandler):
+			def log_message(self, *args) -> None:
+				pass
+
+			def do_GET(self) -> None:
+				with server._lock:
+					server.requests += 1
+					failures = server.failures.get(self.path, 0)
+					if failures: server.failures[self.path] = failures - 1
+				if server.latency: sleep(server.latency)
+				if failures:
+					self.send_error(503)
+					return
+				parts = self.path.strip("/").split("/")
+				if len(parts) == 2 and parts[1] == "playlist.m3u8":
+					body = server.playlist().encode()
+					content_type = "application/vnd.apple.mpegurl"
+				elif len(parts) == 2 and parts[1].startswith("segment") and parts[1].endswith(".ts"):
+					body = server.fragment(parts[0], int(parts[1][7:-3]), server.fragment_size)
+					content_type = "video/mp2t"
+				elif len(parts) == 2 and parts[1] == "video.mp4":
+					body = server.video(parts[0])
+					content_type = "video/mp4"
+				elif len(parts) == 2 and parts[1].endswith(".vtt"):
+					body = f"WEBVTT\n\n00:00.000 --> 00:01.000\n{parts[0]} {parts[1]}\n".encode()
+					content_type = "text/vtt"
+				else:
+					self.send_error(404)
+					return
+				self.send_response(200)
+				self.send_header("Content-Type", content_type)
+				self.send_header("Content-Length", str(len(body)))
+				self.end_headers()
+				chunk = len(body) if not server.bandwidth else max(1, int(server.bandwidth / 20))
+				for offset in range(0, len(body), chunk):
+					self.wfile.write(body[offset:offset + chunk])
+					if server.bandwidth: sleep(chunk / server.bandwidth)
+				with server._lock: server.bytes_sent += len(body)
+
+		return Handler
+
+	def __enter__(self) -> MediaServer:
+		self._thread.start()
+		return self
+
+	def __exit__(self, *exc) -> None:
+		self._server.shutdown()
+		self._server.server_close()
@@ -0,0 +1,232 @@
+from __future__ import annotations
+import asyncio
+import concurrent.futures
+import functools
+import os
+from collections import deque
+from typing import Any
+from typing import AsyncIterator
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from .fragments import parse_m3u8
+from .trace import NULL_TRACER
+from .retry import backoff_delay
+
+try:
+	import aiohttp
+except ImportError:
+	aiohttp = None
+
+Entry = Dict[str, Any]
+Resolved = Union[Iterable[Tuple[Entry, Any]], AsyncIterator[Tuple[Entry, Any]]]
+NATIVE_PROTOCOLS = ("http", "https", "m3u8_native")
+CHUNK_SIZE = 64 * 1024
+
+async def aiterate(resolved: Resolved) -> AsyncIterator[Tuple[Entry, Any]]:
+	if hasattr(resolved, "__aiter__"):
+		async for item in resolved: yield item
+	else:
+		for item in resolved: yield item
+
+class AsyncEngine:
+	"""
+	Opt-in asyncio alternative to Pipeline. Media, fragment and subtitle requests are
+	coroutines on one pooled aiohttp session, bounded by `concurrency` episodes and
+	`requests` in-flight requests; yt-dlp calls that block run on a small thread executor.
+
+	`downloader` supplies the blocking pieces: prepare(url, args) -> info with a
+	"filepath", select_tracks(id, info, args), admit(id, info) for staging space,
+	download(url, args, info) for formats the engine leaves to yt-dlp, mux(id, info),
+	finish(id, ok, error) and the shared progress, governor, flow, tracks and journal.
+	"""
+	def __init__(
+		self, downloader: Any, extract_workers: int = 5, concurrency: int = 32,
+		requests: Optional[int] = None, retries: int = 3, backoff: float = 0.5, window: int = 32
+	) -> None:
+		if aiohttp is None:
+			raise RuntimeError("The async engine needs aiohttp: pip install crunchy_dl[async]")
+		self.downloader = downloader
+		self.extract_workers = extract_workers
+		self.concurrency = concurrency
+		self.requests = requests or concurrency * 4
+		self.retries = retries
+		self.backoff = backoff
+		self.window = window
+		self.in_flight = 0
+		self.peak_in_flight = 0
+		self._executor = None
+
+	async def _blocking(self, func: Callable[..., Any], *args: Any) -> Any:
+		return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(func, *args))
+
+	async def _throttle(self, size: int, flow: Tuple[str, float]) -> None:
+		governor = self.downloader.governor
+		if governor.rate: await self._blocking(governor.consume, size, *flow)
+		else: governor.consume(size, *flow)
+
+	async def _request(
+		self, session: aiohttp.ClientSession, url: str, headers: Dict[str, str],
+		flow: Tuple[str, float], sink: Optional[Any] = None
+	) -> bytes:
+		async with self._slots:
+			self.in_flight += 1
+			self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+			try:
+				for attempt in range(self.retries + 1):
+					chunks = []
+					try:
+						async with session.get(url, headers=headers) as response:
+							response.raise_for_status()
+							async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+								await self._throttle(len(chunk), flow)
+								if sink: sink.write(chunk)
+								else: chunks.append(chunk)
+						return b"".join(chunks)
+					except (aiohttp.ClientError, asyncio.TimeoutError):
+						if attempt == self.retries or sink: raise
+						await asyncio.sleep(backoff_delay(attempt, self.backoff))
+			finally:
+				self.in_flight -= 1
+
+	async def _fragments(
+		self, session: aiohttp.ClientSession, urls: List[str], filename: str,
+		headers: Dict[str, str], flow: Tuple[str, float], report: Callable[[int], None]
+	) -> None:
+		pending = deque()
+		with open(filename, "wb") as f:
+			try:
+				for url in urls:
+					while len(pending) >= self.window or (pending and pending[0].done()):
+						data = await pending.popleft()
+						f.write(data)
+						report(len(data))
+					pending.append(asyncio.ensure_future(self._request(session, url, headers, flow)))
+				while pending:
+					data = await pending.popleft()
+					f.write(data)
+					report(len(data))
+			except BaseException:
+				for task in pending: task.cancel()
+				raise
+
+	async def _media(
+		self, session: aiohttp.ClientSession, info: Dict[str, Any], filename: str, flow: Tuple[str, float]
+	) -> bool:
+		headers = info.get("http_headers") or {}
+		tmpfilename = filename + ".part"
+		status = {"filename": filename, "tmpfilename": tmpfilename, "downloaded_bytes": 0, "governed": True}
+
+		def report(size: int) -> None:
+			status["downloaded_bytes"] += size
+			self.downloader.progress.hook({**status, "status": "downloading", "info_dict": info})
+
+		if info.get("protocol") == "m3u8_native":
+			manifest = await self._request(session, info["url"], headers, flow)
+			urls = parse_m3u8(manifest.decode("utf-8", "ignore"), info["url"])
+			if urls is None: return False
+			await self._fragments(session, urls, tmpfilename, headers, flow, report)
+		else:
+			with open(tmpfilename, "wb") as f:
+				await self._request(session, info["url"], headers, flow, sink=f)
+			report(os.path.getsize(tmpfilename))
+		os.replace(tmpfilename, filename)
+		self.downloader.progress.hook({**status, "status": "finished", "info_dict": info})
+		return True
+
+	async def _subtitle(
+		self, session: aiohttp.ClientSession, lang: str, sub: Dict[str, Any],
+		filename: str, flow: Tuple[str, float]
+	) -> None:
+		sub["filepath"] = f"{os.path.splitext(filename)[0]}.{lang}.{sub['ext']}"
+		if os.path.exists(sub["filepath"]): return
+		data = sub.get("data")
+		if data is None:
+			data = (await self._request(session, sub["url"], sub.get("http_headers") or {}, flow)).decode("utf-8", "ignore")
+		with open(sub["filepath"], "w", encoding="utf-8") as f:
+			f.write(data)
+		self.downloader.tracks.fetched(len(data))
+
+	async def _fallback(self, entry: Entry, args: Any, info: Dict[str, Any]) -> None:
+		"""
+		Leaves an episode to yt-dlp with the info it was prepared with. The downloader
+		finishes the episode before raising, so its errors are not reported again.
+		"""
+		try:
+			await self._blocking(self.downloader.download, entry["url"], args, info)
+		except Exception:
+			pass
+
+	async def _episode(self, session: aiohttp.ClientSession, entry: Entry, args: Any) -> None:
+		episode_id = entry["id"]
+		async with self._episodes:
+			journal = self.downloader.journal
+			if journal: journal.update(episode_id, "downloading")
+			try:
+				info = await self._blocking(self.downloader.prepare, entry["url"], args)
+				if not self.downloader.select_tracks(episode_id, info, args): return
+				if not await self._blocking(self.downloader.admit, episode_id, info): return
+				formats = info.get("requested_formats") or [info]
+				if len(formats) != 1 or formats[0].get("protocol") not in NATIVE_PROTOCOLS:
+					await self._fallback(entry, args, info)
+					return
+				filename = info["filepath"]
+				flow = self.downloader.flow(episode_id)
+				subtitles = info.get("requested_subtitles") or {}
+				# subtitles download next to the media rather than before it
+				fetching = asyncio.gather(*(
+					self._subtitle(session, lang, sub, filename, flow) for lang, sub in subtitles.items()
+					if sub.get("url") or sub.get("data") is not None
+				))
+				try:
+					if not os.path.exists(filename):
+						with getattr(self.downloader, "tracer", NULL_TRACER).span("media", episode_id):
+							fetched = await self._media(session, formats[0], filename, flow)
+						if not fetched:
+							await self._fallback(entry, args, info)
+							return
+				finally:
+					await fetching
+				info["requested_downloads"] = [{"filepath": filename}]
+				await self._blocking(self.downloader.mux, episode_id, info)
+			except Exception as error:
+				self.downloader.finish(episode_id, False, error)
+
+	async def resolve(
+		self, jobs: Iterable[Tuple[Callable[[Dict[str, Any], Any], Tuple[List[Entry], Any]], Dict[str, Any], Any]]
+	) -> AsyncIterator[Tuple[Entry, Any]]:
+		with concurrent.futures.ThreadPoolExecutor(max_workers = self.extract_workers) as executor:
+			loop = asyncio.get_running_loop()
+			futures = [loop.run_in_executor(executor, extract, meta_data, args) for extract, meta_data, args in jobs]
+			for future in asyncio.as_completed(futures):
+				entries, args = await future
+				for entry in entries:
+					yield entry, args
+
+	async def _collect(self, resolved: Resolved) -> List[Tuple[Entry, Any]]:
+		return [item async for item in aiterate(resolved)]
+
+	async def _run(self, resolved: Resolved, on_queued: Optional[Callable[[Entry, Any], None]]) -> None:
+		self._slots = asyncio.Semaphore(self.requests)
+		self._episodes = asyncio.Semaphore(self.concurrency)
+		connector = aiohttp.TCPConnector(limit = self.requests)
+		with concurrent.futures.ThreadPoolExecutor(max_workers = self.extract_workers) as executor:
+			self._executor = executor
+			async with aiohttp.ClientSession(connector=connector) as session:
+				tasks = []
+				async for entry, args in aiterate(resolved):
+					if on_queued: on_queued(entry, args)
+					tasks.append(asyncio.ensure_future(self._episode(session, entry, args)))
+				await asyncio.gather(*tasks)
+		self._executor = None
+
+	def collect(self, resolved: Resolved) -> List[Tuple[Entry, Any]]:
+		return asyncio.run(self._collect(resolved))
+
+	def run(self, resolved: Resolved, on_queued: Optional[Callable[[Entry, Any], None]] = None) -> None:
+		asyncio.run(self._run(resolved, on_queued))
@@ -0,0 +1,163 @@
+from __future__ import annotations
+import contextlib
+import threading
+from time import monotonic
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+# no configuration may run more download workers than this
+HARD_CEILING = 64
+
+class WorkerLimit:
+	"""
+	Semaphore whose size can change while workers hold it. Shrinking never interrupts
+	a running download, it only stops new ones from starting.
+	"""
+	def __init__(self, limit: int) -> None:
+		self.limit = limit
+		self.active = 0
+		self._condition = threading.Condition()
+
+	def acquire(self) -> None:
+		with self._condition:
+			while self.active >= self.limit:
+				self._condition.wait()
+			self.active += 1
+
+	def release(self) -> None:
+		with self._condition:
+			self.active -= 1
+			self._condition.notify()
+
+	def resize(self, limit: int) -> None:
+		with self._condition:
+			self.limit = limit
+			self._condition.notify_all()
+
+	@contextlib.contextmanager
+	def slot(self) -> Iterator[None]:
+		self.acquire()
+		try:
+			yield
+		finally:
+			self.release()
+
+class AutoScaler:
+	"""
+	Hill-climbing controller for the number of active download workers. Every `interval`
+	seconds it samples aggregate bytes/sec and the share of failed episodes:
+	a worker is added while each addition raises throughput by at least `gain`, the last
+	one is removed when it did not, the count is halved when more than `max_error_rate`
+	of the finished episodes failed, and after `probe_every` quiet intervals one more
+	worker is tried in case conditions improved.
+
+	`bytes_done()` and `outcomes()` -> (completed, failed) are cumulative counters.
+	"""
+	def __init__(
+		self, bytes_done: Callable[[], int], outcomes: Callable[[], Tuple[int, int]],
+		min_workers: int = 1, max_workers: int = 10, interval: float = 5.0,
+		max_error_rate: float = 0.2, gain: float = 0.05, probe_every: int = 3,
+		log: Optional[Callable[[str], None]] = None
+	) -> None:
+		self.bytes_done = bytes_done
+		self.outcomes = outcomes
+		self.max_workers = max(1, min(max_workers, HARD_CEILING))
+		self.min_workers = max(1, min(min_workers, self.max_workers))
+		self.interval = interval
+		self.max_error_rate = max_error_rate
+		self.gain = gain
+		self.probe_every = probe_every
+		self.log = log
+		self.limit = WorkerLimit(self.min_workers)
+		self.decisions = []
+		self.peak_workers = self.min_workers
+		self._previous = None
+		self._last = "hold"
+		self._holds = 0
+		self._backlog = lambda: 0
+		self._stop = threading.Event()
+		self._thread = None
+
+	@property
+	def workers(self) -> int:
+		return self.limit.limit
+
+	def slot(self) -> Any:
+		return self.limit.slot()
+
+	def decide(self, throughput: float, completed: int, failed: int, backlog: int) -> Tuple[int, str]:
+		"""
+		Next worker count from one interval's measurements.
+		:returns: tuple -- (workers, reason)
+		"""
+		workers = self.workers
+		finished = completed + failed
+		previous, last = self._previous, self._last
+		self._previous = throughput
+		if finished and failed / finished > self.max_error_rate:
+			target, reason = workers // 2, f"{failed}/{finished} episodes failed"
+		elif backlog <= 0:
+			target, reason = workers, "no downloads waiting"
+		elif previous is None:
+			target, reason = workers + 1, "probing"
+		else:
+			change = throughput / previous - 1 if previous else (1.0 if throughput else 0.0)
+			if last == "grow" and change < self.gain:
+				target, reason = workers - 1, f"last worker added {change:+.0%} throughput"
+			elif change >= self.gain:
+				target, reason = workers + 1, f"throughput {change:+.0%}"
+			elif self._holds + 1 >= self.probe_every:
+				target, reason = workers + 1, "probing"
+			else:
+				target, reason = workers, f"throughput {change:+.0%}"
+		target = max(self.min_workers, min(self.max_workers, target))
+		self._last = "grow" if target > workers else "shrink" if target < workers else "hold"
+		self._holds = self._holds + 1 if self._last == "hold" else 0
+		return target, reason
+
+	def step(self, throughput: float, completed: int, failed: int, backlog: int) -> int:
+		workers = self.workers
+		target, reason = self.decide(throughput, completed, failed, backlog)
+		if target != workers:
+			self.limit.resize(target)
+			self.peak_workers = max(self.peak_workers, target)
+			decision = {
+				"time": monotonic(), "from": workers, "to": target, "reason": reason,
+				"bytes_per_sec": throughput, "completed": completed, "failed": failed,
+			}
+			self.decisions.append(decision)
+			if self.log:
+				self.log(
+					f"[AUTOSCALE] {workers} -> {target} workers: {reason} "
+					f"({throughput / 1e6:.2f} MB/s, {failed}/{completed + failed} failed)"
+				)
+		return target
+
+	def _run(self) -> None:
+		last_time, last_bytes = monotonic(), self.bytes_done()
+		last_completed, last_failed = self.outcomes()
+		while not self._stop.wait(self.interval):
+			now, done = monotonic(), self.bytes_done()
+			completed, failed = self.outcomes()
+			self.step(
+				(done - last_bytes) / max(now - last_time, 1e-6),
+				completed - last_completed, failed - last_failed, self._backlog()
+			)
+			last_time, last_bytes, last_completed, last_failed = now, done, completed, failed
+
+	def start(self, backlog: Callable[[], int]) -> None:
+		"""
+		Starts the control loop; `backlog()` is the number of downloads waiting for a worker.
+		"""
+		self._backlog = backlog
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name="autoscaler", daemon=True)
+		self._thread.start()
+
+	def stop(self) -> None:
+		self._stop.set()
+		if self._thread: self._thread.join()
+		self._thread = None
@@ -0,0 +1,90 @@
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+from time import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "crunchy_dl", "metadata.sqlite3")
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+HEAVY_FIELDS = (
+	"formats", "requested_formats", "requested_subtitles", "subtitles",
+	"automatic_captions", "thumbnails", "http_headers", "_version",
+)
+
+def compact(entry: Dict[str, Any]) -> Dict[str, Any]:
+	return {key: value for key, value in entry.items() if key not in HEAVY_FIELDS}
+
+class MetadataCache:
+	"""
+	SQLite backed store of extracted entries keyed by series/episode id.
+	Entries older than `ttl` seconds are ignored and the least recently used rows
+	are evicted once the stored payload grows past `max_bytes`.
+	"""
+	def __init__(
+		self, path: str = DEFAULT_CACHE_PATH, ttl: int = DEFAULT_TTL,
+		max_bytes: int = DEFAULT_MAX_BYTES, refresh: bool = False
+	) -> None:
+		if path != ":memory:":
+			os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		self.path = path
+		self.ttl = ttl
+		self.max_bytes = max_bytes
+		self.refresh = refresh
+		self.hits = 0
+		self.misses = 0
+		self._lock = threading.Lock()
+		self._db = sqlite3.connect(path, check_same_thread=False)
+		self._db.execute(
+			"CREATE TABLE IF NOT EXISTS entries ("
+			"key TEXT PRIMARY KEY, payload TEXT NOT NULL, size INTEGER NOT NULL, "
+			"created REAL NOT NULL, accessed REAL NOT NULL)"
+		)
+		self._db.commit()
+
+	def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+		with self._lock:
+			row = None
+			if not self.refresh:
+				row = self._db.execute(
+					"SELECT payload FROM entries WHERE key = ? AND created >= ?", (key, time() - self.ttl)
+				).fetchone()
+			if row is None:
+				self.misses += 1
+				return None
+			self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time(), key))
+			self._db.commit()
+			self.hits += 1
+		return json.loads(row[0])
+
+	def set(self, key: str, entries: List[Dict[str, Any]]) -> None:
+		payload = json.dumps([compact(entry) for entry in entries], separators=(",", ":"), default=str)
+		now = time()
+		with self._lock:
+			self._db.execute(
+				"INSERT OR REPLACE INTO entries (key, payload, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+				(key, payload, len(payload), now, now)
+			)
+			self._evict()
+			self._db.commit()
+
+	def _evict(self) -> None:
+		self._db.execute("DELETE FROM entries WHERE created < ?", (time() - self.ttl,))
+		total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+		if total <= self.max_bytes: return
+		for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+			self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+			total -= size
+			if total <= self.max_bytes: break
+
+	def stats(self) -> Dict[str, int]:
+		return {"hits": self.hits, "misses": self.misses}
+
+	def close(self) -> None:
+		with self._lock:
+			self._db.close()
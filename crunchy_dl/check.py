@@ -0,0 +1,210 @@
+from __future__ import annotations
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import yaml
+from cerberus import DocumentError
+from prettytable import PrettyTable
+
+from .manifest import walk, merge, distinct_episodes
+from .pool import args_key
+from .schema import config_validator
+from .urls import content_id
+from .selection import Selection, selection, merge_series, merge_selections
+
+# (line, path in the document, message); line is None when the path has no node
+Located = Tuple[Optional[int], str, str]
+# a Located problem of a given file
+Problem = Tuple[str, Optional[int], str, str]
+
+def node_line(node: Optional[yaml.Node], path: Tuple[Any, ...]) -> Optional[int]:
+	"""
+	1-based line of the YAML node at `path`, or of its closest existing parent.
+	"""
+	line = node.start_mark.line + 1 if node else None
+	for key in path:
+		if isinstance(node, yaml.MappingNode):
+			node = next((value for name, value in node.value if name.value == str(key)), None)
+		elif isinstance(node, yaml.SequenceNode) and isinstance(key, int) and key < len(node.value):
+			node = node.value[key]
+		else:
+			node = None
+		if node is None: break
+		line = node.start_mark.line + 1
+	return line
+
+def flatten(errors: Any, path: Tuple[Any, ...] = ()) -> Iterator[Tuple[Tuple[Any, ...], str]]:
+	"""
+	Walks cerberus' nested error dict, yielding (path, message) per leaf.
+	"""
+	if isinstance(errors, dict):
+		for key, value in errors.items():
+			yield from flatten(value, path + (key,))
+	elif isinstance(errors, list):
+		for value in errors:
+			yield from flatten(value, path)
+	else:
+		yield path, str(errors)
+
+def dotted(path: Tuple[Any, ...]) -> str:
+	return ".".join(str(key) for key in path)
+
+def load(text: str, manifest: bool = False) -> Tuple[Optional[Dict[str, Any]], Optional[yaml.Node], List[Located]]:
+	"""
+	Parses and validates a config in one pass; with `manifest` as one file of a multi-file run.
+	:returns: tuple -- (normalized config or None, YAML node tree, every problem found)
+	"""
+	loader = yaml.FullLoader(text)
+	try:
+		root = loader.get_single_node()
+		document = loader.construct_document(root) if root is not None else None
+	except yaml.MarkedYAMLError as error:
+		mark = error.problem_mark or error.context_mark
+		return None, None, [(mark.line + 1 if mark else None, "", f"{error.problem or error}")]
+	finally:
+		loader.dispose()
+	if not isinstance(document, dict):
+		return None, root, [(node_line(root, ()), "", "The config must be a mapping of settings")]
+	validator = config_validator(manifest)
+	if validator.validate(document):
+		return validator.document, root, []
+	problems = [(node_line(root, path), dotted(path), message) for path, message in flatten(validator.errors)]
+	return None, root, sorted(problems, key=lambda problem: (problem[0] or 0, problem[1]))
+
+def overlaps(first: Selection, second: Selection) -> bool:
+	for season, (ranges, latest) in first.items():
+		if season not in second: continue
+		other_ranges, other_latest = second[season]
+		if latest or other_latest: return True
+		if any(start <= other_end and other_start <= end for start, end in ranges for other_start, other_end in other_ranges):
+			return True
+	return False
+
+def duplicates(files: List[Tuple[str, Dict[str, Any], Optional[yaml.Node]]]) -> List[Problem]:
+	"""
+	Entries, across every file of the run, that would download the same episodes twice
+	or that merge into an earlier entry.
+	"""
+	problems = []
+	series_seen = {}
+	episodes_seen = {}
+
+	def where(source: str, section: str, index: int, path: str) -> str:
+		return f"download.{section}.{index}" + ("" if source == path else f" in {source}")
+
+	for path, document, root in files:
+		download = document.get("download") or {}
+		for index, series in enumerate(download.get("series") or []):
+			location = ("download", "series", index)
+			key = content_id(series["url"])
+			chosen = selection(series)
+			for source, other_index, other, other_chosen in series_seen.get(key, []):
+				earlier = where(source, "series", other_index, path)
+				merged = other["url"] == series["url"] and args_key(other.get("args")) == args_key(series.get("args"))
+				if merged and other_chosen == chosen:
+					message = f"duplicates {earlier}"
+				elif not overlaps(chosen, other_chosen):
+					continue
+				elif merged:
+					message = f"overlaps {earlier}, the selections are merged"
+				else:
+					message = f"overlaps {earlier} with a different url or args, shared episodes are downloaded twice"
+				problems.append((path, node_line(root, location), dotted(location), message))
+				break
+			series_seen.setdefault(key, []).append((path, index, series, chosen))
+		for index, episode in enumerate(download.get("episodes") or []):
+			location = ("download", "episodes", index)
+			key = (content_id(episode["url"]), args_key(episode.get("args")))
+			if key in episodes_seen:
+				source, other_index = episodes_seen[key]
+				earlier = where(source, "episodes", other_index, path)
+				problems.append((path, node_line(root, location), dotted(location), f"duplicates {earlier}, it is downloaded once"))
+			else:
+				episodes_seen[key] = (path, index)
+	return problems
+
+def describe(chosen: Selection) -> str:
+	"""
+	`S1-2: 1-3,7 | S4: latest 5` style summary of a selection.
+	"""
+	groups = []
+	for season in sorted(chosen):
+		ranges, latest = chosen[season]
+		episodes = ",".join(f"{start}" if start == end else f"{start}-{end}" for start, end in ranges)
+		if latest: episodes = f"{episodes},latest {latest}" if episodes else f"latest {latest}"
+		if groups and groups[-1][1] == season - 1 and groups[-1][2] == episodes:
+			groups[-1][1] = season
+		else:
+			groups.append([season, season, episodes])
+	return " | ".join(f"S{start}" + (f"-{end}" if end != start else "") + f": {episodes}" for start, end, episodes in groups)
+
+def planned_queue(download: Dict[str, Any], show_source: bool = False) -> PrettyTable:
+	table = PrettyTable(["Type", "id", "Selection", "Priority", "Args", "URL"] + (["Source"] if show_source else []))
+	table.max_width["Selection"] = 40
+	table.align["URL"] = "l"
+	rows = [
+		[
+			"series", content_id(series["url"]), describe(merge_selections([series["selection"]])),
+			series.get("priority", 1), len(series.get("args") or []), series["url"], series.get("source")
+		]
+		for series in merge_series(download.get("series") or [])
+	] + [
+		["episode", content_id(episode["url"]), "", episode.get("priority", 1), len(episode.get("args") or []), episode["url"], episode.get("source")]
+		for episode in distinct_episodes(download.get("episodes") or [])
+	]
+	for row in rows:
+		table.add_row(row if show_source else row[:-1])
+	return table
+
+def report(problems: List[Problem], kind: str) -> None:
+	for path, line, where, message in problems:
+		print(f"{path}{f':{line}' if line else ''}: {kind}: {where + ': ' if where else ''}{message}")
+
+def check(patterns: List[str]) -> int:
+	"""
+	`config --check`: validates every entry of every file (and included file), points at
+	each problem by line, warns about duplicate and overlapping entries and prints the queue
+	a run would work through. Nothing is logged in to or downloaded.
+	:returns: int -- Exit status, 1 when the config has errors
+	"""
+	errors = []
+	roots = {}
+
+	def parse(path: str) -> Optional[Dict[str, Any]]:
+		with open(path, encoding="utf-8") as f:
+			document, roots[path], problems = load(f.read(), manifest=True)
+		errors.extend((path, *problem) for problem in problems)
+		return document
+
+	label = patterns[0] if len(patterns) == 1 else f"{len(patterns)} config patterns"
+	try:
+		files = walk(patterns, parse)
+	except DocumentError as error:
+		errors.append((label, None, "", str(error)))
+	if not errors:
+		config, conflicts = merge(files)
+		# the files were each valid, so only settings missing from all of them can be left
+		validator = config_validator()
+		if not validator.validate(config):
+			errors.extend((label, None, dotted(path), message) for path, message in flatten(validator.errors))
+	report(errors, "error")
+	if errors:
+		print(f"[CONFIG] {label}: {len(errors)} error{'s' if len(errors) > 1 else ''}")
+		return 1
+	download = validator.document["download"]
+	warnings = [(path, None, "", conflict) for path, conflict in conflicts] + duplicates([
+		(path, document, roots[path]) for path, document in files
+	])
+	report(warnings, "warning")
+	print(planned_queue(download, show_source = len(files) > 1))
+	if len(files) > 1: label = f"{len(files)} files are"
+	else: label = f"{files[0][0]} is"
+	print(
+		f"[CONFIG] {label} valid: {len(merge_series(download.get('series') or []))} series, "
+		f"{len(distinct_episodes(download.get('episodes') or []))} episodes, {len(warnings)} warnings"
+	)
+	return 0
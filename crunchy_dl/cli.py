@@ -0,0 +1,429 @@
+from __future__ import annotations
+import argparse
+import os
+import re
+import sys
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from . import __version__
+from .autoscale import HARD_CEILING
+from .governor import parse_rate
+from .progress import FORMATS as PROGRESS_FORMATS
+from .selection import parse_ranges
+from .tracks import parse_languages
+from .urls import SERIES_URL, EPISODE_URL
+
+# Only the standard library and the small crunchy_dl modules are imported here. yaml and
+# cerberus load with the first config file and yt-dlp with the first download, so
+# `--version` and argument errors answer straight away.
+
+def series_episode_range_type(s: str) -> Tuple[List[Tuple[int, int]], Optional[int]]:
+	try:
+		return parse_ranges(s, latest=True)
+	except ValueError as error:
+		raise argparse.ArgumentTypeError(str(error))
+
+def season_selection_type(s: str) -> List[Tuple[int, int]]:
+	try:
+		return parse_ranges(s)[0]
+	except ValueError as error:
+		raise argparse.ArgumentTypeError(str(error))
+
+def positive_int_type(season: str) -> int:
+	try:
+		season = int(season)
+	except:
+		raise argparse.ArgumentTypeError(f"Expected positive integer, received {season}")
+	
+	if season <= 0:
+		raise argparse.ArgumentTypeError(f"Expected positive integer, received {season}")
+
+	return season
+
+def validate_user_metadata(config_data: str) -> Dict[str, ...]:
+	import yaml
+	from cerberus import DocumentError
+	from .schema import config_validator
+
+	config_data = yaml.load(config_data, Loader=yaml.FullLoader)
+	config_validator = config_validator()
+	is_valid = config_validator.validate(config_data)
+	if not is_valid:
+		raise DocumentError(config_validator.errors)
+	
+	return (True, config_validator.normalized(config_data))
+
+def validate_series_url(url: str) -> bool:
+	validity = SERIES_URL.match(url)
+	if not validity:
+		return False
+	return True
+
+def validate_episode_url(url: str) -> bool:
+	validity = EPISODE_URL.match(url)
+	if not validity:	
+		return False
+	return True
+
+def thread_input_type(threads: str) -> int:
+	try:
+		threads = int(threads)
+	except:
+		raise argparse.ArgumentTypeError(f"Expected Positive integer, received {threads}")
+	
+	if threads < 1 or threads > 10:
+		raise argparse.ArgumentTypeError(f"Expected integer between (1 - 10), receievd {threads}")
+	
+	return threads
+
+def worker_range_type(s: str) -> Tuple[int, int]:
+	match = re.fullmatch(r"(\d+)(?:-(\d+))?", s.strip())
+	if not match:
+		raise argparse.ArgumentTypeError(f"Expected MIN-MAX workers, received {s}")
+	low, high = int(match.group(1)), int(match.group(2) or match.group(1))
+	if not 1 <= low <= high <= HARD_CEILING:
+		raise argparse.ArgumentTypeError(f"Expected workers between (1 - {HARD_CEILING}), received {s}")
+	return low, high
+
+def rate_type(rate: str) -> float:
+	try:
+		return parse_rate(rate)
+	except ValueError as error:
+		raise argparse.ArgumentTypeError(str(error))
+
+def languages_type(languages: str) -> List[str]:
+	try:
+		return parse_languages(languages)
+	except ValueError as error:
+		raise argparse.ArgumentTypeError(str(error))
+
+def destination_path_type(destination: str) -> str:
+	if not os.path.exists(destination):
+		raise argparse.ArgumentTypeError("This path does not exist, please enter valid path")
+	return destination
+
+def argument_parsing(argv: Optional[Sequence[str]]) -> Tuple[argparse.Namespace, List[str, ...]]:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("-v", "--version", help="crunchy_dl version", action="store_true")
+	sub_parsers = parser.add_subparsers(dest="action")
+
+	episode_parser = sub_parsers.add_parser('episode', help="Download Single Anime Episode")
+	series_parser = sub_parsers.add_parser('series', help="Download Anime Series")
+	config_parser = sub_parsers.add_parser('config', help="Specify MetaData in separate config file")
+	resume_parser = sub_parsers.add_parser('resume', help="Resume unfinished downloads recorded in the journal")
+	sync_parser = sub_parsers.add_parser('sync', help="Download only episodes released since the last sync")
+	retry_parser = sub_parsers.add_parser('retry', help="Queue the episodes that failed in earlier runs again")
+	index_parser = sub_parsers.add_parser('index', help="Rebuild the download index from library directories")
+	coordinate_parser = sub_parsers.add_parser(
+		'coordinate', help="Resolve the configs into per-episode jobs on the shared queue for workers to download"
+	)
+	serve_parser = sub_parsers.add_parser(
+		'serve', help="Keep a logged-in session running and take jobs over a local socket or HTTP API"
+	)
+	work_parser = sub_parsers.add_parser('work', help="Download jobs from the shared queue alongside workers on other hosts")
+
+	for sub_parser in (episode_parser, series_parser):
+		sub_parser.add_argument('-u', '--username', help="Valid CrunchyRoll Username", required=True)
+		sub_parser.add_argument('-p', '--password', help="Valid CrunchyRoll Password", required=True)
+		sub_parser.add_argument('-l', '--url', help="Valid CrunchyRoll Series/Episode Link", required=True)
+		sub_parser.add_argument(
+			'-t', '--threads', type=thread_input_type, default = 5,
+			help="Number of threads to utilize (1 - 10)"
+		)		
+		sub_parser.add_argument(
+			'--extract-threads', type=thread_input_type, default = None,
+			help="Number of metadata extraction workers (1 - 10), defaults to --threads"
+		)
+		sub_parser.add_argument(
+			'--download-threads', type=thread_input_type, default = None,
+			help="Number of download workers (1 - 10), defaults to --threads"
+		)
+		sub_parser.add_argument(
+			'-d', '--destination', type=destination_path_type, default = os.getcwd(), 
+			help="Destination of where to save downloads"
+		)	
+		sub_parser.add_argument(
+			'-v', '--verbose', dest='verbosity', action='store_true', help="Verbosity of Downloader Output"
+		)		
+		sub_parser.add_argument('-f', '--ffmpeg', help="Location of ffmpeg on machine", required=True)
+
+	for sub_parser in (
+		episode_parser, series_parser, config_parser, resume_parser, sync_parser, retry_parser, coordinate_parser,
+		work_parser, serve_parser
+	):
+		sub_parser.add_argument('--refresh', action='store_true', help="Bypass the metadata cache and re-extract")
+		sub_parser.add_argument('--journal', help="Path of the download journal")
+		sub_parser.add_argument(
+			'--fragment-threads', type=positive_int_type, default = None,
+			help="Fetch HLS/DASH fragments of every episode on a shared pool of this many workers"
+		)
+		sub_parser.add_argument(
+			'--progress', choices=PROGRESS_FORMATS, default = None,
+			help="Live multi-line status view, JSON lines for monitoring, or nothing"
+		)
+		sub_parser.add_argument('--progress-file', help="Write progress output to this file instead of stdout")
+		sub_parser.add_argument(
+			'--engine', choices=("threads", "async"), default = None,
+			help="Run downloads on thread pools or on an asyncio event loop (needs aiohttp)"
+		)
+		sub_parser.add_argument(
+			'--concurrency', type=positive_int_type, default = None,
+			help="Episodes downloaded at once by the async engine"
+		)
+		sub_parser.add_argument(
+			'--autoscale', type=worker_range_type, default = None, metavar = "MIN-MAX",
+			help=f"Adjust download workers between MIN and MAX (at most {HARD_CEILING}) from measured throughput"
+		)
+		sub_parser.add_argument(
+			'--mux-workers', type=int, default = None,
+			help="Processes for ffmpeg subtitle muxing, defaults to the CPU count; 0 muxes inside the download workers"
+		)
+		sub_parser.add_argument(
+			'--limit-rate', type=rate_type, default = None,
+			help="Bandwidth limit shared by all downloads in bytes/sec, e.g. 500K or 4M"
+		)
+		sub_parser.add_argument(
+			'--max-fragments', type=positive_int_type, default = None,
+			help="Limit on fragments in flight across all episodes, defaults to twice --fragment-threads"
+		)
+		sub_parser.add_argument(
+			'--subs', type=languages_type, default = None, metavar = "LANGS",
+			help="Subtitle languages to fetch and embed, e.g. 'en-US,de-DE', 'es-.*', 'all' or 'none'"
+		)
+		sub_parser.add_argument(
+			'--audio', type=languages_type, default = None, metavar = "LANGS",
+			help="Audio languages to download, e.g. 'ja-JP'; episodes in other languages are skipped"
+		)
+		sub_parser.add_argument(
+			'--staging', metavar = "DIR",
+			help="Download and mux in this local directory, then move each finished episode to the destination"
+		)
+		sub_parser.add_argument('--trace', action='store_true', help="Print per-stage timings at the end of the run")
+		sub_parser.add_argument('--trace-file', help="Also write the timings as a Chrome trace / Perfetto JSON file")
+		sub_parser.add_argument(
+			'-y', '--yes', action='store_true',
+			help="Skip the preview prompt and start each download as soon as it is resolved"
+		)
+		sub_parser.add_argument(
+			'--dry-run', action='store_true', help="Print the resolved download queue and exit without downloading"
+		)
+
+	series_parser.add_argument(
+		'-r', "--range",
+		type=series_episode_range_type, default=([(1, 1)], None),
+		help="Episodes to download from each season, e.g. '1-3,7,10-12' or 'latest 5'"
+	)
+
+	series_parser.add_argument(
+		'-s', "--season", type=season_selection_type, default=[(1, 1)],
+		help="Seasons of the series, e.g. '2' or '1-3,5'"
+	)
+	config_parser.add_argument(
+		"config_files", nargs="+", metavar="config_file",
+		help="Config files or glob patterns; their download entries share one queue"
+	)
+	config_parser.add_argument(
+		'--check', action='store_true', help="Validate the config file offline, list every problem and the planned queue, then exit"
+	)
+	resume_parser.add_argument(
+		"config_files", nargs="+", metavar="config_file", help="Config files containing credentials and paths"
+	)
+	sync_parser.add_argument(
+		"config_files", nargs="+", metavar="config_file", help="Config files listing the series to keep current"
+	)
+	retry_parser.add_argument(
+		"config_files", nargs="+", metavar="config_file", help="Config files containing credentials and paths"
+	)
+	retry_parser.add_argument('--list', action='store_true', help="Print the failed episodes instead of retrying them")
+	coordinate_parser.add_argument(
+		"config_files", nargs="+", metavar="config_file", help="Config files or glob patterns listing what to download"
+	)
+	coordinate_parser.add_argument(
+		'--status', action='store_true', help="Print the leased and failed jobs and the queue counts instead of queueing"
+	)
+	work_parser.add_argument(
+		"config_files", nargs="+", metavar="config_file", help="Config files containing credentials and paths"
+	)
+	work_parser.add_argument('--worker-id', help="Name of this worker in the queue, defaults to host:pid")
+	work_parser.add_argument(
+		'--lease', type=positive_int_type, default = None,
+		help="Seconds a claimed job stays with this worker without a heartbeat before another may take it over"
+	)
+	work_parser.add_argument(
+		'--follow', action='store_true', help="Keep waiting for new jobs once the queue is empty"
+	)
+	serve_parser.add_argument(
+		"config_files", nargs="+", metavar="config_file",
+		help="Config files containing credentials and paths; their download entries are ignored"
+	)
+	serve_parser.add_argument('--socket', help="Listen on this Unix socket instead of localhost HTTP")
+	serve_parser.add_argument('--host', help="Address of the HTTP API, defaults to 127.0.0.1")
+	serve_parser.add_argument('--port', type=int, default = None, help="Port of the HTTP API, defaults to 8765")
+	for sub_parser in (coordinate_parser, work_parser):
+		sub_parser.add_argument('--queue', help="Path of the shared SQLite job queue, e.g. on the download NAS")
+	index_parser.add_argument("config_file", help="Path to config file containing the destination and index settings")
+	index_parser.add_argument(
+		'directories', nargs='*', help="Library directories to scan, defaults to the configured destination"
+	)
+	index_parser.add_argument(
+		'-t', '--threads', type=positive_int_type, default = None, help="Files hashed in parallel"
+	)
+	resume_parser.add_argument(
+		'--list', action='store_true', help="Print the journal as a config history section instead of resuming"
+	)
+
+	args, yt_dlp_args = parser.parse_known_args(argv)
+	if not args.version and not args.action:
+		parser.error("the following arguments are required: action")
+	return args, yt_dlp_args
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+	args, yt_dlp_args  = argument_parsing(argv)
+
+	if args.version:
+		print(__version__)
+		return 0
+	
+	if args.action == "index":
+		from .main import build_index
+
+		with open(args.config_file) as f:
+			config_data = validate_user_metadata(f.read())[1]
+		index = build_index({**config_data, "index": {**config_data.get("index", {}), "enabled": True}})
+		indexed, unrecognised = index.scan(args.directories or [config_data["destination"]], args.threads)
+		print(f"[INDEX] {indexed} files indexed, {unrecognised} not recognised, {index.count()} episodes in the index")
+		index.close()
+		return 0
+
+	if args.action == "config" and args.check:
+		from .check import check
+		return check(args.config_files)
+
+	if args.action in ("config", "resume", "sync", "retry", "coordinate", "work", "serve"):
+		from .manifest import load_manifest
+
+		config_data, warnings = load_manifest(args.config_files)
+		for path, warning in warnings:
+			print(f"[CONFIG] {path}: {warning}")
+		config_data["refresh"] = args.refresh
+		config_data["yes"] = args.yes
+		config_data["resume"] = args.action == "resume"
+		config_data["sync"] = args.action == "sync"
+		config_data["retry_failed"] = args.action == "retry"
+		config_data["coordinate"] = args.action == "coordinate"
+		config_data["work"] = args.action == "work"
+		config_data["dry_run"] = args.dry_run
+	else:
+		config_data = {}
+		config_data["username"] = args.username
+		config_data["password"] = args.password
+		config_data["ffmpeg_location"] = args.ffmpeg
+		config_data["destination"] = args.destination
+		config_data["threads"] = args.threads or 5
+		config_data["extract_threads"] = args.extract_threads
+		config_data["download_threads"] = args.download_threads
+		config_data["verbosity"] = args.verbosity
+		config_data["refresh"] = args.refresh
+		config_data["yes"] = args.yes
+		config_data["dry_run"] = args.dry_run
+		if args.action == "series":
+			config_data["download"] = {
+				'series': [{ 	
+					"url": args.url,
+					"selection": {
+						season: args.range for start, end in args.season for season in range(start, end + 1)
+					},
+					"args": yt_dlp_args
+				}]
+			}
+		else:
+			config_data["download"] = {
+				"episodes": [{
+					"url": args.url,
+					"args": yt_dlp_args
+				}]
+			}			
+
+	if args.action in ("coordinate", "work"):
+		options = {"path": args.queue}
+		if args.action == "work":
+			options.update({"worker_id": args.worker_id, "lease": args.lease, "follow": args.follow or None})
+		config_data["queue"] = {
+			**config_data.get("queue", {}), **{key: value for key, value in options.items() if value is not None}
+		}
+	if args.action == "serve":
+		options = {"socket": args.socket, "host": args.host, "port": args.port}
+		config_data["serve"] = {
+			**config_data.get("serve", {}), **{key: value for key, value in options.items() if value is not None}
+		}
+	if args.journal:
+		config_data["journal"] = {**config_data.get("journal", {}), "path": args.journal}
+	if args.fragment_threads:
+		config_data["fragments"] = {**config_data.get("fragments", {}), "threads": args.fragment_threads}
+	if args.progress:
+		config_data["progress"] = {**config_data.get("progress", {}), "format": args.progress}
+	if args.progress_file:
+		config_data["progress"] = {**config_data.get("progress", {}), "file": args.progress_file}
+	if args.engine:
+		config_data["engine"] = args.engine
+	if args.concurrency:
+		config_data["concurrency"] = args.concurrency
+	if args.autoscale:
+		config_data["autoscale"] = {
+			**config_data.get("autoscale", {}), "enabled": True,
+			"min_workers": args.autoscale[0], "max_workers": args.autoscale[1]
+		}
+	if args.subs is not None:
+		config_data["subtitles"] = args.subs
+	if args.audio is not None:
+		config_data["audio"] = args.audio
+	if args.staging:
+		config_data["staging"] = {**config_data.get("staging", {}), "path": args.staging}
+	if args.mux_workers is not None:
+		config_data["postprocess"] = {**config_data.get("postprocess", {}), "workers": args.mux_workers}
+	if args.trace or args.trace_file:
+		config_data["trace"] = {**config_data.get("trace", {}), "enabled": True}
+	if args.trace_file:
+		config_data["trace"]["file"] = args.trace_file
+	if args.limit_rate:
+		config_data["bandwidth"] = {**config_data.get("bandwidth", {}), "limit": args.limit_rate}
+	if args.max_fragments:
+		config_data["fragments"] = {**config_data.get("fragments", {}), "in_flight": args.max_fragments}
+	if args.action == "resume" and args.list:
+		import yaml
+		from .main import build_journal
+
+		journal = build_journal(config_data)
+		print(yaml.dump({"history": journal.history() if journal else []}, sort_keys=False))
+		return 0
+	if args.action == "coordinate" and args.status:
+		from .main import build_queue, report_queue
+
+		queue = build_queue(config_data)
+		report_queue(queue)
+		queue.close()
+		return 0
+	if args.action == "retry" and args.list:
+		from .main import build_dead_letters, report_failures
+
+		dead_letters = build_dead_letters(config_data)
+		report_failures(dead_letters, dead_letters.report())
+		return 0
+
+	if args.action == "serve":
+		from .main import serve
+
+		serve(config_data)
+		return 0
+
+	from .main import session
+
+	session(config_data)
+	return 0
+
+if __name__ == "__main__":
+	raise SystemExit(main())
@@ -0,0 +1,383 @@
+from __future__ import annotations
+import collections
+import concurrent.futures
+import http.server
+import json
+import os
+import queue
+import re
+import socketserver
+import threading
+import uuid
+from time import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import IO
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from .progress import TERMINAL_STATES
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+JOB_STATES = ("queued", "resolving", "downloading", "done", "failed", "cancelled")
+FINISHED = ("done", "failed", "cancelled")
+EVENT_BACKLOG = 1000
+
+Resolver = Callable[[Dict[str, Any], Any], Tuple[List[Dict[str, Any]], Any]]
+
+class Job:
+	"""
+	One submitted series or episode entry and the state of every episode it resolved to.
+	"""
+	def __init__(self, kind: str, entry: Dict[str, Any]) -> None:
+		self.id = uuid.uuid4().hex[:12]
+		self.kind = kind
+		self.entry = entry
+		self.state = "queued"
+		self.episodes = {}
+		self.error = None
+		self.submitted = time()
+		self.finished = None
+
+	def as_dict(self) -> Dict[str, Any]:
+		return {
+			"id": self.id, "kind": self.kind, "url": self.entry["url"], "state": self.state,
+			"episodes": dict(self.episodes), "error": self.error,
+			"submitted": self.submitted, "finished": self.finished,
+		}
+
+class EventStream:
+	"""
+	File-like fan-out of JSON lines to every client following `/events`. Each client has a
+	bounded backlog and misses events it is too slow to read, it never holds up a download.
+	The progress aggregator writes its `json` output here.
+	"""
+	def __init__(self, backlog: int = EVENT_BACKLOG) -> None:
+		self.backlog = backlog
+		self.dropped = 0
+		self._subscribers = set()
+		self._lock = threading.Lock()
+
+	def subscribe(self) -> queue.Queue:
+		subscriber = queue.Queue(self.backlog)
+		with self._lock:
+			self._subscribers.add(subscriber)
+		return subscriber
+
+	def unsubscribe(self, subscriber: queue.Queue) -> None:
+		with self._lock:
+			self._subscribers.discard(subscriber)
+
+	def publish(self, line: Optional[str]) -> None:
+		with self._lock:
+			subscribers = list(self._subscribers)
+		for subscriber in subscribers:
+			try:
+				subscriber.put_nowait(line)
+			except queue.Full:
+				self.dropped += 1
+
+	def event(self, **fields: Any) -> None:
+		self.publish(json.dumps({"ts": time(), **fields}, default=str))
+
+	def write(self, text: str) -> None:
+		for line in text.splitlines():
+			if line: self.publish(line)
+
+	def flush(self) -> None:
+		pass
+
+	def isatty(self) -> bool:
+		return False
+
+	def close(self) -> None:
+		# None ends every open stream
+		self.publish(None)
+
+class Daemon:
+	"""
+	Runs submitted jobs on extraction and download pools that live as long as the process,
+	with one `downloader` whose logged-in session and per-thread yt-dlp instances stay warm
+	between jobs. A submitted job is handed to the extraction pool straight away.
+
+	`downloader` is a main.Downloader (download, cancel, prioritise); it reports each
+	finished episode back through `finished`. `resolvers` maps "series" and "episode" to
+	the extractor of that kind of entry, `on_queued(entry, args)` records a resolved episode
+	and `done(episode_id)` tells which ones are already downloaded.
+	"""
+	def __init__(
+		self, downloader: Any, resolvers: Dict[str, Resolver], events: Optional[EventStream] = None,
+		extract_workers: int = 5, download_workers: int = 5,
+		on_queued: Optional[Callable[[Dict[str, Any], Any], None]] = None,
+		done: Optional[Callable[[str], bool]] = None
+	) -> None:
+		self.downloader = downloader
+		self.resolvers = resolvers
+		self.events = events or EventStream()
+		self.on_queued = on_queued
+		self.done = done
+		self.started = time()
+		self.jobs = collections.OrderedDict()
+		self._episodes = {}
+		self._lock = threading.Lock()
+		self._extract = concurrent.futures.ThreadPoolExecutor(extract_workers, thread_name_prefix="extract")
+		self._download = concurrent.futures.ThreadPoolExecutor(download_workers, thread_name_prefix="download")
+
+	def warm(self, login: Callable[[], Any]) -> None:
+		"""
+		Runs `login` on the extraction pool so the first job finds a session ready.
+		"""
+		def run() -> None:
+			try:
+				login()
+			except Exception as error:
+				self.events.event(warning=f"login failed, jobs log in when they start: {error}")
+		self._extract.submit(run)
+
+	def _update(self, job: Job, state: str, error: Optional[str] = None) -> None:
+		with self._lock:
+			if job.state in FINISHED: return
+			job.state = state
+			if error: job.error = error
+			if state in FINISHED: job.finished = time()
+		self.events.event(job=job.id, state=state, **({"error": error} if error else {}))
+
+	def submit(self, kind: str, entry: Dict[str, Any]) -> Job:
+		if kind not in self.resolvers:
+			raise ValueError(f"Unknown job kind {kind}, expected one of {sorted(self.resolvers)}")
+		job = Job(kind, entry)
+		with self._lock:
+			self.jobs[job.id] = job
+		self.events.event(job=job.id, state="queued", kind=kind, url=entry["url"])
+		self._extract.submit(self._resolve, job)
+		return job
+
+	def _resolve(self, job: Job) -> None:
+		if job.state in FINISHED: return
+		self._update(job, "resolving")
+		try:
+			entries, args = self.resolvers[job.kind](job.entry, job.entry.get("args"))
+		except Exception as error:
+			self._update(job, "failed", str(error))
+			return
+		queued = []
+		with self._lock:
+			if job.state in FINISHED: return
+			for entry in entries:
+				episode_id = entry["id"]
+				other = self.jobs.get(self._episodes.get(episode_id))
+				if self.done and self.done(episode_id):
+					job.episodes[episode_id] = "done"
+				elif other is not None and other is not job and other.episodes.get(episode_id) == "queued":
+					# another job is already downloading it
+					job.episodes[episode_id] = "duplicate"
+				else:
+					job.episodes[episode_id] = "queued"
+					self._episodes[episode_id] = job.id
+					# an episode cancelled in an earlier job can be downloaded again
+					self.downloader.cancelled.discard(episode_id)
+					queued.append(entry)
+		for entry in queued:
+			if self.on_queued: self.on_queued(entry, args)
+			self._download.submit(self.downloader.download, entry["url"], args)
+		if queued: self._update(job, "downloading")
+		else: self._settle(job)
+
+	def _settle(self, job: Job) -> None:
+		with self._lock:
+			states = list(job.episodes.values())
+		if any(state not in TERMINAL_STATES + ("duplicate",) for state in states): return
+		if "failed" in states: self._update(job, "failed", f"{states.count('failed')} of {len(states)} episodes failed")
+		elif states and all(state == "cancelled" for state in states): self._update(job, "cancelled")
+		else: self._update(job, "done")
+
+	def finished(self, episode_id: str, ok: bool, error: Optional[str] = None) -> None:
+		with self._lock:
+			job = self.jobs.get(self._episodes.get(episode_id))
+			if job is None or job.episodes.get(episode_id) not in ("queued",): return
+			cancelled = not ok and episode_id in self.downloader.cancelled
+			job.episodes[episode_id] = "cancelled" if cancelled else "done" if ok else "failed"
+		self.events.event(job=job.id, episode=episode_id, state=job.episodes[episode_id], **({"error": error} if error else {}))
+		self._settle(job)
+
+	def cancel(self, job_id: str) -> Job:
+		"""
+		Cancels a job: queued episodes never start and downloading ones stop at their next
+		progress update.
+		"""
+		with self._lock:
+			job = self.jobs[job_id]
+			unfinished = [episode_id for episode_id, state in job.episodes.items() if state == "queued"]
+		for episode_id in unfinished:
+			self.downloader.cancel(episode_id)
+		if not unfinished: self._update(job, "cancelled")
+		return job
+
+	def list(self) -> List[Dict[str, Any]]:
+		with self._lock:
+			return [job.as_dict() for job in self.jobs.values()]
+
+	def job(self, job_id: str) -> Dict[str, Any]:
+		with self._lock:
+			return self.jobs[job_id].as_dict()
+
+	def status(self) -> Dict[str, Any]:
+		with self._lock:
+			states = collections.Counter(job.state for job in self.jobs.values())
+			episodes = collections.Counter(state for job in self.jobs.values() for state in job.episodes.values())
+		return {
+			"pid": os.getpid(), "uptime": time() - self.started,
+			"jobs": {state: states.get(state, 0) for state in JOB_STATES},
+			"episodes": dict(episodes), "dropped_events": self.events.dropped,
+		}
+
+	def close(self) -> None:
+		"""
+		Stops taking work, cancels what has not finished and waits for the pools to wind down.
+		"""
+		with self._lock:
+			unfinished = [job.id for job in self.jobs.values() if job.state not in FINISHED]
+		for job_id in unfinished:
+			self.cancel(job_id)
+		self._extract.shutdown(wait=True, cancel_futures=True)
+		self._download.shutdown(wait=True)
+		self.events.close()
+
+class Handler(http.server.BaseHTTPRequestHandler):
+	"""
+	JSON API of the daemon:
+	  POST /jobs            submit {"url": ..., any series or episode config field}
+	  GET /jobs             every job
+	  GET /jobs/<id>        one job
+	  DELETE /jobs/<id>     cancel a job
+	  GET /status           job and episode counts
+	  GET /events           JSON lines of job and progress events until the client disconnects
+	"""
+	server_version = "crunchy_dl"
+	protocol_version = "HTTP/1.1"
+	JOB_PATH = re.compile(r"/jobs/(\w+)$")
+
+	@property
+	def daemon(self) -> Daemon:
+		return self.server.daemon
+
+	def address_string(self) -> str:
+		# Unix socket clients have no address
+		return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+	def log_message(self, format: str, *args: Any) -> None:
+		if self.server.log: self.server.log(f"[SERVE] {self.address_string()} {format % args}")
+
+	def reply(self, status: int, body: Any) -> None:
+		data = json.dumps(body, default=str).encode("utf-8")
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def read_json(self) -> Any:
+		length = int(self.headers.get("Content-Length") or 0)
+		return json.loads(self.rfile.read(length) or b"{}")
+
+	def do_GET(self) -> None:
+		match = self.JOB_PATH.match(self.path)
+		if self.path == "/jobs":
+			self.reply(200, self.daemon.list())
+		elif match:
+			try:
+				self.reply(200, self.daemon.job(match.group(1)))
+			except KeyError:
+				self.reply(404, {"error": f"No job {match.group(1)}"})
+		elif self.path == "/status":
+			self.reply(200, self.daemon.status())
+		elif self.path == "/events":
+			self.stream()
+		else:
+			self.reply(404, {"error": f"No such endpoint {self.path}"})
+
+	def do_POST(self) -> None:
+		if self.path != "/jobs":
+			self.reply(404, {"error": f"No such endpoint {self.path}"})
+			return
+		try:
+			kind, entry = self.server.parse(self.read_json())
+			job = self.daemon.submit(kind, entry)
+		except (ValueError, TypeError, KeyError) as error:
+			self.reply(400, {"error": str(error)})
+			return
+		self.reply(201, job.as_dict())
+
+	def do_DELETE(self) -> None:
+		match = self.JOB_PATH.match(self.path)
+		if not match:
+			self.reply(404, {"error": f"No such endpoint {self.path}"})
+			return
+		try:
+			job = self.daemon.cancel(match.group(1))
+		except KeyError:
+			self.reply(404, {"error": f"No job {match.group(1)}"})
+			return
+		self.reply(200, job.as_dict())
+
+	def stream(self) -> None:
+		subscriber = self.daemon.events.subscribe()
+		self.send_response(200)
+		self.send_header("Content-Type", "application/x-ndjson")
+		self.send_header("Connection", "close")
+		self.end_headers()
+		self.close_connection = True
+		try:
+			self.wfile.write((json.dumps({"ts": time(), "status": self.daemon.status()}) + "\n").encode("utf-8"))
+			self.wfile.flush()
+			for line in iter(subscriber.get, None):
+				self.wfile.write((line + "\n").encode("utf-8"))
+				self.wfile.flush()
+		except OSError:
+			pass # the client went away
+		finally:
+			self.daemon.events.unsubscribe(subscriber)
+
+class APIServer(socketserver.ThreadingMixIn):
+	daemon_threads = True
+
+	def setup_api(self, daemon: Daemon, parse: Callable[[Any], Tuple[str, Dict[str, Any]]], log: Optional[Callable[[str], None]]) -> None:
+		self.daemon = daemon
+		self.parse = parse
+		self.log = log
+
+class TCPServer(APIServer, http.server.HTTPServer):
+	pass
+
+class UnixServer(APIServer, socketserver.UnixStreamServer):
+	def server_bind(self) -> None:
+		if os.path.exists(self.server_address): os.unlink(self.server_address)
+		super().server_bind()
+		# the API starts downloads with the daemon's account, only its user may connect
+		os.chmod(self.server_address, 0o600)
+
+	def server_close(self) -> None:
+		super().server_close()
+		if os.path.exists(self.server_address): os.unlink(self.server_address)
+
+def build_server(
+	daemon: Daemon, parse: Callable[[Any], Tuple[str, Dict[str, Any]]], socket_path: Optional[str] = None,
+	host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, log: Optional[Callable[[str], None]] = None
+) -> APIServer:
+	"""
+	The API on a Unix socket when `socket_path` is given, otherwise on `host`:`port`.
+	"""
+	server = UnixServer(socket_path, Handler) if socket_path else TCPServer((host, port), Handler)
+	server.setup_api(daemon, parse, log)
+	return server
+
+def events(stream: IO[bytes]) -> Iterator[Dict[str, Any]]:
+	"""
+	Decoded events of an `/events` response.
+	"""
+	for line in stream:
+		if line.strip(): yield json.loads(line)
@@ -0,0 +1,113 @@
+from __future__ import annotations
+import concurrent.futures
+import threading
+from collections import deque
+from time import sleep
+from typing import Callable
+from typing import Iterable
+from typing import List
+from typing import Optional
+from urllib.parse import urljoin
+
+from .retry import UNAVAILABLE, backoff_delay, classify
+
+UNSUPPORTED_HLS_TAGS = ("#EXT-X-STREAM-INF", "#EXT-X-BYTERANGE", "#EXT-X-MAP", "#EXT-X-FAXS-CM")
+
+def parse_m3u8(manifest: str, base_url: str) -> Optional[List[str]]:
+	"""
+	Lists the fragment urls of a plain HLS media playlist.
+	:returns: list or None -- None when the playlist needs features only yt-dlp's own downloader handles
+	"""
+	if not manifest.startswith("#EXTM3U"): return None
+	urls = []
+	for line in manifest.splitlines():
+		line = line.strip()
+		if not line: continue
+		if line.startswith(UNSUPPORTED_HLS_TAGS): return None
+		if line.startswith("#EXT-X-KEY") and "METHOD=NONE" not in line: return None
+		if line.startswith("#"): continue
+		urls.append(urljoin(base_url, line))
+	return urls
+
+class FragmentError(Exception):
+	pass
+
+class FragmentPool:
+	"""
+	Fetches media fragments on a worker pool shared by every episode.
+	`max_in_flight` caps the fragments being fetched across all episodes and `window`
+	caps how many fetched fragments one episode may hold before writing them in order.
+	"""
+	def __init__(
+		self, workers: int = 8, max_in_flight: int = 16, retries: int = 3,
+		backoff: float = 0.5, window: Optional[int] = None
+	) -> None:
+		self.workers = workers
+		self.max_in_flight = max_in_flight
+		self.retries = retries
+		self.backoff = backoff
+		self.window = window or max_in_flight
+		self.in_flight = 0
+		self.peak_in_flight = 0
+		self._executor = concurrent.futures.ThreadPoolExecutor(max_workers = workers, thread_name_prefix = "fragment")
+		self._slots = threading.BoundedSemaphore(max_in_flight)
+		self._lock = threading.Lock()
+
+	def _fetch(self, fetch: Callable[[str], bytes], url: str) -> bytes:
+		try:
+			for attempt in range(self.retries + 1):
+				try:
+					return fetch(url)
+				except Exception as error:
+					# a missing fragment stays missing, only transient errors are worth another request
+					if attempt == self.retries or classify(error) == UNAVAILABLE:
+						raise FragmentError(f"Fragment {url} failed after {attempt + 1} attempts: {error}") from error
+					sleep(backoff_delay(attempt, self.backoff))
+		finally:
+			with self._lock: self.in_flight -= 1
+			self._slots.release()
+
+	def _submit(self, fetch: Callable[[str], bytes], url: str) -> concurrent.futures.Future:
+		self._slots.acquire()
+		with self._lock:
+			self.in_flight += 1
+			self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+		return self._executor.submit(self._fetch, fetch, url)
+
+	def _cancel(self, futures: Iterable[concurrent.futures.Future]) -> None:
+		for future in futures:
+			if future.cancel():
+				with self._lock: self.in_flight -= 1
+				self._slots.release()
+
+	def download(
+		self, urls: List[str], filename: str, fetch: Callable[[str], bytes],
+		on_fragment: Optional[Callable[[int, int], None]] = None
+	) -> int:
+		pending = deque()
+		written = 0
+		index = 0
+
+		def write_head(f) -> None:
+			nonlocal written, index
+			data = pending.popleft().result()
+			f.write(data)
+			written += len(data)
+			index += 1
+			if on_fragment: on_fragment(index, len(data))
+
+		with open(filename, "wb") as f:
+			try:
+				for url in urls:
+					while len(pending) >= self.window or (pending and pending[0].done()):
+						write_head(f)
+					pending.append(self._submit(fetch, url))
+				while pending:
+					write_head(f)
+			except BaseException:
+				self._cancel(pending)
+				raise
+		return written
+
+	def close(self) -> None:
+		self._executor.shutdown(wait=True)
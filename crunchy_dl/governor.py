@@ -0,0 +1,100 @@
+from __future__ import annotations
+import heapq
+import re
+import threading
+from collections import deque
+from itertools import count
+from time import monotonic
+from typing import Optional
+from typing import Union
+
+RATE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+def parse_rate(rate: Union[str, int, float]) -> float:
+	if isinstance(rate, (int, float)):
+		value = float(rate)
+	else:
+		match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?(?:/s)?\s*$", rate, re.IGNORECASE)
+		if not match:
+			raise ValueError(f"Expected a rate like 500K or 2.5M, received {rate}")
+		value = float(match.group(1)) * RATE_UNITS[match.group(2).upper()]
+	if value <= 0:
+		raise ValueError(f"Expected a positive rate, received {rate}")
+	return value
+
+class BandwidthGovernor:
+	"""
+	Process wide token bucket shared by every download worker and fragment fetch.
+	Waiting consumers are served in weighted fair order: each flow (a series) is
+	charged bytes / weight of virtual time, so a flow with weight 2 gets twice the share
+	of a contended link. With no `rate` it only accounts bytes.
+	"""
+	def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None, window: float = 5.0) -> None:
+		self.rate = rate
+		self.burst = burst or rate or 0
+		self.window = window
+		self.total_bytes = 0
+		self._tokens = self.burst
+		self._stamp = monotonic()
+		self._cond = threading.Condition()
+		self._waiting = []
+		self._finish = {}
+		self._virtual_time = 0.0
+		self._tickets = count()
+		self._samples = deque()
+
+	def _refill(self, now: float) -> None:
+		self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+		self._stamp = now
+
+	def _account(self, size: int, now: float) -> None:
+		self.total_bytes += size
+		self._samples.append((now, size))
+		while self._samples and self._samples[0][0] < now - self.window:
+			self._samples.popleft()
+
+	def consume(self, size: int, flow: str = "default", weight: float = 1.0) -> None:
+		with self._cond:
+			if not self.rate:
+				self._account(size, monotonic())
+				return
+			tag = max(self._virtual_time, self._finish.get(flow, 0.0)) + size / max(weight, 1e-6)
+			self._finish[flow] = tag
+			ticket = (tag, next(self._tickets))
+			heapq.heappush(self._waiting, ticket)
+			while True:
+				now = monotonic()
+				if not self.rate:
+					self._waiting.remove(ticket)
+					heapq.heapify(self._waiting)
+					self._account(size, now)
+					self._cond.notify_all()
+					return
+				self._refill(now)
+				if self._waiting[0] == ticket:
+					# sizes above the burst run the bucket into debt instead of waiting forever
+					needed = min(size, self.burst)
+					if self._tokens >= needed:
+						heapq.heappop(self._waiting)
+						self._tokens -= size
+						self._virtual_time = tag
+						self._account(size, now)
+						self._cond.notify_all()
+						return
+					self._cond.wait((needed - self._tokens) / self.rate)
+				else:
+					self._cond.wait()
+
+	def bytes_per_second(self) -> float:
+		with self._cond:
+			now = monotonic()
+			while self._samples and self._samples[0][0] < now - self.window:
+				self._samples.popleft()
+			return sum(size for _, size in self._samples) / self.window
+
+	def set_rate(self, rate: Optional[float], burst: Optional[float] = None) -> None:
+		with self._cond:
+			self.rate = rate
+			self.burst = burst or rate or 0
+			self._tokens = min(self._tokens, self.burst)
+			self._cond.notify_all()
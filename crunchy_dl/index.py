@@ -0,0 +1,162 @@
+from __future__ import annotations
+import concurrent.futures
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from time import time
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "crunchy_dl", "index.sqlite3")
+MEDIA_EXTS = (".mp4", ".mkv", ".webm", ".mov", ".m4a", ".mka", ".ts", ".flv")
+# yt-dlp's default output template ends in " [<id>].<ext>"
+FILENAME_ID = re.compile(r"\[(\w+)\]\.\w+$")
+SAMPLE_SIZE = 1024 * 1024
+BATCH_SIZE = 500
+
+def file_hash(path: str, size: Optional[int] = None) -> str:
+	"""
+	SHA-256 of the file size and three samples (start, middle and end) instead of
+	the whole file, so scanning a library of multi-GB episodes stays I/O light.
+	"""
+	size = os.path.getsize(path) if size is None else size
+	digest = hashlib.sha256(str(size).encode())
+	with open(path, "rb") as f:
+		for offset in sorted({0, max(0, size // 2 - SAMPLE_SIZE // 2), max(0, size - SAMPLE_SIZE)}):
+			f.seek(offset)
+			digest.update(f.read(SAMPLE_SIZE))
+	return digest.hexdigest()
+
+def walk(directory: str) -> Iterator[os.DirEntry]:
+	stack = [directory]
+	while stack:
+		try:
+			with os.scandir(stack.pop()) as entries:
+				for entry in entries:
+					if entry.is_dir(follow_symlinks=False): stack.append(entry.path)
+					elif entry.name.lower().endswith(MEDIA_EXTS): yield entry
+		except OSError:
+			continue
+
+class DownloadIndex:
+	"""
+	SQLite map of episode id to the downloaded file's path, size and sampled hash.
+	Finished downloads are added as they complete and `scan` rebuilds the index from
+	library directories, recognising renamed files by their hash.
+	"""
+	def __init__(self, path: str = DEFAULT_INDEX_PATH) -> None:
+		if path != ":memory:":
+			os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		self.path = path
+		self.hits = 0
+		self._lock = threading.Lock()
+		self._db = sqlite3.connect(path, check_same_thread=False)
+		self._db.execute(
+			"CREATE TABLE IF NOT EXISTS files ("
+			"episode_id TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, "
+			"hash TEXT NOT NULL, mtime REAL NOT NULL, indexed REAL NOT NULL)"
+		)
+		self._db.execute("CREATE INDEX IF NOT EXISTS files_hash ON files (hash)")
+		self._db.execute("CREATE INDEX IF NOT EXISTS files_path ON files (path)")
+		self._db.commit()
+
+	def count(self) -> int:
+		with self._lock:
+			return self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+	def _row(self, episode_id: str, path: str) -> Tuple[str, str, int, str, float, float]:
+		stat = os.stat(path)
+		return (episode_id, os.path.abspath(path), stat.st_size, file_hash(path, stat.st_size), stat.st_mtime, time())
+
+	def _store(self, rows: Iterable[Tuple[str, str, int, str, float, float]]) -> None:
+		with self._lock:
+			self._db.executemany(
+				"INSERT OR REPLACE INTO files (episode_id, path, size, hash, mtime, indexed) VALUES (?, ?, ?, ?, ?, ?)",
+				rows
+			)
+			self._db.commit()
+
+	def add(self, episode_id: str, path: str) -> None:
+		self._store([self._row(episode_id, path)])
+
+	def lookup(self, episode_id: str, verify: bool = True) -> Optional[Dict[str, Any]]:
+		"""
+		Indexed file of `episode_id`. With `verify` the file must still exist with the
+		same size, stale rows are dropped.
+		"""
+		with self._lock:
+			row = self._db.execute(
+				"SELECT path, size, hash FROM files WHERE episode_id = ?", (episode_id,)
+			).fetchone()
+		if row is None: return None
+		path, size, digest = row
+		if verify:
+			try:
+				stale = os.stat(path).st_size != size
+			except OSError:
+				stale = True
+			if stale:
+				with self._lock:
+					self._db.execute("DELETE FROM files WHERE episode_id = ? AND path = ?", (episode_id, path))
+					self._db.commit()
+				return None
+		return {"episode_id": episode_id, "path": path, "size": size, "hash": digest}
+
+	def has(self, episode_id: str) -> bool:
+		found = self.lookup(episode_id) is not None
+		if found:
+			with self._lock: self.hits += 1
+		return found
+
+	def scan(self, directories: Iterable[str], workers: Optional[int] = None) -> Tuple[int, int]:
+		"""
+		Walks `directories` and hashes their media files on `workers` threads. Files whose
+		path, size and mtime are already indexed are not read again; files without an id
+		in their name are matched to an episode by hash.
+		:returns: tuple -- Files (indexed, unrecognised)
+		"""
+		with self._lock:
+			known = {
+				path: (episode_id, size, mtime) for episode_id, path, size, mtime in
+				self._db.execute("SELECT episode_id, path, size, mtime FROM files").fetchall()
+			}
+			by_hash = dict(self._db.execute("SELECT hash, episode_id FROM files").fetchall())
+
+		def index(entry: os.DirEntry) -> Optional[Tuple[str, str, int, str, float, float]]:
+			path = os.path.abspath(entry.path)
+			stat = entry.stat()
+			previous = known.get(path)
+			if previous and previous[1:] == (stat.st_size, stat.st_mtime): return None
+			digest = file_hash(path, stat.st_size)
+			match = FILENAME_ID.search(entry.name)
+			episode_id = match.group(1) if match else by_hash.get(digest)
+			if episode_id is None: return ("", path, stat.st_size, digest, stat.st_mtime, time())
+			return (episode_id, path, stat.st_size, digest, stat.st_mtime, time())
+
+		indexed = unrecognised = 0
+		batch = []
+		with concurrent.futures.ThreadPoolExecutor(max_workers = workers or min(32, (os.cpu_count() or 1) * 4)) as executor:
+			files = (entry for directory in directories for entry in walk(directory))
+			for row in executor.map(index, files):
+				if row is None:
+					indexed += 1
+					continue
+				if not row[0]:
+					unrecognised += 1
+					continue
+				batch.append(row)
+				indexed += 1
+				if len(batch) >= BATCH_SIZE:
+					self._store(batch)
+					batch = []
+		self._store(batch)
+		return (indexed, unrecognised)
+
+	def close(self) -> None:
+		self._db.close()
@@ -0,0 +1,307 @@
+from __future__ import annotations
+import contextlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+from time import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from .journal import JOURNAL_FIELDS
+
+DEFAULT_QUEUE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "crunchy_dl", "queue.sqlite3")
+STATES = ("queued", "leased", "done", "failed")
+# what a worker needs to download and report a job, on top of the journal fields
+JOB_FIELDS = JOURNAL_FIELDS + ("series_id", "priority", "source")
+DEFAULT_LEASE = 60.0
+DEFAULT_POLL = 5.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+def worker_name() -> str:
+	return f"{socket.gethostname()}:{os.getpid()}"
+
+class JobQueue:
+	"""
+	Per-episode download jobs in one SQLite file that every node can open, e.g. on the NAS
+	the downloads go to. A worker claims a job with a lease that it renews while it works;
+	a job whose lease runs out (its worker died or lost the share) is handed to the next
+	worker that asks, and fails for good after `max_attempts` leases.
+	Each claim is one `BEGIN IMMEDIATE` transaction, so SQLite's file lock makes sure only
+	one worker gets a job. The default rollback journal is kept because WAL does not work
+	over network filesystems. Leases use wall-clock time: keep them far longer than the
+	clock skew between hosts.
+	"""
+	def __init__(self, path: str = DEFAULT_QUEUE_PATH, max_attempts: int = DEFAULT_MAX_ATTEMPTS, timeout: float = 30.0) -> None:
+		if path != ":memory:":
+			os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		self.path = path
+		self.max_attempts = max_attempts
+		self.reclaimed = 0
+		self._lock = threading.Lock()
+		self._db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+		with self._transaction():
+			self._db.execute(
+				"CREATE TABLE IF NOT EXISTS jobs ("
+				"seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, entry TEXT NOT NULL, "
+				"args TEXT NOT NULL, priority REAL NOT NULL, state TEXT NOT NULL, worker TEXT, "
+				"lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, error TEXT, updated REAL NOT NULL)"
+			)
+			self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, priority, seq)")
+
+	@contextlib.contextmanager
+	def _transaction(self) -> Iterator[sqlite3.Connection]:
+		with self._lock:
+			# take the write lock up front, two workers must not read the same free job
+			self._db.execute("BEGIN IMMEDIATE")
+			try:
+				yield self._db
+			except BaseException:
+				self._db.execute("ROLLBACK")
+				raise
+			self._db.execute("COMMIT")
+
+	def put(self, jobs: Iterable[Tuple[Dict[str, Any], Optional[List[Any]]]]) -> int:
+		"""
+		Adds resolved episodes. An episode already queued, leased or done is left alone and a
+		failed one is queued again, so the coordinator can be re-run with the same configs.
+		:returns: int -- Jobs added or re-queued
+		"""
+		now = time()
+		rows = [
+			(
+				entry["id"], json.dumps({field: entry.get(field) for field in JOB_FIELDS}, default=str),
+				json.dumps(args or [], default=str), entry.get("priority") or 1, now
+			)
+			for entry, args in jobs
+		]
+		with self._transaction() as db:
+			before = db.total_changes
+			db.executemany(
+				"INSERT INTO jobs (id, entry, args, priority, state, updated) VALUES (?, ?, ?, ?, 'queued', ?) "
+				"ON CONFLICT (id) DO UPDATE SET state = 'queued', entry = excluded.entry, args = excluded.args, "
+				"priority = excluded.priority, worker = NULL, lease_until = NULL, attempts = 0, error = NULL, "
+				"updated = excluded.updated WHERE jobs.state = 'failed'",
+				rows
+			)
+			return db.total_changes - before
+
+	def claim(self, worker: str, lease: float = DEFAULT_LEASE) -> Optional[Tuple[Dict[str, Any], List[Any]]]:
+		"""
+		Leases the next job to `worker` for `lease` seconds: the highest priority queued job,
+		or one whose lease has expired.
+		:returns: tuple -- (entry, args), or None when no job is free
+		"""
+		now = time()
+		with self._transaction() as db:
+			db.execute(
+				"UPDATE jobs SET state = 'failed', worker = NULL, lease_until = NULL, updated = ?, "
+				"error = 'lease expired ' || attempts || ' times' "
+				"WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+				(now, now, self.max_attempts)
+			)
+			row = db.execute(
+				"SELECT seq, state, entry, args FROM jobs "
+				"WHERE state = 'queued' OR (state = 'leased' AND lease_until < ?) "
+				"ORDER BY priority DESC, seq LIMIT 1",
+				(now,)
+			).fetchone()
+			if row is None: return None
+			seq, state, entry, args = row
+			db.execute(
+				"UPDATE jobs SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? "
+				"WHERE seq = ?",
+				(worker, now + lease, now, seq)
+			)
+		if state == "leased": self.reclaimed += 1
+		return json.loads(entry), json.loads(args)
+
+	def heartbeat(self, worker: str, ids: Iterable[str], lease: float = DEFAULT_LEASE) -> Set[str]:
+		"""
+		Extends the leases `worker` holds on `ids`.
+		:returns: set -- The ids still leased to `worker`; any other was taken over after its lease ran out
+		"""
+		ids = list(ids)
+		if not ids: return set()
+		now = time()
+		marks = ", ".join("?" * len(ids))
+		with self._transaction() as db:
+			db.execute(
+				f"UPDATE jobs SET lease_until = ?, updated = ? WHERE worker = ? AND state = 'leased' AND id IN ({marks})",
+				(now + lease, now, worker, *ids)
+			)
+			return {
+				row[0] for row in
+				db.execute(f"SELECT id FROM jobs WHERE worker = ? AND state = 'leased' AND id IN ({marks})", (worker, *ids))
+			}
+
+	def _finish(self, episode_id: str, worker: str, state: str, error: Optional[str]) -> bool:
+		with self._transaction() as db:
+			cursor = db.execute(
+				"UPDATE jobs SET state = ?, error = ?, worker = NULL, lease_until = NULL, updated = ? "
+				"WHERE id = ? AND worker = ? AND state = 'leased'",
+				(state, error, time(), episode_id, worker)
+			)
+			return cursor.rowcount == 1
+
+	def complete(self, episode_id: str, worker: str) -> bool:
+		"""
+		:returns: bool -- False when the lease had already passed to another worker
+		"""
+		return self._finish(episode_id, worker, "done", None)
+
+	def fail(self, episode_id: str, worker: str, error: Optional[str] = None) -> bool:
+		return self._finish(episode_id, worker, "failed", error)
+
+	def release(self, worker: str, ids: Iterable[str]) -> None:
+		"""
+		Hands unfinished jobs back without waiting for their leases to run out.
+		"""
+		ids = list(ids)
+		if not ids: return
+		with self._transaction() as db:
+			db.execute(
+				"UPDATE jobs SET state = 'queued', worker = NULL, lease_until = NULL, attempts = MAX(attempts - 1, 0), "
+				f"updated = ? WHERE worker = ? AND state = 'leased' AND id IN ({', '.join('?' * len(ids))})",
+				(time(), worker, *ids)
+			)
+
+	def counts(self) -> Dict[str, int]:
+		with self._lock:
+			counts = dict(self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+		return {state: counts.get(state, 0) for state in STATES}
+
+	def active(self) -> bool:
+		"""
+		Whether any job is still queued or being worked on.
+		"""
+		counts = self.counts()
+		return bool(counts["queued"] or counts["leased"])
+
+	def jobs(self, states: Iterable[str] = ("leased", "failed")) -> List[Dict[str, Any]]:
+		states = list(states)
+		with self._lock:
+			rows = self._db.execute(
+				"SELECT id, entry, state, worker, lease_until, attempts, error FROM jobs "
+				f"WHERE state IN ({', '.join('?' * len(states))}) ORDER BY seq",
+				states
+			).fetchall()
+		return [
+			{
+				"id": episode_id, "entry": json.loads(entry), "state": state, "worker": worker,
+				"lease_until": lease_until, "attempts": attempts, "error": error
+			}
+			for episode_id, entry, state, worker, lease_until, attempts, error in rows
+		]
+
+	def close(self) -> None:
+		self._db.close()
+
+class Worker:
+	"""
+	One node's side of the queue. `claims` leases a job only when one of the `capacity`
+	download slots is free, so a node never holds more leases than it is working on; a
+	heartbeat thread renews them every `heartbeat` seconds. `finished` is called with each
+	episode's outcome. Without `follow`, `claims` ends once no job is queued or leased by
+	anyone: a lease held by another node may still run out and need taking over.
+	"""
+	def __init__(
+		self, queue: JobQueue, worker_id: Optional[str] = None, capacity: int = 5,
+		lease: float = DEFAULT_LEASE, heartbeat: Optional[float] = None, poll: float = DEFAULT_POLL,
+		follow: bool = False, log: Optional[Callable[[str], None]] = None
+	) -> None:
+		self.queue = queue
+		self.worker_id = worker_id or worker_name()
+		self.capacity = capacity
+		self.lease = lease
+		self.heartbeat = heartbeat or lease / 3
+		self.poll = poll
+		self.follow = follow
+		self.log = log
+		self.held = set()
+		self.claimed = 0
+		self.completed = 0
+		self.failed = 0
+		self.lost = 0
+		self._condition = threading.Condition()
+		self._stop = threading.Event()
+		self._thread = None
+
+	def start(self) -> None:
+		self._thread = threading.Thread(target=self._beat, name="queue-heartbeat", daemon=True)
+		self._thread.start()
+
+	def _beat(self) -> None:
+		while not self._stop.wait(self.heartbeat):
+			with self._condition:
+				held = set(self.held)
+			if not held: continue
+			try:
+				lost = held - self.queue.heartbeat(self.worker_id, held, self.lease)
+			except sqlite3.Error as error:
+				# a busy or briefly unreachable share; the lease has some time left
+				if self.log: self.log(f"[QUEUE] Heartbeat failed, retrying in {self.heartbeat:.0f}s: {error}")
+				continue
+			if not lost: continue
+			with self._condition:
+				self.held -= lost
+				self.lost += len(lost)
+				self._condition.notify_all()
+			if self.log: self.log(f"[QUEUE] Lease lost on {', '.join(sorted(lost))}, another worker took it over")
+
+	def claims(self, done: Optional[Callable[[str], bool]] = None) -> Iterator[Tuple[Dict[str, Any], List[Any]]]:
+		"""
+		Leased jobs as download slots free up. Jobs `done` reports as already downloaded
+		on this node are completed straight away.
+		"""
+		while True:
+			with self._condition:
+				self._condition.wait_for(lambda: len(self.held) < self.capacity)
+			job = self.queue.claim(self.worker_id, self.lease)
+			if job is None:
+				if not self.follow and not self.queue.active(): return
+				with self._condition:
+					# woken early when one of this node's jobs finishes
+					self._condition.wait(self.poll)
+				continue
+			entry, args = job
+			if done and done(entry["id"]):
+				self.queue.complete(entry["id"], self.worker_id)
+				continue
+			with self._condition:
+				self.held.add(entry["id"])
+				self.claimed += 1
+			yield entry, args
+
+	def finished(self, episode_id: str, ok: bool, error: Optional[str] = None) -> None:
+		with self._condition:
+			if episode_id not in self.held: return
+			self.held.discard(episode_id)
+			if ok: self.completed += 1
+			else: self.failed += 1
+			self._condition.notify_all()
+		if ok: self.queue.complete(episode_id, self.worker_id)
+		else: self.queue.fail(episode_id, self.worker_id, error)
+
+	def close(self) -> None:
+		self._stop.set()
+		if self._thread: self._thread.join()
+		with self._condition:
+			held, self.held = set(self.held), set()
+		self.queue.release(self.worker_id, held)
+
+	def report(self) -> str:
+		counts = self.queue.counts()
+		return (
+			f"[QUEUE] {self.worker_id}: {self.completed} done, {self.failed} failed, {self.lost} leases lost, "
+			f"{self.queue.reclaimed} expired leases taken over; queue has "
+			+ ", ".join(f"{count} {state}" for state, count in counts.items())
+		)
@@ -0,0 +1,128 @@
+from __future__ import annotations
+import json
+import os
+import threading
+from datetime import date
+from time import monotonic
+from time import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".cache", "crunchy_dl", "journal.jsonl")
+STATES = ("resolved", "downloading", "muxing", "done", "failed")
+UNFINISHED = ("resolved", "downloading", "muxing", "failed")
+JOURNAL_FIELDS = ("id", "url", "title", "season_number", "episode_number")
+
+class Journal:
+	"""
+	Append-only JSON lines log of per-episode download state.
+	The whole file is replayed into an in-memory index on open, so finished episodes
+	are skipped with a dict lookup and `pending` needs no re-extraction.
+	Writes are flushed immediately and fsync'd at most once every `sync_interval` seconds.
+	"""
+	def __init__(self, path: str = DEFAULT_JOURNAL_PATH, sync_interval: float = 1.0) -> None:
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		self.path = path
+		self.sync_interval = sync_interval
+		self.states = {}
+		self.entries = {}
+		self.runs = {}
+		self._lock = threading.Lock()
+		self._last_sync = monotonic()
+		self._replay()
+		self._file = open(self.path, "a", encoding="utf-8")
+
+	def _replay(self) -> None:
+		if not os.path.exists(self.path): return
+		complete = 0
+		with open(self.path, "rb") as f:
+			for line in f:
+				# torn final line from a crash
+				if not line.endswith(b"\n"): break
+				complete += len(line)
+				try:
+					record = json.loads(line)
+				except ValueError:
+					continue
+				self._apply(record)
+			torn = f.tell() > complete
+		if torn:
+			# cut it off so the next record starts on a line of its own
+			with open(self.path, "r+b") as f:
+				f.truncate(complete)
+
+	def _apply(self, record: Dict[str, Any]) -> None:
+		self.states[record["id"]] = record["state"]
+		if "entry" in record:
+			self.entries[record["id"]] = (record["entry"], record.get("args", []))
+			self.runs[record["id"]] = record.get("run", date.fromtimestamp(record["ts"]).isoformat())
+
+	def _write(self, record: Dict[str, Any]) -> None:
+		with self._lock:
+			self._apply(record)
+			self._file.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+			self._file.flush()
+			if monotonic() - self._last_sync >= self.sync_interval:
+				os.fsync(self._file.fileno())
+				self._last_sync = monotonic()
+
+	def resolved(self, entry: Dict[str, Any], args: Optional[List[Any]]) -> None:
+		self._write({
+			"id": entry["id"], "state": "resolved", "ts": time(), "run": date.today().isoformat(),
+			"entry": {field: entry.get(field) for field in JOURNAL_FIELDS}, "args": args or [],
+		})
+
+	def update(self, episode_id: str, state: str, error: Optional[str] = None) -> None:
+		if state not in STATES:
+			raise ValueError(f"Unknown journal state {state}")
+		record = {"id": episode_id, "state": state, "ts": time()}
+		if error: record["error"] = error
+		self._write(record)
+
+	def is_done(self, episode_id: str) -> bool:
+		return self.states.get(episode_id) == "done"
+
+	def pending(self) -> List[Tuple[Dict[str, Any], List[Any]]]:
+		return [
+			self.entries[episode_id] for episode_id, state in self.states.items()
+			if state in UNFINISHED and episode_id in self.entries
+		]
+
+	def history(self) -> List[Dict[str, Any]]:
+		"""
+		Summarises the journal in the shape of the config `history` section.
+		:returns: list -- One {date, completed, queue} dict per run date
+		"""
+		runs = {}
+		for episode_id, run in self.runs.items():
+			summary = runs.setdefault(run, {"date": date.fromisoformat(run), "completed": True, "queue": []})
+			if self.states.get(episode_id) != "done":
+				entry, args = self.entries[episode_id]
+				summary["completed"] = False
+				summary["queue"].append({"url": entry["url"], "args": args})
+		return [runs[run] for run in sorted(runs)]
+
+	def compact(self) -> None:
+		with self._lock:
+			self._file.close()
+			tmp_path = self.path + ".tmp"
+			with open(tmp_path, "w", encoding="utf-8") as f:
+				for episode_id, state in self.states.items():
+					record = {"id": episode_id, "state": state, "ts": time()}
+					if episode_id in self.entries:
+						entry, args = self.entries[episode_id]
+						record.update({"entry": entry, "args": args, "run": self.runs[episode_id]})
+					f.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+				f.flush()
+				os.fsync(f.fileno())
+			os.replace(tmp_path, self.path)
+			self._file = open(self.path, "a", encoding="utf-8")
+
+	def close(self) -> None:
+		with self._lock:
+			self._file.flush()
+			os.fsync(self._file.fileno())
+			self._file.close()
@@ -1,38 +1,60 @@
 from __future__ import annotations
 from __future__ import unicode_literals
-import argparse
-import pprint
 import re
-import yaml
-import cfscrape
-import requests
 import os
 import platform
+import signal
 import threading
-import concurrent.futures
-from threading import Thread
 from sys import exit
-from cerberus import Validator, DocumentError
+from datetime import datetime
+from time import perf_counter_ns
+from time import time
 from prettytable import PrettyTable
-from .schema import CONFIG_SCHEMA
-from contextlib import contextmanager
-from itertools import cycle
-from shutil import get_terminal_size
-from time import sleep
-from typing import Sequence
+from . import __version__
+from .pool import SessionPool
+from .cache import MetadataCache, DEFAULT_CACHE_PATH, DEFAULT_TTL, DEFAULT_MAX_BYTES
+from .pipeline import Pipeline, round_robin
+from .journal import Journal, DEFAULT_JOURNAL_PATH, JOURNAL_FIELDS
+from .fragments import FragmentPool, parse_m3u8
+from .governor import BandwidthGovernor, parse_rate
+from .progress import ProgressAggregator
+from .postprocess import PostProcessPool, SUPPORTED_EXTS as MUX_EXTS, embed_subtitles
+from .sync import Watermarks, SeasonsFrom, DEFAULT_SYNC_PATH, position, is_newer
+from .index import DownloadIndex, DEFAULT_INDEX_PATH
+from .trace import Tracer, NULL_TRACER
+from .selection import selection, merge_series, in_ranges, dump_selection, load_selection
+from .autoscale import AutoScaler
+from .urls import content_id
+from .retry import RetryPolicy, DeadLetters, StageFailure, Cancelled, DEFAULT_DEAD_LETTER_PATH, AUTH, CANCELLED, classify
+from .daemon import Daemon, EventStream, build_server, DEFAULT_HOST, DEFAULT_PORT
+from .records import EpisodeRecord, pages, PREVIEW_PAGE
+from .staging import Staging, StagingFull, estimate, parse_size, DEFAULT_RESERVE, DEFAULT_SIZE
+from .jobqueue import JobQueue, Worker, DEFAULT_QUEUE_PATH, DEFAULT_LEASE, DEFAULT_POLL, DEFAULT_MAX_ATTEMPTS
+from .schema import parse_job
+from .tracks import (
+	SubtitleFetcher, TrackStats, AUDIO_PARAM, parse_languages, track_params, with_tracks, audio_language, audio_wanted
+)
+# the command line lives in cli.py so that --version and config checks start without yt-dlp
+from .cli import (
+	main, argument_parsing, validate_user_metadata, validate_series_url, validate_episode_url,
+	positive_int_type, series_episode_range_type
+)
 from typing import Optional
 from typing import Tuple
 from typing import List
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Container
+from typing import Callable
 
 try:
 	import yt_dlp
+	import yt_dlp.extractor.crunchyroll
 except:
 	print("Please ensure all required libraries specified in requirements.txt are available")
 	exit()
 
-__version__ = "0.1.0"
-
 class Logger:
 	def __init__(self, verbose: bool) -> None:
 		self.verbose = verbose
@@ -49,179 +71,993 @@ class Logger:
 	def error(self, msg: str) -> None:
 		print(msg)
 
-class LoaderThread(Thread):
-	def __init__(self, desc: str, end: str, timeout: float) -> None:
-		Thread.__init__(self)
-		self.desc = desc
-		self.end = end
-		self.timeout = timeout
-
-	def run(self):
-		self.active = True
-		while self.active:
-			steps = ["⢿", "⣻", "⣽", "⣾", "⣷", "⣯", "⣟", "⡿"]
-			for i in cycle(steps):
-				if not self.active: break
-				print(f"\r{self.desc} {i}", flush=True, end="")
-				sleep(self.timeout)	
-	
-	def stop(self):
-		self.active = False
-
-@contextmanager
-def loader(desc: str = "Downloading...", end: str = "Finished Downloading!", timeout: float = 0.1) -> None:
-	_loader = LoaderThread(desc, end, timeout)
-	_loader.start()
-	try: yield _loader
-	finally:
-		_loader.stop()
-		_loader.join()
-		cols = get_terminal_size((80, 20)).columns
-		print("\r" + " " * cols, end="", flush=True)
-		print(f"\r{end}", flush=True)
+def build_cache(config: Dict[str, ...]) -> Optional[MetadataCache]:
+	options = config.get("cache") or {}
+	if not options.get("enabled", True): return None
+	return MetadataCache(
+		options.get("path", DEFAULT_CACHE_PATH), options.get("ttl", DEFAULT_TTL),
+		options.get("max_bytes", DEFAULT_MAX_BYTES), refresh=config.get("refresh", False)
+	)
+
+def build_fragment_pool(config: Dict[str, ...]) -> Optional[FragmentPool]:
+	options = config.get("fragments") or {}
+	if not options.get("threads"): return None
+	return FragmentPool(
+		options["threads"], options.get("in_flight") or options["threads"] * 2, options.get("retries", 3)
+	)
+
+class PooledFragmentFD(yt_dlp.downloader.common.FileDownloader):
+	"""
+	Fetches plain HLS/DASH fragments on the shared FragmentPool and hands anything
+	it cannot reassemble byte for byte (encryption, byte ranges, init segments) back to yt-dlp.
+	"""
+	CHUNK_SIZE = 64 * 1024
+
+	def fragment_urls(self, info_dict: Dict[str, ...]) -> Optional[List[str]]:
+		if info_dict.get("protocol") == "m3u8_native":
+			response = self.ydl.urlopen(yt_dlp.utils.sanitized_Request(info_dict["url"], None, info_dict["http_headers"]))
+			return parse_m3u8(response.read().decode("utf-8", "ignore"), response.geturl())
+		fragments = info_dict.get("fragments") or []
+		if not fragments or any("range" in fragment for fragment in fragments): return None
+		base_url = info_dict.get("fragment_base_url") or ""
+		return [fragment.get("url") or yt_dlp.utils.urljoin(base_url, fragment["path"]) for fragment in fragments]
+
+	def real_download(self, filename: str, info_dict: Dict[str, ...]) -> bool:
+		urls = self.fragment_urls(info_dict)
+		if urls is None:
+			fd = yt_dlp.downloader.get_suitable_downloader(info_dict, self.params)(self.ydl, self.params)
+			for hook in self._progress_hooks: fd.add_progress_hook(hook)
+			return fd.real_download(filename, info_dict)
+
+		tmpfilename = self.temp_name(filename)
+		status = {"filename": filename, "tmpfilename": tmpfilename, "downloaded_bytes": 0, "fragment_count": len(urls)}
+
+		flow, weight = self.ydl.flow(info_dict["id"])
+
+		def fetch(url: str) -> bytes:
+			response = self.ydl.urlopen(yt_dlp.utils.sanitized_Request(url, None, info_dict["http_headers"]))
+			chunks = []
+			for chunk in iter(lambda: response.read(self.CHUNK_SIZE), b""):
+				self.ydl.governor.consume(len(chunk), flow, weight)
+				chunks.append(chunk)
+			return b"".join(chunks)
+
+		def on_fragment(index: int, size: int) -> None:
+			status.update({"status": "downloading", "fragment_index": index, "governed": True})
+			status["downloaded_bytes"] += size
+			self._hook_progress(dict(status), info_dict)
+
+		self.report_destination(filename)
+		total = self.ydl.fragment_pool.download(urls, tmpfilename, fetch, on_fragment)
+		self.try_rename(tmpfilename, filename)
+		self._hook_progress({
+			"filename": filename, "status": "finished", "total_bytes": total,
+			"downloaded_bytes": total, "governed": True
+		}, info_dict)
+		return True
+
+class PooledYoutubeDL(yt_dlp.YoutubeDL):
+	POOLED_PROTOCOLS = ("m3u8_native", "http_dash_segments")
+	fragment_pool = None
+	governor = None
+	flow = None
+	filepath = None
+
+	def dl(self, name, info, subtitle=False, test=False):
+		if (not self.fragment_pool or subtitle or test or name == "-" or
+			info.get("protocol") not in self.POOLED_PROTOCOLS):
+			return super().dl(name, info, subtitle, test)
+		fd = PooledFragmentFD(self, self.params)
+		for hook in self._progress_hooks: fd.add_progress_hook(hook)
+		new_info = self._copy_infodict(info)
+		if new_info.get("http_headers") is None:
+			new_info["http_headers"] = self._calc_headers(new_info)
+		return fd.download(name, new_info, subtitle)
+
+class CrunchyrollSeasonShowIE(yt_dlp.extractor.crunchyroll.CrunchyrollBetaShowIE):
+	"""
+	CrunchyrollBetaShowIE that only retrieves the episode lists of the wanted seasons,
+	yielding entries lazily so the caller can stop once its range is covered.
+	"""
+	_VALID_URL = yt_dlp.extractor.crunchyroll.CrunchyrollBetaShowIE._VALID_URL
+
+	def episode_entry(self, lang: str, episode: Dict[str, ...]) -> Dict[str, ...]:
+		return {
+			"_type": "url",
+			"url": f"https://beta.crunchyroll.com/{lang}watch/{episode['id']}/{episode['slug_title']}",
+			"ie_key": yt_dlp.extractor.crunchyroll.CrunchyrollBetaIE.ie_key(),
+			"id": episode["id"],
+			"title": "%s Episode %s – %s" % (episode.get("season_title"), episode.get("episode"), episode.get("title")),
+			"description": yt_dlp.utils.try_get(episode, lambda x: x["description"].replace(r"\r\n", "\n")),
+			"duration": yt_dlp.utils.float_or_none(episode.get("duration_ms"), 1000),
+			"series": episode.get("series_title"),
+			"series_id": episode.get("series_id"),
+			"season": episode.get("season_title"),
+			"season_id": episode.get("season_id"),
+			"season_number": episode.get("season_number"),
+			"episode": episode.get("title"),
+			"episode_number": episode.get("sequence_number"),
+			"audio_locale": episode.get("audio_locale"),
+		}
+
+	def season_entries(self, url: str, seasons: Optional[Container[int]]) -> Iterator[Dict[str, ...]]:
+		"""
+		Entries of every season whose number is in `seasons`, or of the newest season when it is None.
+		"""
+		lang, internal_id, display_id = self._match_valid_url(url).group("lang", "id", "display_id")
+		if not self._get_cookies(url).get("etp_rt"):
+			return iter(self._real_extract(url).get("entries") or [])
+		api_domain, bucket, params = self._get_params(lang)
+		seasons_response = self._download_json(
+			f"{api_domain}/cms/v2{bucket}/seasons?series_id={internal_id}", display_id,
+			note="Retrieving season list", query=params)
+
+		wanted = seasons
+		if wanted is None:
+			numbers = [season["season_number"] for season in seasons_response["items"] if season.get("season_number") is not None]
+			wanted = {max(numbers)} if numbers else set()
+
+		def entries():
+			for season in seasons_response["items"]:
+				if season.get("season_number") not in wanted: continue
+				episodes_response = self._download_json(
+					f"{api_domain}/cms/v2{bucket}/episodes?season_id={season['id']}", display_id,
+					note=f"Retrieving episode list for {season.get('slug_title')}", query=params)
+				for episode in episodes_response["items"]:
+					yield self.episode_entry(lang, episode)
+
+		return entries()
+
+def reset_crunchyroll_auth() -> None:
+	yt_dlp.extractor.crunchyroll.CrunchyrollBetaBaseIE.params = None
 
 class Downloader:
-	def __init__(self, args: Dict[str, str]):
+	def __init__(
+		self, args: Dict[str, str], pool: Optional[SessionPool] = None,
+		cache: Optional[MetadataCache] = None, journal: Optional[Journal] = None,
+		fragment_pool: Optional[FragmentPool] = None, governor: Optional[BandwidthGovernor] = None,
+		progress: Optional[ProgressAggregator] = None, postprocessor: Optional[PostProcessPool] = None,
+		watermarks: Optional[Watermarks] = None, index: Optional[DownloadIndex] = None,
+		pool_class: type = SessionPool, tracer: Optional[Tracer] = None,
+		retry: Optional[RetryPolicy] = None, dead_letters: Optional[DeadLetters] = None,
+		subtitles: Optional[SubtitleFetcher] = None, tracks: Optional[TrackStats] = None,
+		worker: Optional[Worker] = None, staging: Optional[Staging] = None
+	):
 		self.args = args
+		self.tracer = tracer or NULL_TRACER
+		self.progress = progress or ProgressAggregator("none")
+		self.postprocessor = postprocessor
+		self.subtitles = subtitles
+		self.tracks = tracks or (subtitles.stats if subtitles else TrackStats())
 		self.username = args["username"]	
 		self.password = args["password"]
 		self.config = {
-			"postprocessors": [{"key": "FFmpegEmbedSubtitle"}],
-			"ignoreerrors": True,
+			# with a process pool or a subtitle fetcher, muxing happens in mux()
+			"postprocessors": [] if postprocessor or subtitles else [{"key": "FFmpegEmbedSubtitle"}],
+			# failures are raised so the retry policy can classify them
+			"ignoreerrors": False,
+			"skip_unavailable_fragments": False,
 			"nooverwrites": True,
-			"allsubtitles": True,
+			"subtitleslangs": ["all"],
 			"writesubtitles": True,
 			"continuedl": True,
-			"progress_hooks": [self._hook],
+			"progress_hooks": [self._governor_hook, self.progress.hook],
+			"postprocessor_hooks": [self._postprocessor_hook, self.progress.postprocessor_hook],
 			"progress": True,
 			"logger": Logger(self.args["verbosity"]),
 			"username": self.args["username"],
 			"password": self.args["password"],
 			"ffmpeg_location": self.args["ffmpeg_location"],
-			"paths": {"home": self.args["destination"]},
+			# with staging, files move to the destination once they are finished
+			"paths": {"home": staging.directory if staging else self.args["destination"]},
 		}
-		self.downloaded = 0
-	def init_downloader(self, args: Optional[Dict[str, str]]):
+		self.config.update(track_params(parse_languages(args.get("subtitles")), parse_languages(args.get("audio"))))
+		if self.tracer.enabled:
+			self.config["progress_hooks"].append(self.tracer.hook)
+			self.config["postprocessor_hooks"].append(self.tracer.postprocessor_hook)
+		self.pool = pool or pool_class(
+			self.build_downloader, self.username, self.password,
+			on_invalidate=reset_crunchyroll_auth, tracer=self.tracer
+		)
+		self.cache = cache
+		self.journal = journal
+		self.fragment_pool = fragment_pool
+		self.watermarks = watermarks
+		self.index = index
+		self.retry = retry or RetryPolicy(attempts = 1)
+		self.dead_letters = dead_letters
+		self.worker = worker
+		self.staging = staging
+		self.governor = governor or BandwidthGovernor()
+		self.priorities = {}
+		self.jobs = {}
+		self.cancelled = set()
+		self.completed = 0
+		self.failed = 0
+		self._progress = {}
+		self._outcomes_lock = threading.Lock()
+
+	def build_downloader(self, args: Optional[Dict[str, str]]) -> yt_dlp.YoutubeDL:
 		config = self.config.copy()
-		for arg in args: config.update(arg)
-		self.downloader = yt_dlp.YoutubeDL(config)
+		for arg in args or []: config.update(arg)
+		downloader = PooledYoutubeDL(config)
+		downloader.fragment_pool = self.fragment_pool
+		downloader.governor = self.governor
+		downloader.flow = self.flow
+		downloader.add_post_hook(lambda filepath: setattr(downloader, "filepath", filepath))
+		return downloader
+
+	def init_downloader(self, args: Optional[Dict[str, str]]):
+		self.downloader = self.build_downloader(args)
 		return self.downloader
 	
-	def stdout(self, data: List[Dict[str, str]]):
-		table = PrettyTable(["id", "Season", "Episode", "Title"], max_width = 100)
-		output = []
-		for entry in data:
-			output.append([entry["id"], entry["season_number"], entry["episode_number"], entry["title"]])
-		table.add_rows(output)
-		print(table)
-
-	def _hook(self, downloader: yt_dlp.YoutubeDL) -> None:
-		if downloader["status"] == "finished":
-			if yt_dlp.utils.determine_ext(downloader["filename"]) in yt_dlp.utils.KNOWN_EXTENSIONS:
-				print("Finished downloading", os.path.basename(downloader["filename"]))
-				self.downloaded += 1
-
-	def download(self, url: str, args: Optional[Dict[str, str]]) -> None:
-		dl = self.init_downloader(args)
-		dl.params.update({"progress_hooks": [self._hook]})	
-		dl.download([url])
+	def stdout(self, data: Iterable[Dict[str, str]], page_size: int = PREVIEW_PAGE):
+		"""
+		Prints the episodes as they come, a table per `page_size` of them, so the preview of a
+		large batch starts before it is fully resolved and never builds one table for all of it.
+		"""
+		total = 0
+		for page in pages(data, page_size):
+			table = PrettyTable(["id", "Season", "Episode", "Title"], max_width = 100)
+			table.add_rows([
+				[entry["id"], entry.get("season_number"), entry.get("episode_number"), entry.get("title")] for entry in page
+			])
+			print(table, flush=True)
+			total += len(page)
+		print(f"[PREVIEW] {total} episodes")
+
+	def prioritise(self, entry: Dict[str, ...]) -> None:
+		self.priorities[entry["id"]] = (entry.get("series_id") or entry["id"], entry.get("priority", 1))
+
+	def flow(self, episode_id: str) -> Tuple[str, float]:
+		return self.priorities.get(episode_id, (episode_id, 1))
+
+	def cancel(self, episode_id: str) -> None:
+		"""
+		Stops an episode at its next progress update, or before it starts.
+		"""
+		self.cancelled.add(episode_id)
+
+	def _governor_hook(self, status: Dict[str, ...]) -> None:
+		if (status.get("info_dict") or {}).get("id") in self.cancelled:
+			raise Cancelled(f"{status['info_dict']['id']} was cancelled")
+		if status.get("governed"): return
+		key = status.get("tmpfilename") or status.get("filename")
+		if status["status"] != "downloading":
+			self._progress.pop(key, None)
+			return
+		done = status.get("downloaded_bytes") or 0
+		delta = done - self._progress.get(key, 0)
+		self._progress[key] = done
+		if delta > 0:
+			self.governor.consume(delta, *self.flow(status["info_dict"].get("id")))
+			if self.staging: self.staging.written(status["info_dict"].get("id"), delta)
+
+	def outcomes(self) -> Tuple[int, int]:
+		with self._outcomes_lock:
+			return self.completed, self.failed
+
+	def extract(self, ie_class: type, url: str, args: Optional[Dict[str, str]]) -> List[Dict[str, ...]]:
+		key = f"{ie_class.IE_NAME}:{content_id(url)}"
+		entries = self.cache.get(key) if self.cache else None
+		if entries is None:
+			raw_data = self.pool.extract(ie_class, url, args)
+			entries = list(raw_data["entries"]) if "entries" in raw_data else [raw_data]
+			if self.cache: self.cache.set(key, entries)
+		return entries
+
+	def _postprocessor_hook(self, status: Dict[str, ...]) -> None:
+		if self.journal and status["status"] == "started":
+			self.journal.update(status["info_dict"]["id"], "muxing")
+
+	def on_retry(self, failure: str) -> None:
+		if failure == AUTH: self.pool.invalidate()
+
+	def finish(
+		self, episode_id: str, ok: bool, error: Optional[BaseException] = None, filepath: Optional[str] = None
+	) -> None:
+		if ok and filepath and self.staging and os.path.exists(filepath):
+			try:
+				with self.tracer.span("finalise", episode_id):
+					filepath = self.staging.finalise(filepath)
+			except OSError as move_error:
+				ok, error = False, StageFailure("finalise", classify(move_error), move_error, 1)
+		if self.staging: self.staging.release(episode_id)
+		if ok and filepath and self.index and os.path.exists(filepath):
+			self.index.add(episode_id, filepath)
+		cancelled = error is not None and classify(error) == CANCELLED
+		if self.dead_letters and not cancelled:
+			if ok:
+				self.dead_letters.discard(episode_id)
+			elif error is not None:
+				entry, args = self.jobs.get(episode_id, ({"id": episode_id}, None))
+				if isinstance(error, StageFailure):
+					self.dead_letters.add(entry, args, error.stage, error.failure, error.error, error.attempts)
+				else:
+					self.dead_letters.add(entry, args, "media", classify(error), error)
+		with self._outcomes_lock:
+			if ok: self.completed += 1
+			else: self.failed += 1
+		state = "done" if ok else "failed"
+		self.progress.state(episode_id, "cancelled" if cancelled else state)
+		if self.journal: self.journal.update(episode_id, state, str(error) if error else None)
+		if self.worker: self.worker.finished(episode_id, ok, str(error) if error else None)
+
+	def audio_languages(self, args: Optional[List[Dict[str, ...]]]) -> Optional[List[str]]:
+		wanted = self.config.get(AUDIO_PARAM)
+		for arg in args or []:
+			if isinstance(arg, dict): wanted = arg.get(AUDIO_PARAM, wanted)
+		return wanted
+
+	def wanted_audio(self, entries: List[Dict[str, ...]], args: Optional[List[Dict[str, ...]]]) -> List[Dict[str, ...]]:
+		"""
+		Drops listed episodes whose audio language is known and not selected, before they are extracted.
+		"""
+		wanted = self.audio_languages(args)
+		kept = []
+		for entry in entries:
+			if audio_wanted(entry.get("audio_locale"), wanted): kept.append(entry)
+			else: self.tracks.skipped_audio(None)
+		return kept
+
+	def select_tracks(self, episode_id: str, info: Dict[str, ...], args: Optional[List[Dict[str, ...]]]) -> bool:
+		"""
+		Applies the audio selection to an extracted episode and counts the subtitle tracks left
+		out. An episode in an unwanted audio language is finished without downloading it.
+		"""
+		language = audio_language(info)
+		if not audio_wanted(language, self.audio_languages(args)):
+			self.config["logger"].info(f"[TRACKS] Skipping {episode_id}, its audio is {language}")
+			self.tracks.skipped_audio(info.get("filesize") or info.get("filesize_approx"))
+			self.finish(episode_id, True)
+			return False
+		self.tracks.subtitles(len(info.get("subtitles") or {}), len(info.get("requested_subtitles") or {}))
+		return True
+
+	def admit(self, episode_id: str, info: Dict[str, ...]) -> bool:
+		"""
+		Waits until the staging directory has room for an episode before its media is fetched.
+		An episode already at the destination is finished without downloading it.
+		"""
+		if not self.staging: return True
+		# yt-dlp's nooverwrites only looks in the staging directory
+		existing = self.staging.target(info["filepath"])
+		if os.path.exists(existing):
+			self.config["logger"].info(f"[STAGING] Skipping {episode_id}, {existing} already exists")
+			self.finish(episode_id, True, filepath=existing)
+			return False
+		try:
+			with self.tracer.span("staging", episode_id):
+				self.staging.admit(episode_id, estimate(info), mux = bool(info.get("requested_subtitles")))
+		except StagingFull as error:
+			raise StageFailure("staging", classify(error), error, 1) from error
+		return True
+
+	def fetch_subtitles(self, dl: yt_dlp.YoutubeDL, episode_id: str, info: Dict[str, ...]) -> List[Tuple[str, ...]]:
+		"""
+		Starts fetching the selected subtitles of an episode on the shared subtitle pool.
+		:returns: list -- (language, future of the file path) pairs
+		"""
+		flow, weight = self.flow(episode_id)
+
+		def loader(sub: Dict[str, ...]) -> Callable[[], bytes]:
+			def load() -> bytes:
+				if sub.get("data") is not None: return sub["data"].encode("utf-8")
+				response = dl.urlopen(yt_dlp.utils.sanitized_Request(sub["url"], None, sub.get("http_headers") or {}))
+				data = response.read()
+				self.governor.consume(len(data), flow, weight)
+				return data
+			return lambda: self.retry.call("subtitles", load, self.on_retry)
+
+		return [
+			(lang, self.subtitles.submit(
+				yt_dlp.utils.subtitles_filename(info["filepath"], lang, sub["ext"], info.get("ext")), loader(sub)
+			))
+			for lang, sub in (info.get("requested_subtitles") or {}).items()
+		]
+
+	def mux(self, episode_id: str, info: Dict[str, ...], subtitles: Optional[List[Tuple[str, str]]] = None) -> None:
+		filename = (info.get("requested_downloads") or [info])[-1].get("filepath")
+		if subtitles is None:
+			subtitles = [(lang, sub.get("filepath")) for lang, sub in (info.get("requested_subtitles") or {}).items()]
+		subtitles = [
+			(lang, path) for lang, path in subtitles
+			if path and not path.endswith(".json") and os.path.exists(path)
+		]
+		if not filename or not subtitles or yt_dlp.utils.determine_ext(filename) not in MUX_EXTS:
+			self.finish(episode_id, True, filepath=filename)
+			return
+		self.progress.state(episode_id, "muxing")
+		if self.journal: self.journal.update(episode_id, "muxing")
+		if self.postprocessor:
+			start = perf_counter_ns()
+
+			def done(error: Optional[BaseException]) -> None:
+				self.tracer.record("mux", episode_id, start)
+				if error is not None: error = StageFailure("mux", classify(error), error, 1)
+				self.finish(episode_id, error is None, error, filename)
+
+			self.postprocessor.submit(filename, subtitles, done)
+			return
+		try:
+			with self.tracer.span("mux", episode_id):
+				self.retry.call("mux", lambda: embed_subtitles(self.args["ffmpeg_location"], filename, subtitles))
+		except StageFailure as error:
+			self.finish(episode_id, False, error)
+			return
+		self.finish(episode_id, True, filepath=filename)
+
+	def prepare(self, url: str, args: Optional[Dict[str, str]]) -> Dict[str, ...]:
+		episode_id = content_id(url)
+		entry = self.jobs.setdefault(episode_id, ({"id": episode_id, "url": url}, args))[0]
+		dl = self.pool.downloader(args)
+
+		def extract() -> Dict[str, ...]:
+			with self.tracer.span("prepare", episode_id):
+				info = dl.extract_info(url, download=False)
+			if info is None:
+				raise yt_dlp.utils.DownloadError(f"Unable to extract {url}")
+			return info
+
+		info = self.retry.call("extract", extract, self.on_retry)
+		entry.update({field: info[field] for field in ("title", "season_number", "episode_number") if info.get(field) is not None})
+		info["filepath"] = dl.prepare_filename(info)
+		return info
+
+	def download(self, url: str, args: Optional[Dict[str, str]], info: Optional[Dict[str, ...]] = None) -> None:
+		"""
+		Downloads an episode and finishes it, also when an error is raised. `info` is an
+		episode already prepared, its tracks selected and admitted, as the async engine hands over.
+		"""
+		self.jobs.setdefault(content_id(url), ({"id": content_id(url), "url": url}, args))
+		with self.tracer.span("episode", content_id(url)):
+			self._download(url, args, info)
+
+	def _download(self, url: str, args: Optional[Dict[str, str]], info: Optional[Dict[str, ...]] = None) -> None:
+		episode_id = content_id(url)
+		if episode_id in self.cancelled:
+			self.finish(episode_id, False, Cancelled(f"{episode_id} was cancelled"))
+			return
+		if self.journal: self.journal.update(episode_id, "downloading")
+		dl = self.pool.downloader(args)
+		# pooled downloaders are reused, so clear the error code and file left by the previous job
+		dl._download_retcode = 0
+		dl.filepath = None
+		try:
+			if info is None:
+				info = self.prepare(url, args)
+				if not self.select_tracks(episode_id, info, args): return
+				if not self.admit(episode_id, info): return
+			fetching = self.fetch_subtitles(dl, episode_id, info) if self.subtitles else None
+
+			def media() -> Dict[str, ...]:
+				# same as --load-info-json: only the media is fetched again, finished files are kept;
+				# subtitles being fetched alongside are left out
+				source = {**info, "subtitles": {}} if fetching is not None else info
+				return dl.process_ie_result(dl.sanitize_info(source, True), download=True)
+
+			def refresh(failure: str) -> None:
+				nonlocal info
+				self.on_retry(failure)
+				# signed media urls expire with the session
+				if failure == AUTH: info = self.prepare(url, args)
+
+			info = self.retry.call("media", media, refresh)
+			retcode = dl._download_retcode
+			subtitles = [(lang, future.result()) for lang, future in fetching] if fetching else None
+		except StageFailure as error:
+			self.finish(episode_id, False, error)
+			return
+		except Exception as error:
+			self.finish(episode_id, False, error)
+			raise
+		if retcode == 0 and (self.postprocessor or subtitles):
+			# hand muxing to the process pool and free this download slot
+			self.mux(episode_id, info, subtitles)
+		else:
+			self.finish(episode_id, retcode == 0, filepath=dl.filepath)
 		
 class AnimeEpisode(Downloader):
 	def extract_info(self, meta_data: Dict[str, str], args: Optional[Dict[str, str]]):
-		self.extractor = yt_dlp.extractor.crunchyroll.CrunchyrollBetaIE(self.init_downloader(args))
+		if self.index and self.index.has(content_id(meta_data["url"])):
+			return ([], args)
 		try:
-			self.extractor._perform_login(self.username, self.password)
-			raw_data = self.extractor._real_extract(meta_data["url"])
+			raw_data = self.extract(yt_dlp.extractor.crunchyroll.CrunchyrollBetaIE, meta_data["url"], args)[0]
 		except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as error:
 			raise error
-		raw_data["url"] = meta_data["url"]
-		return ([raw_data], args)
+		# the full info is extracted again when the episode is downloaded
+		record = EpisodeRecord.from_info(
+			raw_data, url=meta_data["url"], priority=meta_data.get("priority", 1), source=meta_data.get("source")
+		)
+		return ([record], args)
 
 class AnimeShow(Downloader):
+	show_extractor = CrunchyrollSeasonShowIE
+
+	def season_entries(self, url: str, season: int, args: Optional[Dict[str, str]]) -> Iterable[Dict[str, ...]]:
+		key = f"{self.show_extractor.IE_NAME}:{content_id(url)}:season-{season}"
+		entries = self.cache.get(key) if self.cache else None
+		if entries is None:
+			entries = self.pool.run(self.show_extractor, lambda extractor: extractor.season_entries(url, {season}), args)
+			if self.cache:
+				entries = list(entries)
+				self.cache.set(key, entries)
+		return entries
+
 	def extract_info(self, meta_data: Dict[str, str], args: Optional[Dict[str, str]]):
-		self.extractor = yt_dlp.extractor.crunchyroll.CrunchyrollBetaShowIE(self.init_downloader(args))	
+		wanted = selection(meta_data)
+		audio = self.audio_languages(args)
+		data = []
 		try:
-			self.extractor._perform_login(self.username, self.password)
-			raw_data = self.extractor._real_extract(meta_data["url"])
+			for season, (ranges, latest) in sorted(wanted.items()):
+				# episode lists come in sequence order, so without "latest N" nothing past the last range can match
+				last = ranges[-1][1] if ranges and not latest else None
+				listed = set()
+				episodes = {}
+				for entry in self.season_entries(meta_data["url"], season, args):
+					number = entry["episode_number"]
+					if entry["season_number"] != season or number is None: continue
+					# a season lists each dub of an episode, one dub after the other
+					dub = audio_wanted(entry.get("audio_locale"), audio)
+					if last is not None and number > last:
+						if dub: break
+						continue
+					listed.add(number)
+					if dub: episodes.setdefault(number, entry)
+				chosen = {number for number in listed if in_ranges(number, ranges)}
+				if latest: chosen.update(sorted(listed)[-latest:])
+				for number in sorted(chosen):
+					if number not in episodes:
+						self.tracks.skipped_audio(None)
+						continue
+					data.append(EpisodeRecord.from_info(
+						episodes[number], priority=meta_data.get("priority", 1), source=meta_data.get("source")
+					))
 		except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as error:
 			raise error
-		eps_collection = set()
+		return (data, args)
+
+	def sync_info(self, meta_data: Dict[str, str], args: Optional[Dict[str, str]]):
+		"""
+		Only the episodes released after the series' high-water mark. The first sync of a
+		series downloads its configured selection and marks the newest episode of the show.
+		"""
+		url = meta_data["url"]
+		mark = self.watermarks.get(url)
+		# a mark needs only the season list and the episode lists from its season onwards
+		seasons = SeasonsFrom(mark["season_number"]) if mark else None
+		listed = self.pool.run(self.show_extractor, lambda extractor: extractor.season_entries(url, seasons), args)
+		newest = None
 		data = []
-		for entry in raw_data["entries"]:
-			if (entry["season_number"] == meta_data["season"] and 
-				meta_data["start"] <= entry["episode_number"] <= meta_data["end"] and
-				(entry["season_number"], entry["episode_number"]) not in eps_collection):
-				data.append(entry)
-				eps_collection.add((entry["season_number"], entry["episode_number"]))
+		positions = set()
+		for entry in listed:
+			if position(entry) is None: continue
+			if newest is None or position(entry) > position(newest): newest = EpisodeRecord.from_info(entry)
+			if mark and is_newer(entry, mark) and position(entry) not in positions:
+				data.append(EpisodeRecord.from_info(entry, priority=meta_data.get("priority", 1), source=meta_data.get("source")))
+				positions.add(position(entry))
+		if not mark:
+			data, args = self.extract_info(meta_data, args)
+		if mark and (newest is None or not is_newer(newest, mark)):
+			newest = {"id": mark["episode_id"], **{field: mark[field] for field in ("season_number", "episode_number", "title")}}
+		data = self.wanted_audio(data, args)
+		data.sort(key=position)
+		self.watermarks.stage(url, newest, data)
 		return (data, args)
 		
-def session(config):
-	episode_ie = AnimeEpisode(config)
-	show_ie = AnimeShow(config)
-	video_data = []
-	urls = []
-	with concurrent.futures.ThreadPoolExecutor(max_workers = config["threads"]) as executor:
-		threads = []
-		if "series" in config["download"]:
-			for series in config["download"]["series"]:
-				thread = executor.submit(show_ie.extract_info, series, series["args"])
-				threads.append(thread)
-		if "episodes" in config["download"]:
-			for episode in config["download"]["episodes"]:
-				thread = executor.submit(episode_ie.extract_info, episode, episode["args"])
-				threads.append(thread)
-		
-		for thread in concurrent.futures.as_completed(threads):
-			result = thread.result()
-			video_data.extend(result[0])
-			for entries in result[0]:
-				urls.append((entries["url"], result[1]))
-	dl = Downloader(config)
-	
-	dl.stdout(video_data)
-	proceed = input("Do you want to proceed with your download (y/n)")
-	if proceed.lower() == "y":
-		with loader():
-			with concurrent.futures.ThreadPoolExecutor(max_workers = config["threads"]) as executor:		
-				threads = []
-				for url, args in urls:
-					thread = executor.submit(dl.download, url, args)
-					threads.append(thread)	
+def build_journal(config: Dict[str, ...]) -> Optional[Journal]:
+	options = config.get("journal") or {}
+	if not options.get("enabled", True): return None
+	return Journal(options.get("path", DEFAULT_JOURNAL_PATH))
+
+def build_governor(config: Dict[str, ...]) -> BandwidthGovernor:
+	options = config.get("bandwidth") or {}
+	rate = parse_rate(options["limit"]) if options.get("limit") else None
+	burst = parse_rate(options["burst"]) if options.get("burst") else None
+	return BandwidthGovernor(rate, burst)
+
+def build_progress(config: Dict[str, ...]) -> ProgressAggregator:
+	options = config.get("progress") or {}
+	stream = open(options["file"], "a", encoding="utf-8") if options.get("file") else None
+	return ProgressAggregator(options.get("format", "text"), stream, options.get("interval", 0.5))
+
+def build_postprocessor(config: Dict[str, ...]) -> Optional[PostProcessPool]:
+	options = config.get("postprocess") or {}
+	if options.get("workers", None) == 0: return None
+	return PostProcessPool(config["ffmpeg_location"], options.get("workers"))
+
+def build_index(config: Dict[str, ...]) -> Optional[DownloadIndex]:
+	options = config.get("index") or {}
+	if not options.get("enabled", True): return None
+	return DownloadIndex(options.get("path", DEFAULT_INDEX_PATH))
+
+def build_watermarks(config: Dict[str, ...]) -> Watermarks:
+	return Watermarks((config.get("watermarks") or {}).get("path", DEFAULT_SYNC_PATH))
+
+def finish_sync(watermarks: Watermarks) -> None:
+	table = PrettyTable(["Series", "Last Sync", "Newest Episode", "New"], max_width = 100)
+	for row in watermarks.report():
+		since = datetime.fromtimestamp(row["since"]).strftime("%Y-%m-%d %H:%M") if row["since"] else "never"
+		newest = row["newest"]
+		latest = f"S{newest['season_number']:g}E{newest['episode_number']:g} {newest.get('title') or ''}" if newest else "-"
+		table.add_row([row["url"], since, latest, len(row["new"])])
+	print(table)
+	watermarks.commit()
+
+def skip(resolved, done: Callable[[str], bool]):
+	if hasattr(resolved, "__aiter__"):
+		async def skip_done():
+			async for entry, args in resolved:
+				if not done(entry["id"]): yield entry, args
+		return skip_done()
+	return ((entry, args) for entry, args in resolved if not done(entry["id"]))
+
+def build_queue(config: Dict[str, ...]) -> Optional[JobQueue]:
+	if not config.get("coordinate") and not config.get("work"): return None
+	options = config.get("queue") or {}
+	return JobQueue(options.get("path", DEFAULT_QUEUE_PATH), options.get("max_attempts", DEFAULT_MAX_ATTEMPTS))
+
+def build_worker(config: Dict[str, ...], queue: JobQueue, capacity: Optional[int] = None) -> Worker:
+	options = config.get("queue") or {}
+	return Worker(
+		queue, options.get("worker_id"), capacity = capacity or config.get("download_threads") or config["threads"],
+		lease = options.get("lease", DEFAULT_LEASE), heartbeat = options.get("heartbeat"),
+		poll = options.get("poll", DEFAULT_POLL), follow = options.get("follow", False),
+		log = Logger(config.get("verbosity", False)).warning
+	)
+
+def report_queue(queue: JobQueue) -> None:
+	table = PrettyTable(["id", "Title", "State", "Worker", "Lease", "Attempts", "Error"], max_width = 60)
+	for job in queue.jobs():
+		lease = f"{job['lease_until'] - time():.0f}s" if job["lease_until"] else ""
+		table.add_row([
+			job["id"], job["entry"].get("title") or "", job["state"], job["worker"] or "", lease,
+			job["attempts"], job["error"] or ""
+		])
+	print(table)
+	print(f"[QUEUE] {queue.path}: " + ", ".join(f"{count} {state}" for state, count in queue.counts().items()))
+
+def build_staging(config: Dict[str, ...]) -> Optional[Staging]:
+	options = config.get("staging") or {}
+	if not options.get("path"): return None
+	return Staging(
+		os.path.expanduser(options["path"]), config["destination"],
+		parse_size(options.get("reserve", DEFAULT_RESERVE)), parse_size(options.get("default_size", DEFAULT_SIZE))
+	)
+
+def build_subtitles(config: Dict[str, ...], tracks: TrackStats) -> SubtitleFetcher:
+	# subtitle files are small, a couple per download worker keeps them ahead of the video
+	return SubtitleFetcher(2 * (config.get("download_threads") or config["threads"]), tracks)
+
+def build_scaler(config: Dict[str, ...], dl: Downloader, governor: BandwidthGovernor) -> Optional[AutoScaler]:
+	options = config.get("autoscale") or {}
+	if not options or not options.get("enabled", True): return None
+	return AutoScaler(
+		lambda: governor.total_bytes, dl.outcomes,
+		min_workers = options.get("min_workers", 1), max_workers = options.get("max_workers", 10),
+		interval = options.get("interval", 5), max_error_rate = options.get("max_error_rate", 0.2),
+		log = dl.config["logger"].info
+	)
+
+def build_retry(config: Dict[str, ...]) -> RetryPolicy:
+	options = config.get("retry") or {}
+	return RetryPolicy(
+		options.get("attempts", 3), options.get("backoff", 1.0), options.get("max_backoff", 30.0),
+		log = Logger(config.get("verbosity", False)).warning
+	)
+
+def build_dead_letters(config: Dict[str, ...]) -> DeadLetters:
+	return DeadLetters((config.get("retry") or {}).get("dead_letter", DEFAULT_DEAD_LETTER_PATH))
+
+def report_failures(dead_letters: DeadLetters, letters: List[Dict[str, ...]]) -> None:
+	table = PrettyTable(["id", "Title", "Stage", "Failure", "Attempts", "Error"], max_width = 60)
+	for letter in letters:
+		table.add_row([
+			letter["id"], letter["entry"].get("title") or "", letter["stage"], letter["failure"],
+			letter["attempts"], letter["error"]
+		])
+	print(table)
+	print(f"[FAILED] {len(letters)} episodes written to {dead_letters.path}, run `retry` to queue them again")
+
+def build_tracer(config: Dict[str, ...]) -> Tracer:
+	options = config.get("trace") or {}
+	return Tracer(enabled = bool(options.get("enabled") or options.get("file")))
+
+def traced(tracer: Tracer, stage: str, extract: Callable[..., ...]) -> Callable[..., ...]:
+	if not tracer.enabled: return extract
+
+	def wrapper(meta_data: Dict[str, ...], args: Optional[Dict[str, str]]):
+		with tracer.span(stage, content_id(meta_data["url"])):
+			return extract(meta_data, args)
+
+	return wrapper
+
+def listing(
+	dl: Downloader, dead_letters: Optional[DeadLetters], kind: str, extract: Callable[..., ...]
+) -> Callable[..., ...]:
+	"""
+	Retries the listing of a series or episode entry like any other stage. A listing that
+	fails for good is dead-lettered and resolves to nothing, so the other entries carry on.
+	"""
+	def wrapper(meta_data: Dict[str, ...], args: Optional[Dict[str, str]]):
+		listing_id = content_id(meta_data["url"])
+		try:
+			result = dl.retry.call("list", lambda: extract(meta_data, args), dl.on_retry)
+		except StageFailure as error:
+			dl.config["logger"].error(f"[ERROR] Unable to list {meta_data['url']}: {error.error}")
+			if dead_letters:
+				letter = {**meta_data, "id": listing_id, "kind": kind}
+				if "selection" in meta_data: letter["selection"] = dump_selection(meta_data["selection"])
+				dead_letters.add(letter, args, error.stage, error.failure, error.error, error.attempts)
+			return ([], args)
+		if dead_letters: dead_letters.discard(listing_id, "list")
+		return result
+
+	return wrapper
+
+def retry_jobs(
+	pending: List[Tuple[Dict[str, ...], List[...]]], extractors: Dict[str, Callable[..., ...]]
+) -> List[Tuple[Callable[..., ...], Dict[str, ...], List[...]]]:
+	"""
+	Dead letters as resolver jobs: failed listings are listed again, failed episodes resolve to themselves.
+	"""
+	jobs = []
+	for entry, args in pending:
+		if entry.get("kind") in extractors:
+			if "selection" in entry: entry = {**entry, "selection": load_selection(entry["selection"])}
+			jobs.append((extractors[entry["kind"]], entry, args))
+		else:
+			jobs.append((lambda meta_data, args: ([meta_data], args), entry, args))
+	return jobs
+
+def queue_entry(dl: Downloader, journal: Optional[Journal], entry: Dict[str, ...], args: Optional[List[...]]) -> None:
+	dl.prioritise(entry)
+	dl.jobs[entry["id"]] = ({field: entry.get(field) for field in JOURNAL_FIELDS}, args)
+	dl.progress.queued(entry["id"], entry.get("title", ""))
+	if journal: journal.resolved(entry, args)
+
+def session(config, pool_class: type = SessionPool):
+	cache = build_cache(config)
+	journal = build_journal(config)
+	fragment_pool = build_fragment_pool(config)
+	governor = build_governor(config)
+	progress = build_progress(config)
+	postprocessor = build_postprocessor(config)
+	index = build_index(config)
+	tracer = build_tracer(config)
+	dead_letters = build_dead_letters(config)
+	tracks = TrackStats()
+	subtitles = build_subtitles(config, tracks)
+	queue = build_queue(config)
+	worker = build_worker(config, queue) if config.get("work") else None
+	staging = build_staging(config)
+	dl = Downloader(
+		config, pool_class=pool_class, tracer=tracer, cache=cache, journal=journal, fragment_pool=fragment_pool,
+		governor=governor, progress=progress, postprocessor=postprocessor, index=index,
+		retry=build_retry(config), dead_letters=dead_letters, subtitles=subtitles, tracks=tracks, worker=worker,
+		staging=staging
+	)
+	watermarks = build_watermarks(config) if config.get("sync") else None
+	episode_ie = AnimeEpisode(config, dl.pool, cache, index=index, tracer=tracer, tracks=tracks)
+	show_ie = AnimeShow(config, dl.pool, cache, watermarks=watermarks, tracer=tracer, tracks=tracks)
+	# a worker pulls its jobs as download slots free up, which the async engine does not do
+	engine = "threads" if worker else config.get("engine")
+	scaler = build_scaler(config, dl, governor) if engine != "async" else None
+	# with a scaler every one of its workers may hold a job
+	if worker and scaler: worker.capacity = scaler.max_workers
+	# entries of a multi-file run carry the file they came from, and the files share the workers
+	sources = {
+		entry.get("source") for section in ("series", "episodes") for entry in config["download"].get(section) or []
+	}
+	pipeline = Pipeline(
+		dl.download,
+		extract_workers = config.get("extract_threads") or config["threads"],
+		download_workers = config.get("download_threads") or config["threads"],
+		scaler = scaler, fair = len(sources) > 1
+	)
+	if engine == "async":
+		from .aio import AsyncEngine
+
+		pipeline = AsyncEngine(
+			dl, extract_workers = config.get("extract_threads") or config["threads"],
+			concurrency = config.get("concurrency") or 32, requests = (config.get("fragments") or {}).get("in_flight")
+		)
+	if isinstance(pipeline, Pipeline): progress.gauges["download queue"] = lambda: pipeline.depth
+	else: progress.gauges["requests in flight"] = lambda: pipeline.in_flight
+	if scaler: progress.gauges["download workers"] = lambda: scaler.workers
+	if postprocessor: progress.gauges["mux queue"] = lambda: postprocessor.depth
+	jobs = []
+	if "series" in config["download"]:
+		extract = show_ie.sync_info if watermarks else show_ie.extract_info
+		# an entry's own subtitle and audio selection becomes part of its args
+		for series in merge_series(with_tracks(series) for series in config["download"]["series"]):
+			jobs.append((traced(tracer, "extract", listing(dl, dead_letters, "series", extract)), series, series["args"]))
+	# a sync only follows series, single episodes are one-off downloads
+	if "episodes" in config["download"] and not watermarks:
+		for episode in map(with_tracks, config["download"]["episodes"]):
+			jobs.append((
+				traced(tracer, "extract", listing(dl, dead_letters, "episode", episode_ie.extract_info)), episode, episode["args"]
+			))
+	jobs = round_robin(jobs, lambda job: job[1].get("source"))
+	if config.get("dry_run"):
+		print(f"[DRY RUN] Resolving {len(jobs)} series and episodes, nothing will be downloaded")
+
+	def queued(entry, args):
+		queue_entry(dl, journal, entry, args)
+
+	if config.get("resume"):
+		resolved = journal.pending() if journal else []
+	elif config.get("retry_failed"):
+		resolved = dead_letters.pending()
+		if any(entry.get("kind") for entry, _ in resolved):
+			resolved = pipeline.resolve(retry_jobs(resolved, {
+				"series": listing(dl, dead_letters, "series", show_ie.extract_info),
+				"episode": listing(dl, dead_letters, "episode", episode_ie.extract_info),
+			}))
+	elif worker:
+		# the coordinator resolved the episodes; jobs this node already has are completed, not skipped
+		resolved = worker.claims(lambda episode_id: bool(
+			(journal and journal.is_done(episode_id)) or (index and index.has(episode_id))
+		))
 	else:
-		print(f"[EXITED]")
-
-def series_episode_range_type(s: str) -> Tuple[int, int]:
-	ep_range = re.match(r"\(?(\d+)\s*?[-|,]?\s*?((\d+))?\)?$", s)
-	if not ep_range:
-		raise argparse.ArgumentTypeError("'" + s + "' is not a range of number. Expected forms like '0-5' or '2'.")
-	print(ep_range)
-	start = ep_range.group(1)
-	end = ep_range.group(2) or start 
-	if int(start) > int(end): end = start
-	if int(start) == 0 or int(end) == 0:
-		raise argparse.ArgumentTypeError("Please enter a valid range")
-	return (int(start), int(end))
-
-def positive_int_type(season: str) -> int:
-	try:
-		season = int(season)
-	except:
-		raise argparse.ArgumentTypeError(f"Expected positive integer, received {season}")
-	
-	if season <= 0:
-		raise argparse.ArgumentTypeError(f"Expected positive integer, received {season}")
+		resolved = pipeline.resolve(jobs)
+	if journal and not worker:
+		resolved = skip(resolved, journal.is_done)
+	if index and not worker:
+		resolved = skip(resolved, index.has)
 
-	return season
+	def download(resolved):
+		with progress:
+			futures = pipeline.run(resolved, on_queued=queued)
+			if postprocessor: postprocessor.close()
+		for future in futures or []:
+			if not future.cancelled() and future.exception():
+				dl.config["logger"].error(f"[ERROR] {future.exception()}")
+		if watermarks: finish_sync(watermarks)
+
+	def enqueue(resolved):
+		added = queue.put(resolved)
+		print(f"[QUEUE] {added} episodes added to {queue.path}: " + ", ".join(
+			f"{count} {state}" for state, count in queue.counts().items()
+		))
+
+	if config.get("coordinate"):
+		# the coordinator resolves and queues, the workers download
+		download = enqueue
+	if worker:
+		worker.start()
+
+	if config.get("dry_run"):
+		# nothing is downloaded, so the preview can print the entries as they are resolved
+		dl.stdout(entry for entry, _ in (pipeline.collect(resolved) if hasattr(resolved, "__aiter__") else resolved))
+	elif config.get("yes") or worker:
+		download(resolved)
+	else:
+		resolved = pipeline.collect(resolved)
+		if watermarks and not resolved:
+			# nothing new to confirm
+			finish_sync(watermarks)
+		else:
+			dl.stdout(entry for entry, _ in resolved)
+			proceed = input("Do you want to proceed with your download (y/n)")
+			if proceed.lower() == "y":
+				download(resolved)
+			else:
+				print(f"[EXITED]")
+	if postprocessor: postprocessor.close()
+	subtitles.close()
+	if worker:
+		worker.close()
+		print(worker.report())
+	if queue: queue.close()
+
+	failures = dead_letters.report(only_added = True)
+	savings = tracks.report()
+	if savings: print(savings)
+	if staging: print(staging.report())
+	if failures: report_failures(dead_letters, failures)
+
+	if (config.get("progress") or {}).get("file"):
+		progress.stream.close()
+
+	if tracer.enabled:
+		print(tracer.report((config.get("trace") or {}).get("slowest", 5)))
+		if config["trace"].get("file"):
+			tracer.chrome_trace(config["trace"]["file"])
+
+	dl.config["logger"].info(f"[BANDWIDTH] {governor.total_bytes / 1024 ** 2:.1f} MiB downloaded")
+	dl.config["logger"].info(f"[RETRY] {dl.retry.retries} retried stages")
+
+	if scaler:
+		dl.config["logger"].info(
+			f"[AUTOSCALE] {len(scaler.decisions)} scaling decisions, peak of {scaler.peak_workers} workers"
+		)
+
+	if fragment_pool:
+		dl.config["logger"].info(f"[FRAGMENTS] peak of {fragment_pool.peak_in_flight} fragments in flight")
+		fragment_pool.close()
+
+	if journal:
+		journal.compact()
+		journal.close()
+
+	if watermarks:
+		watermarks.close()
+
+	if index:
+		dl.config["logger"].info(f"[INDEX] {index.hits} episodes already in the library")
+		index.close()
+
+	if cache:
+		dl.config["logger"].info(f"[CACHE] {cache.hits} hits, {cache.misses} misses")
+		cache.close()
+
+def serve(config, pool_class: type = SessionPool) -> None:
+	"""
+	`crunchy serve`: keeps one logged-in session and its worker pools running and takes
+	jobs over a local API until interrupted. Progress goes to `/events` instead of the terminal.
+	"""
+	options = config.get("serve") or {}
+	events = EventStream()
+	cache = build_cache(config)
+	journal = build_journal(config)
+	fragment_pool = build_fragment_pool(config)
+	governor = build_governor(config)
+	progress = ProgressAggregator("json", events, (config.get("progress") or {}).get("interval", 0.5))
+	postprocessor = build_postprocessor(config)
+	index = build_index(config)
+	tracks = TrackStats()
+	subtitles = build_subtitles(config, tracks)
+	dl = Downloader(
+		config, pool_class=pool_class, cache=cache, journal=journal, fragment_pool=fragment_pool,
+		governor=governor, progress=progress, postprocessor=postprocessor, index=index,
+		retry=build_retry(config), dead_letters=build_dead_letters(config), subtitles=subtitles, tracks=tracks,
+		staging=build_staging(config)
+	)
+	episode_ie = AnimeEpisode(config, dl.pool, cache, index=index, tracks=tracks)
+	show_ie = AnimeShow(config, dl.pool, cache, tracks=tracks)
+	daemon = Daemon(
+		dl, {"series": show_ie.extract_info, "episode": episode_ie.extract_info}, events,
+		extract_workers = config.get("extract_threads") or config["threads"],
+		download_workers = config.get("download_threads") or config["threads"],
+		on_queued = lambda entry, args: queue_entry(dl, journal, entry, args),
+		done = lambda episode_id: bool((journal and journal.is_done(episode_id)) or (index and index.has(episode_id)))
+	)
+	# the daemon hears about every finished episode, as a queue worker would
+	dl.worker = daemon
+
+	def parse(document: Dict[str, ...]) -> Tuple[str, Dict[str, ...]]:
+		kind, entry = parse_job(document)
+		return kind, with_tracks(entry)
+
+	server = build_server(
+		daemon, parse, options.get("socket"), options.get("host", DEFAULT_HOST), options.get("port", DEFAULT_PORT),
+		log = dl.config["logger"].info
+	)
+	daemon.warm(lambda: dl.pool.extractor(yt_dlp.extractor.crunchyroll.CrunchyrollBetaIE))
+	# serve_forever() returns once shutdown() is called from another thread
+	signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+	where = options.get("socket") or "http://%s:%d" % server.server_address[:2]
+	print(f"[SERVE] Listening on {where} (pid {os.getpid()})", flush=True)
+	progress.start()
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		daemon.close()
+		if postprocessor: postprocessor.close()
+		subtitles.close()
+		progress.stop()
+		if fragment_pool: fragment_pool.close()
+		if journal:
+			journal.compact()
+			journal.close()
+		if index: index.close()
+		if cache: cache.close()
+	print(f"[SERVE] Stopped after {sum(daemon.status()['jobs'].values())} jobs")
 
-def validate_user_metadata(config_data: str) -> Dict[str, ...]:
-	config_data = yaml.load(config_data, Loader=yaml.FullLoader)
-	config_validator = Validator(CONFIG_SCHEMA)
-	is_valid = config_validator.validate(config_data, CONFIG_SCHEMA)
-	if not is_valid:
-		raise DocumentError(config_validator.errors)
-	
-	return (True, config_validator.normalized(config_data))
-	
 def get_user_agent() -> str:
 	"""
 	Determines the user agent string for the current platform.
@@ -247,6 +1083,8 @@ def validate_user_credentials(username: str, password: str) -> bool:
 		'User-Agent': get_user_agent(),	
 		'Connection':'keep-alive'
 	}
+	import cfscrape
+
 	session = cfscrape.create_scraper()
 	page_fetch = session.get('http://www.crunchyroll.com/login', headers=headers)
 	print(page_fetch)
@@ -274,114 +1112,5 @@ def validate_user_credentials(username: str, password: str) -> bool:
 		print("[ERROR] Login Failed, Try again later")
 		return False
 
-def validate_series_url(url: str) -> bool:
-	valid_url = r'https?://beta\.crunchyroll\.com/((?:\w{1,2}/)?)series/(\w+)/([\w\-]*)/?(?:\?|$)'
-	validity = re.match(valid_url, url)
-	if not validity:
-		return False
-	return True
-
-def validate_episode_url(url: str) -> bool:
-	valid_url = r'https?://beta\.crunchyroll\.com/((?:\w{1,2}/)?)watch/(\w+)/([\w\-]*)/?(?:\?|$)'
-	validity = re.match(valid_url, url)
-	if not validity:	
-		return False
-	return True
-
-def thread_input_type(threads: str) -> int:
-	try:
-		threads = int(threads)
-	except:
-		raise argparse.ArgumentTypeError(f"Expected Positive integer, received {threads}")
-	
-	if threads < 1 or threads > 10:
-		raise argparse.ArgumentTypeError(f"Expected integer between (1 - 10), receievd {threads}")
-	
-	return threads
-
-def destination_path_type(destination: str) -> str:
-	if not os.path.exists(destination):
-		raise argparse.ArgumentTypeError("This path does not exist, please enter valid path")
-	return destination
-
-def argument_parsing(argv: Optional[Sequence[str]]) -> Tuple[argparse.Namespace, List[str, ...]]:
-	parser = argparse.ArgumentParser()
-	parser.add_argument("-v", "--version", help="crunchy_dl version", action="store_true")
-	sub_parsers = parser.add_subparsers(dest="action")
-	print(parser.parse_known_args(argv)[0])
-	if parser.parse_known_args(argv)[0].version:
-		return parser.parse_known_args(argv)	
-	
-	sub_parsers.required = True
-	
-	episode_parser = sub_parsers.add_parser('episode', help="Download Single Anime Episode")
-	series_parser = sub_parsers.add_parser('series', help="Download Anime Series")
-	config_parser = sub_parsers.add_parser('config', help="Specify MetaData in separate config file")
-
-	for sub_parser in (episode_parser, series_parser):
-		sub_parser.add_argument('-u', '--username', help="Valid CrunchyRoll Username", required=True)
-		sub_parser.add_argument('-p', '--password', help="Valid CrunchyRoll Password", required=True)
-		sub_parser.add_argument('-l', '--url', help="Valid CrunchyRoll Series/Episode Link", required=True)
-		sub_parser.add_argument(
-			'-t', '--threads', type=thread_input_type, default = 5,
-			help="Number of threads to utilize (1 - 10)"
-		)		
-		sub_parser.add_argument(
-			'-d', '--destination', type=destination_path_type, default = os.getcwd(), 
-			help="Destination of where to save downloads"
-		)	
-		sub_parser.add_argument('-v', '--verbose', action='store_true', help="Verbosity of Downloader Output")		
-		sub_parser.add_argument('-f', '--ffmpeg', help="Location of ffmpeg on machine", required=True)
-
-	series_parser.add_argument(
-		'-r', "--range",
-		type=series_episode_range_type, default=(1, 1),
-		help="Range of episodes to download from series"
-	)
-
-	series_parser.add_argument('-s', "--season", type=positive_int_type, default=1, help="Specify Season of Series")
-	config_parser.add_argument("config_file", help="Path to config file containing metadata")
-	
-	return parser.parse_known_args(argv)
-
-def main(argv: Optional[Sequence[str]] = None) -> int:
-	args, yt_dlp_args  = argument_parsing(argv)
-
-	if args.version:
-		print(__version__)
-		return 0
-	
-	if args.action == "config":
-		with open(args.config_file) as f:
-			config_data = validate_user_metadata(f.read())[1]
-	else:
-		config_data = {}
-		config_data["username"] = args.username
-		config_data["password"] = args.password
-		config_data["ffmpeg_location"] = args.ffmpeg
-		config_data["destination"] = args.destination
-		config_data["threads"] = args.threads or 5
-		config_data["verbosity"] = args.verbosity
-		if args.action == "series":
-			config_data["download"] = {
-				'series': [{ 	
-					"url": args.url,
-					"season": args.season,
-					"start": args.range[0],
-					"end": args.range[1],
-					"args": yt_dlp_args
-				}]
-			}
-		else:
-			config_data["download"] = {
-				"episodes": [{
-					"url": args.url,
-					"args": yt_dlp_args
-				}]
-			}			
-		
-	session(config_data)
-	return 0
-
 if __name__ == "__main__":
 	raise SystemExit(main())
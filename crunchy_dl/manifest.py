@@ -0,0 +1,114 @@
+from __future__ import annotations
+import glob
+import os
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import yaml
+from cerberus import DocumentError
+
+from .pool import args_key
+from .schema import config_validator
+from .urls import content_id
+
+# sections every file adds to; any other top-level key is a setting of the whole run
+ENTRY_SECTIONS = ("series", "episodes")
+
+def expand(pattern: str, base: str) -> List[str]:
+	"""
+	Config files named by a path or glob pattern, relative ones resolved against `base`.
+	"""
+	path = os.path.join(base, os.path.expanduser(pattern))
+	if not glob.has_magic(path):
+		if not os.path.isfile(path): raise DocumentError(f"Config file {pattern} does not exist")
+		return [path]
+	matches = sorted(match for match in glob.glob(path, recursive=True) if os.path.isfile(match))
+	if not matches: raise DocumentError(f"{pattern} matches no config files")
+	return matches
+
+def walk(patterns: List[str], parse: Callable[[str], Optional[Dict[str, Any]]]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+	"""
+	Every file named on the command line followed, depth first, by the files it `include`s;
+	includes are relative to the including file. A file reached twice is read once.
+	`parse` returns a file's validated document, or None to not follow its includes.
+	"""
+	files = []
+	seen = set()
+
+	def visit(path: str, parents: frozenset) -> None:
+		real = os.path.realpath(path)
+		if real in parents: raise DocumentError(f"{path} includes itself")
+		if real in seen: return
+		seen.add(real)
+		document = parse(path)
+		files.append((path, document))
+		for pattern in (document or {}).get("include") or []:
+			for match in expand(pattern, os.path.dirname(path)):
+				visit(match, parents | {real})
+
+	for pattern in patterns:
+		for match in expand(pattern, os.getcwd()):
+			visit(match, frozenset())
+	return files
+
+def read(path: str) -> Dict[str, Any]:
+	with open(path, encoding="utf-8") as f:
+		document = yaml.load(f, Loader=yaml.FullLoader) or {}
+	validator = config_validator(manifest=True)
+	if not validator.validate(document):
+		raise DocumentError({path: validator.errors})
+	return validator.document
+
+def merge(files: List[Tuple[str, Dict[str, Any]]]) -> Tuple[Dict[str, Any], List[Tuple[str, str]]]:
+	"""
+	One config from several: each setting comes from the first file that has it, and the
+	download entries of every file are concatenated, each tagged with its `source` file.
+	:returns: tuple -- (merged config, (file, warning) for each setting that was ignored)
+	"""
+	config = {}
+	origin = {}
+	download = {section: [] for section in ENTRY_SECTIONS}
+	warnings = []
+	for path, document in files:
+		for key, value in document.items():
+			if key in ("download", "include"): continue
+			if key not in config:
+				config[key], origin[key] = value, path
+			elif config[key] != value:
+				warnings.append((path, f"{key} is already set by {origin[key]}, this value is ignored"))
+		for section in ENTRY_SECTIONS:
+			entries = (document.get("download") or {}).get(section) or []
+			download[section].extend({"source": path, **entry} for entry in entries)
+	config["download"] = {section: entries for section, entries in download.items() if entries}
+	return config, warnings
+
+def distinct_episodes(episodes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+	"""
+	Drops an episode listed again (by any URL form) with the same args; the first listing stays.
+	"""
+	seen = set()
+	kept = []
+	for episode in episodes:
+		key = (content_id(episode["url"]), args_key(episode.get("args")))
+		if key in seen: continue
+		seen.add(key)
+		kept.append(episode)
+	return kept
+
+def load_manifest(patterns: List[str]) -> Tuple[Dict[str, Any], List[Tuple[str, str]]]:
+	"""
+	Reads, merges and validates the config files of one run.
+	:returns: tuple -- (normalized config, (file, warning) pairs)
+	"""
+	config, warnings = merge(walk(patterns, read))
+	validator = config_validator()
+	if not validator.validate(config):
+		raise DocumentError(validator.errors)
+	config = validator.document
+	if "episodes" in config["download"]:
+		config["download"]["episodes"] = distinct_episodes(config["download"]["episodes"])
+	return config, warnings
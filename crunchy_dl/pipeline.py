@@ -0,0 +1,176 @@
+from __future__ import annotations
+import collections
+import concurrent.futures
+import itertools
+import threading
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from .autoscale import AutoScaler
+
+Entry = Dict[str, Any]
+Job = Tuple[Callable[[Dict[str, Any], Any], Tuple[List[Entry], Any]], Dict[str, Any], Any]
+
+def round_robin(items: Iterable[Any], key: Callable[[Any], Any]) -> List[Any]:
+	"""
+	Interleaves items one group at a time: a, b, c, a, b, a, ...
+	"""
+	groups = {}
+	for item in items:
+		groups.setdefault(key(item), []).append(item)
+	missing = object()
+	return [
+		item for batch in itertools.zip_longest(*groups.values(), fillvalue = missing)
+		for item in batch if item is not missing
+	]
+
+class FairQueue:
+	"""
+	Hands resolved episodes to the download pool round-robin across their `source` (the
+	config file they came from). Only `window` of them sit in the pool at a time, so a file
+	that resolves late still gets its share of the workers instead of queueing behind the rest.
+	"""
+	def __init__(self, submit: Callable[[Entry, Any], concurrent.futures.Future], window: int) -> None:
+		self.submit = submit
+		self.window = window
+		self.futures = []
+		self._in_flight = 0
+		self._handing = 0
+		self._dispatching = False
+		self._queues = collections.OrderedDict()
+		self._condition = threading.Condition()
+
+	def put(self, entry: Entry, args: Any) -> None:
+		with self._condition:
+			self._queues.setdefault(entry.get("source"), collections.deque()).append((entry, args))
+		self._dispatch()
+
+	def _dispatch(self) -> None:
+		with self._condition:
+			# one loop hands out at a time; a future that is already done calls back into
+			# _done right away, and that call leaves the next episode to the running loop
+			if self._dispatching: return
+			self._dispatching = True
+		while True:
+			with self._condition:
+				if self._in_flight >= self.window or not self._queues:
+					self._dispatching = False
+					return
+				# take from the source at the front and move it to the back
+				source, queue = self._queues.popitem(last = False)
+				entry, args = queue.popleft()
+				if queue: self._queues[source] = queue
+				self._in_flight += 1
+				self._handing += 1
+			try:
+				future = self.submit(entry, args)
+				self.futures.append(future)
+			except BaseException:
+				with self._condition:
+					self._dispatching = False
+				raise
+			finally:
+				with self._condition:
+					self._handing -= 1
+					self._condition.notify_all()
+			future.add_done_callback(self._done)
+
+	def _done(self, future: concurrent.futures.Future) -> None:
+		with self._condition:
+			self._in_flight -= 1
+		self._dispatch()
+
+	def drain(self) -> None:
+		"""
+		Waits until every queued episode has been handed to the pool.
+		"""
+		with self._condition:
+			self._condition.wait_for(lambda: not self._queues and not self._handing)
+
+class Pipeline:
+	"""
+	Producer/consumer scheduler: extraction and downloads run in separately sized pools,
+	and every resolved episode is handed to the download pool as soon as it is known.
+	With a scaler the download pool is sized to its maximum and the scaler decides how
+	many of those workers may download at once. With `fair` downloads go through a
+	FairQueue, sharing the workers between the config files of the run.
+	"""
+	def __init__(
+		self, download: Callable[[str, Any], None],
+		extract_workers: int = 5, download_workers: int = 5, scaler: Optional[AutoScaler] = None,
+		fair: bool = False
+	) -> None:
+		self.download = download
+		self.extract_workers = extract_workers
+		self.download_workers = download_workers
+		self.scaler = scaler
+		self.fair = fair
+		self.submitted = 0
+		self.finished = 0
+		self._lock = threading.Lock()
+
+	@property
+	def depth(self) -> int:
+		with self._lock:
+			return self.submitted - self.finished
+
+	@property
+	def backlog(self) -> int:
+		"""
+		Downloads queued but not yet holding a worker slot.
+		"""
+		return self.depth - (self.scaler.limit.active if self.scaler else 0)
+
+	def _scaled(self, url: str, args: Any) -> None:
+		with self.scaler.slot():
+			self.download(url, args)
+
+	def _finished(self, future: concurrent.futures.Future) -> None:
+		with self._lock:
+			self.finished += 1
+
+	def resolve(self, jobs: Iterable[Job]) -> Iterator[Tuple[Entry, Any]]:
+		with concurrent.futures.ThreadPoolExecutor(max_workers = self.extract_workers) as executor:
+			futures = [executor.submit(extract, meta_data, args) for extract, meta_data, args in jobs]
+			for future in concurrent.futures.as_completed(futures):
+				entries, args = future.result()
+				for entry in entries:
+					yield entry, args
+
+	def collect(self, resolved: Iterable[Tuple[Entry, Any]]) -> List[Tuple[Entry, Any]]:
+		return list(resolved)
+
+	def run(
+		self, resolved: Iterable[Tuple[Entry, Any]],
+		on_queued: Optional[Callable[[Entry, Any], None]] = None
+	) -> List[concurrent.futures.Future]:
+		futures = []
+		download = self._scaled if self.scaler else self.download
+		workers = self.scaler.max_workers if self.scaler else self.download_workers
+		if self.scaler: self.scaler.start(lambda: self.backlog)
+		try:
+			with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+				def submit(entry: Entry, args: Any) -> concurrent.futures.Future:
+					future = executor.submit(download, entry["url"], args)
+					future.add_done_callback(self._finished)
+					return future
+
+				queue = FairQueue(submit, workers) if self.fair else None
+				for entry, args in resolved:
+					if on_queued: on_queued(entry, args)
+					with self._lock:
+						self.submitted += 1
+					if queue: queue.put(entry, args)
+					else: futures.append(submit(entry, args))
+				if queue:
+					queue.drain()
+					futures = queue.futures
+		finally:
+			if self.scaler: self.scaler.stop()
+		return futures
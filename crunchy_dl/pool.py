@@ -0,0 +1,104 @@
+from __future__ import annotations
+import threading
+from time import monotonic
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from .trace import Tracer, NULL_TRACER
+
+AUTH_ERROR_CODES = (401, 403)
+
+def is_auth_error(error: BaseException) -> bool:
+	cause = getattr(error, "cause", None) or getattr(error, "exc_info", None)
+	if isinstance(cause, tuple): cause = cause[1]
+	return getattr(cause, "code", None) in AUTH_ERROR_CODES
+
+def args_key(args: Optional[List[Any]]) -> str:
+	return repr(args or [])
+
+class SessionPool:
+	"""
+	Logs in once and shares the authenticated cookie state with every worker.
+	Each worker thread keeps its own downloader (and its HTTP connections) per set of args.
+	"""
+	def __init__(
+		self, factory: Callable[[Optional[List[Any]]], Any],
+		username: str, password: str, ttl: Optional[float] = 3600.0,
+		on_invalidate: Optional[Callable[[], None]] = None, tracer: Optional[Tracer] = None
+	) -> None:
+		self.factory = factory
+		self.username = username
+		self.password = password
+		self.ttl = ttl
+		self.on_invalidate = on_invalidate
+		self.tracer = tracer or NULL_TRACER
+		self.logins = 0
+		self._lock = threading.Lock()
+		self._local = threading.local()
+		self._cookies = []
+		self._generation = 0
+		self._logged_in_at = None
+
+	@property
+	def expired(self) -> bool:
+		if self._logged_in_at is None: return True
+		return self.ttl is not None and monotonic() - self._logged_in_at >= self.ttl
+
+	def _workers(self) -> Dict[str, List[Any]]:
+		if not hasattr(self._local, "downloaders"):
+			self._local.downloaders = {}
+		return self._local.downloaders
+
+	def _sync_cookies(self, entry: List[Any]) -> None:
+		downloader, generation = entry
+		if generation == self._generation: return
+		jar = getattr(downloader, "cookiejar", None)
+		if jar is not None:
+			for cookie in self._cookies: jar.set_cookie(cookie)
+		entry[1] = self._generation
+
+	def downloader(self, args: Optional[List[Any]] = None) -> Any:
+		workers = self._workers()
+		key = args_key(args)
+		if key not in workers:
+			workers[key] = [self.factory(args), -1]
+		self._sync_cookies(workers[key])
+		return workers[key][0]
+
+	def login(self, extractor: Any) -> None:
+		with self._lock:
+			if self.expired:
+				jar = getattr(extractor._downloader, "cookiejar", None)
+				if self.logins and jar is not None: jar.clear()
+				with self.tracer.span("login"):
+					extractor._perform_login(self.username, self.password)
+				self._cookies = list(jar) if jar is not None else []
+				self._generation += 1
+				self._logged_in_at = monotonic()
+				self.logins += 1
+		for entry in self._workers().values():
+			if entry[0] is extractor._downloader: self._sync_cookies(entry)
+
+	def invalidate(self) -> None:
+		with self._lock:
+			self._logged_in_at = None
+			if self.on_invalidate: self.on_invalidate()
+
+	def extractor(self, ie_class: Callable[[Any], Any], args: Optional[List[Any]] = None) -> Any:
+		extractor = ie_class(self.downloader(args))
+		self.login(extractor)
+		return extractor
+
+	def run(self, ie_class: Callable[[Any], Any], func: Callable[[Any], Any], args: Optional[List[Any]] = None) -> Any:
+		try:
+			return func(self.extractor(ie_class, args))
+		except Exception as error:
+			if not is_auth_error(error): raise
+			self.invalidate()
+			return func(self.extractor(ie_class, args))
+
+	def extract(self, ie_class: Callable[[Any], Any], url: str, args: Optional[List[Any]] = None) -> Dict[str, Any]:
+		return self.run(ie_class, lambda extractor: extractor._real_extract(url), args)
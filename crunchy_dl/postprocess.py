@@ -0,0 +1,95 @@
+from __future__ import annotations
+import concurrent.futures
+import multiprocessing
+import os
+import subprocess
+import threading
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+SUPPORTED_EXTS = ("mp4", "mov", "m4a", "webm", "mkv", "mka")
+MP4_EXTS = ("mp4", "mov", "m4a")
+
+def ffmpeg_binary(ffmpeg_location: Optional[str]) -> str:
+	if not ffmpeg_location: return "ffmpeg"
+	if os.path.isdir(ffmpeg_location): return os.path.join(ffmpeg_location, "ffmpeg")
+	return ffmpeg_location
+
+def embed_subtitles(
+	ffmpeg_location: Optional[str], filename: str, subtitles: List[Tuple[str, str]], keep: bool = False
+) -> str:
+	"""
+	Muxes subtitle files into `filename` in place, like yt-dlp's FFmpegEmbedSubtitle.
+	Runs in a worker process of PostProcessPool, so it only takes plain arguments.
+	:returns: str -- Path of the muxed file
+	"""
+	base, ext = os.path.splitext(filename)
+	ext = ext.lstrip(".")
+	temp_filename = f"{base}.temp.{ext}"
+	command = [ffmpeg_binary(ffmpeg_location), "-y", "-loglevel", "error", "-i", filename]
+	for _, path in subtitles:
+		command += ["-i", path]
+	command += ["-map", "0", "-dn", "-ignore_unknown", "-c", "copy", "-map", "-0:s"]
+	if ext in MP4_EXTS:
+		command += ["-c:s", "mov_text"]
+	elif ext == "webm":
+		command += ["-c:s", "webvtt"]
+	for index, (lang, _) in enumerate(subtitles):
+		command += ["-map", f"{index + 1}:0", f"-metadata:s:s:{index}", f"language={lang}"]
+	command.append(temp_filename)
+	subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+	os.replace(temp_filename, filename)
+	if not keep:
+		for _, path in subtitles:
+			if os.path.exists(path): os.remove(path)
+	return filename
+
+class PostProcessPool:
+	"""
+	CPU sized process pool for ffmpeg muxing, fed from the download workers so a
+	download slot is released as soon as the media is on disk. Callbacks run on a
+	thread pool of their own: the executor reports every result on a single thread,
+	which a slow callback (a copy to the destination) would hold up.
+	"""
+	def __init__(self, ffmpeg_location: Optional[str], workers: Optional[int] = None) -> None:
+		self.ffmpeg_location = ffmpeg_location
+		self.workers = workers or os.cpu_count() or 1
+		self.submitted = 0
+		self.completed = 0
+		self.failed = 0
+		self._lock = threading.Lock()
+		# spawn rather than fork: the parent is full of download threads
+		self._executor = concurrent.futures.ProcessPoolExecutor(
+			max_workers = self.workers, mp_context = multiprocessing.get_context("spawn")
+		)
+		self._callbacks = concurrent.futures.ThreadPoolExecutor(max_workers = self.workers, thread_name_prefix = "mux-done")
+
+	@property
+	def depth(self) -> int:
+		with self._lock:
+			return self.submitted - self.completed - self.failed
+
+	def submit(
+		self, filename: str, subtitles: List[Tuple[str, str]],
+		callback: Optional[Callable[[Optional[BaseException]], None]] = None
+	) -> concurrent.futures.Future:
+		with self._lock:
+			self.submitted += 1
+		future = self._executor.submit(embed_subtitles, self.ffmpeg_location, filename, subtitles)
+
+		def done(future: concurrent.futures.Future) -> None:
+			error = future.exception()
+			with self._lock:
+				if error: self.failed += 1
+				else: self.completed += 1
+			if callback: self._callbacks.submit(callback, error)
+
+		future.add_done_callback(done)
+		return future
+
+	def close(self) -> None:
+		self._executor.shutdown(wait=True)
+		# every result has been handed over once the processes are done
+		self._callbacks.shutdown(wait=True)
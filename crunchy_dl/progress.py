@@ -0,0 +1,219 @@
+from __future__ import annotations
+import json
+import queue
+import sys
+import threading
+from time import monotonic
+from time import time
+from typing import Any
+from typing import Dict
+from typing import IO
+from typing import List
+from typing import Optional
+
+FORMATS = ("text", "json", "none")
+TERMINAL_STATES = ("done", "failed", "cancelled")
+
+def format_bytes(size: float) -> str:
+	for unit in ("B", "KiB", "MiB", "GiB"):
+		if abs(size) < 1024 or unit == "GiB": break
+		size /= 1024
+	return f"{size:.1f}{unit}"
+
+def format_eta(seconds: Optional[float]) -> str:
+	if seconds is None: return "--:--"
+	minutes, seconds = divmod(int(seconds), 60)
+	hours, minutes = divmod(minutes, 60)
+	return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+class EpisodeProgress:
+	__slots__ = ("id", "title", "state", "files", "speeds", "changed", "updated")
+
+	def __init__(self, episode_id: str, title: str = "") -> None:
+		self.id = episode_id
+		self.title = title
+		self.state = "queued"
+		self.files = {}
+		self.speeds = {}
+		self.changed = True
+		self.updated = monotonic()
+
+	@property
+	def downloaded_bytes(self) -> int:
+		return sum(done for done, _ in self.files.values())
+
+	@property
+	def total_bytes(self) -> Optional[int]:
+		totals = [total for _, total in self.files.values()]
+		return sum(totals) if totals and None not in totals else None
+
+	@property
+	def speed(self) -> float:
+		return sum(self.speeds.values()) if self.state == "downloading" else 0.0
+
+	@property
+	def eta(self) -> Optional[float]:
+		total, speed = self.total_bytes, self.speed
+		if total is None or not speed: return None
+		return max(total - self.downloaded_bytes, 0) / speed
+
+	def as_dict(self) -> Dict[str, Any]:
+		return {
+			"id": self.id, "title": self.title, "state": self.state,
+			"downloaded_bytes": self.downloaded_bytes, "total_bytes": self.total_bytes,
+			"speed": self.speed, "eta": self.eta,
+		}
+
+class ProgressAggregator:
+	"""
+	Collects progress events from every worker on a queue and folds them into
+	per-episode state on a single render thread, redrawn every `interval` seconds.
+	Workers only ever put onto the queue, so hooks never contend on a lock.
+	"""
+	def __init__(
+		self, output: str = "text", stream: Optional[IO[str]] = None,
+		interval: float = 0.5, max_lines: int = 10
+	) -> None:
+		if output not in FORMATS:
+			raise ValueError(f"Unknown progress output {output}, expected one of {FORMATS}")
+		self.output = output
+		self.stream = stream or sys.stdout
+		self.interval = interval
+		self.max_lines = max_lines
+		self.episodes = {}
+		self._events = queue.SimpleQueue()
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, name="progress", daemon=True)
+		self._drawn = 0
+		self.gauges = {}
+		self._queues = {}
+
+	def queued(self, episode_id: str, title: str = "") -> None:
+		self._events.put(("queued", episode_id, title))
+
+	def state(self, episode_id: str, state: str) -> None:
+		self._events.put(("state", episode_id, state))
+
+	def hook(self, status: Dict[str, Any]) -> None:
+		info = status.get("info_dict") or {}
+		self._events.put((
+			"progress", info.get("id"), status["status"], status.get("tmpfilename") or status.get("filename"),
+			status.get("downloaded_bytes") or 0, status.get("total_bytes") or status.get("total_bytes_estimate"),
+			status.get("speed") or 0.0,
+		))
+
+	def postprocessor_hook(self, status: Dict[str, Any]) -> None:
+		if status["status"] == "started":
+			self.state((status.get("info_dict") or {}).get("id"), "muxing")
+
+	def _episode(self, episode_id: str) -> EpisodeProgress:
+		if episode_id not in self.episodes:
+			self.episodes[episode_id] = EpisodeProgress(episode_id)
+		return self.episodes[episode_id]
+
+	def drain(self) -> None:
+		while True:
+			try:
+				event = self._events.get_nowait()
+			except queue.Empty:
+				return
+			kind, episode_id = event[0], event[1]
+			if episode_id is None: continue
+			episode = self._episode(episode_id)
+			if kind == "queued":
+				episode.title = event[2] or episode.title
+			elif kind == "state":
+				episode.state = event[2]
+			else:
+				_, _, status, filename, done, total, speed = event
+				if episode.state not in TERMINAL_STATES + ("muxing",):
+					episode.state = "downloading"
+				if status == "finished" and total: done = total
+				episode.files[filename] = (done, total)
+				episode.speeds[filename] = speed if status == "downloading" else 0.0
+			episode.changed = True
+			episode.updated = monotonic()
+
+	def counts(self) -> Dict[str, int]:
+		counts = {}
+		for episode in self.episodes.values():
+			counts[episode.state] = counts.get(episode.state, 0) + 1
+		return counts
+
+	def summary(self) -> Dict[str, Any]:
+		episodes = list(self.episodes.values())
+		return {
+			"episodes": len(episodes), "states": self.counts(),
+			"downloaded_bytes": sum(e.downloaded_bytes for e in episodes),
+			"speed": sum(e.speed for e in episodes),
+			"queues": {name: gauge() for name, gauge in self.gauges.items()},
+		}
+
+	def _lines(self) -> List[str]:
+		summary = self.summary()
+		states = summary["states"]
+		lines = [
+			f"[{states.get('done', 0)}/{summary['episodes']} done, {states.get('failed', 0)} failed] "
+			f"{format_bytes(summary['downloaded_bytes'])} at {format_bytes(summary['speed'])}/s"
+			+ "".join(f" | {name} {depth}" for name, depth in summary["queues"].items())
+		]
+		active = [e for e in self.episodes.values() if e.state in ("downloading", "muxing")]
+		for episode in sorted(active, key=lambda e: e.id)[:self.max_lines]:
+			total = episode.total_bytes
+			percent = f"{100 * episode.downloaded_bytes / total:5.1f}%" if total else "  ?  %"
+			lines.append(
+				f"  {episode.state:11} {percent} {format_bytes(episode.speed):>9}/s "
+				f"ETA {format_eta(episode.eta)} {episode.title or episode.id}"[:160]
+			)
+		if len(active) > self.max_lines:
+			lines.append(f"  ... {len(active) - self.max_lines} more")
+		return lines
+
+	def render(self) -> None:
+		self.drain()
+		if self.output == "json":
+			now = time()
+			queues = {name: gauge() for name, gauge in self.gauges.items()}
+			if queues != self._queues:
+				self.stream.write(json.dumps({"ts": now, "queues": queues}) + "\n")
+				self._queues = queues
+			for episode in self.episodes.values():
+				if not episode.changed: continue
+				self.stream.write(json.dumps({"ts": now, **episode.as_dict()}) + "\n")
+				episode.changed = False
+			self.stream.flush()
+		elif self.output == "text" and not self.stream.isatty():
+			for episode in self.episodes.values():
+				if episode.changed and episode.state in ("queued",) + TERMINAL_STATES:
+					self.stream.write(f"[{episode.state.upper()}] {episode.title or episode.id}\n")
+				episode.changed = False
+			self.stream.flush()
+		elif self.output == "text":
+			lines = self._lines()
+			if self._drawn: self.stream.write(f"\x1b[{self._drawn}F")
+			for line in lines: self.stream.write(f"\x1b[2K{line}\n")
+			for _ in range(self._drawn - len(lines)): self.stream.write("\x1b[2K\n")
+			self._drawn = max(self._drawn, len(lines))
+			self.stream.flush()
+
+	def _run(self) -> None:
+		while not self._stop.wait(self.interval):
+			self.render()
+
+	def start(self) -> ProgressAggregator:
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		self._stop.set()
+		if self._thread.is_alive(): self._thread.join()
+		self.render()
+		if self.output == "json":
+			self.stream.write(json.dumps({"ts": time(), "summary": self.summary()}) + "\n")
+			self.stream.flush()
+
+	def __enter__(self) -> ProgressAggregator:
+		return self.start()
+
+	def __exit__(self, *exc) -> None:
+		self.stop()
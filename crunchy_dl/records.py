@@ -0,0 +1,55 @@
+from __future__ import annotations
+import itertools
+from collections.abc import Mapping
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+
+# everything the queue, the journal, the preview and the schedulers read of an episode
+RECORD_FIELDS = (
+	"id", "url", "title", "season_number", "episode_number", "series_id", "audio_locale", "priority", "source"
+)
+PREVIEW_PAGE = 50
+
+class EpisodeRecord(Mapping):
+	"""
+	An extracted episode reduced to RECORD_FIELDS, in slots instead of a dict. A batch of
+	thousands keeps these rather than yt-dlp info dicts (formats, thumbnails, subtitle
+	maps); the full info is extracted again when the episode is downloaded.
+	It reads like the info dict it came from, fields that are None are absent.
+	"""
+	__slots__ = RECORD_FIELDS
+
+	def __init__(self, **fields: Any) -> None:
+		for field in RECORD_FIELDS:
+			setattr(self, field, fields.get(field))
+
+	@classmethod
+	def from_info(cls, info: Dict[str, Any], **fields: Any) -> EpisodeRecord:
+		return cls(**{**{field: info.get(field) for field in RECORD_FIELDS}, **fields})
+
+	def __getitem__(self, key: str) -> Any:
+		value = getattr(self, key) if key in RECORD_FIELDS else None
+		if value is None: raise KeyError(key)
+		return value
+
+	def __iter__(self) -> Iterator[str]:
+		return (field for field in RECORD_FIELDS if getattr(self, field) is not None)
+
+	def __len__(self) -> int:
+		return sum(1 for _ in self)
+
+	def __repr__(self) -> str:
+		return f"EpisodeRecord({dict(self)!r})"
+
+def pages(items: Iterable[Any], size: int = PREVIEW_PAGE) -> Iterator[List[Any]]:
+	"""
+	`items` in lists of `size`, taken from the iterable as each list is needed.
+	"""
+	items = iter(items)
+	while True:
+		page = list(itertools.islice(items, size))
+		if not page: return
+		yield page
@@ -0,0 +1,178 @@
+from __future__ import annotations
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import threading
+from time import sleep
+from time import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import yt_dlp.utils
+from .pool import AUTH_ERROR_CODES
+
+DEFAULT_DEAD_LETTER_PATH = os.path.join(os.path.expanduser("~"), ".cache", "crunchy_dl", "dead_letter.json")
+
+NETWORK = "network"
+AUTH = "auth"
+UNAVAILABLE = "unavailable"
+POSTPROCESS = "postprocess"
+UNKNOWN = "unknown"
+CANCELLED = "cancelled"
+RETRYABLE = (NETWORK, AUTH)
+
+TRANSIENT_STATUS = (408, 425, 429, 500, 502, 503, 504)
+UNAVAILABLE_STATUS = (404, 410, 451)
+UNAVAILABLE_MESSAGES = ("not available", "geo restrict", "premium", "unavailable in your", "no video formats")
+
+def backoff_delay(attempt: int, base: float, cap: float = 30.0) -> float:
+	"""
+	Full-jitter exponential backoff: uniform in [0, min(cap, base * 2 ** attempt)], so
+	workers that failed together do not retry together.
+	"""
+	return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def causes(error: BaseException) -> List[BaseException]:
+	"""
+	The error and what it wraps: yt-dlp keeps the original in `exc_info` or `cause`.
+	"""
+	chain = []
+	while error is not None and error not in chain and len(chain) < 8:
+		chain.append(error)
+		wrapped = getattr(error, "exc_info", None)
+		wrapped = wrapped[1] if isinstance(wrapped, tuple) else None
+		error = wrapped or getattr(error, "cause", None) or error.__cause__ or error.__context__
+		if not isinstance(error, BaseException): error = None
+	return chain
+
+class Cancelled(Exception):
+	"""
+	Raised from a progress hook to stop an episode that was cancelled while downloading.
+	"""
+
+def classify(error: BaseException) -> str:
+	chain = causes(error)
+	if any(isinstance(cause, Cancelled) for cause in chain): return CANCELLED
+	for cause in chain:
+		status = getattr(cause, "code", None) or getattr(cause, "status", None)
+		if status in AUTH_ERROR_CODES: return AUTH
+		if status in UNAVAILABLE_STATUS: return UNAVAILABLE
+		if status in TRANSIENT_STATUS: return NETWORK
+		if isinstance(cause, yt_dlp.utils.GeoRestrictedError): return UNAVAILABLE
+		if isinstance(cause, (yt_dlp.utils.PostProcessingError, subprocess.CalledProcessError)): return POSTPROCESS
+	for cause in chain:
+		if isinstance(cause, (
+			ConnectionError, TimeoutError, socket.timeout, http.client.IncompleteRead,
+			yt_dlp.utils.ContentTooShortError
+		)): return NETWORK
+		if isinstance(cause, OSError) and type(cause).__name__ in ("URLError", "ClientConnectionError", "ClientPayloadError"):
+			return NETWORK
+	message = str(error).lower()
+	if any(text in message for text in UNAVAILABLE_MESSAGES): return UNAVAILABLE
+	return UNKNOWN
+
+class StageFailure(Exception):
+	"""
+	A stage that failed for good, either permanently or after its last retry.
+	"""
+	def __init__(self, stage: str, failure: str, error: BaseException, attempts: int) -> None:
+		super().__init__(f"{stage} failed ({failure}) after {attempts} attempt{'s' if attempts > 1 else ''}: {error}")
+		self.stage = stage
+		self.failure = failure
+		self.error = error
+		self.attempts = attempts
+
+class RetryPolicy:
+	"""
+	Retries one stage of an episode (extract, media or mux) while its error classifies as
+	transient. `on_retry(failure)` runs before each wait, e.g. to log in again on auth errors.
+	"""
+	def __init__(
+		self, attempts: int = 3, backoff: float = 1.0, max_backoff: float = 30.0,
+		log: Optional[Callable[[str], None]] = None
+	) -> None:
+		self.attempts = attempts
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.log = log
+		self.retries = 0
+
+	def call(
+		self, stage: str, func: Callable[[], Any], on_retry: Optional[Callable[[str], None]] = None
+	) -> Any:
+		attempt = 0
+		while True:
+			attempt += 1
+			try:
+				return func()
+			except StageFailure:
+				raise
+			except Exception as error:
+				failure = classify(error)
+				if failure not in RETRYABLE or attempt >= self.attempts:
+					# yt-dlp runs its own postprocessors inside the media stage
+					raise StageFailure("mux" if failure == POSTPROCESS else stage, failure, error, attempt) from error
+				delay = backoff_delay(attempt - 1, self.backoff, self.max_backoff)
+				self.retries += 1
+				if self.log: self.log(f"[RETRY] {stage} {failure} error, attempt {attempt + 1} in {delay:.1f}s: {error}")
+				if on_retry: on_retry(failure)
+				sleep(delay)
+
+class DeadLetters:
+	"""
+	Episodes that failed for good, kept in a JSON file so `retry` can queue them again.
+	The file is rewritten atomically on every change; failures are rare enough for that.
+	"""
+	def __init__(self, path: str = DEFAULT_DEAD_LETTER_PATH) -> None:
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		self.path = path
+		self.letters = {}
+		self.added = []
+		self._lock = threading.Lock()
+		if os.path.exists(path):
+			with open(path, encoding="utf-8") as f:
+				self.letters = {letter["id"]: letter for letter in json.load(f)["failures"]}
+
+	def _save(self) -> None:
+		tmp_path = self.path + ".tmp"
+		with open(tmp_path, "w", encoding="utf-8") as f:
+			json.dump({"failures": list(self.letters.values())}, f, indent=2, default=str)
+		os.replace(tmp_path, self.path)
+
+	def add(
+		self, entry: Dict[str, Any], args: Optional[List[Any]], stage: str,
+		failure: str, error: BaseException, attempts: int = 1
+	) -> None:
+		with self._lock:
+			self.letters[entry["id"]] = {
+				"id": entry["id"], "entry": entry, "args": args or [], "stage": stage,
+				"failure": failure, "error": str(error), "attempts": attempts, "ts": time(),
+			}
+			self.added.append(entry["id"])
+			self._save()
+
+	def discard(self, episode_id: str, stage: Optional[str] = None) -> None:
+		"""
+		Forgets a failure, or with `stage` only a failure of that stage.
+		"""
+		with self._lock:
+			letter = self.letters.get(episode_id)
+			if letter is None or (stage and letter["stage"] != stage): return
+			del self.letters[episode_id]
+			self._save()
+
+	def pending(self) -> List[Tuple[Dict[str, Any], List[Any]]]:
+		with self._lock:
+			return [(letter["entry"], letter["args"]) for letter in self.letters.values()]
+
+	def report(self, only_added: bool = False) -> List[Dict[str, Any]]:
+		with self._lock:
+			if only_added: return [self.letters[i] for i in dict.fromkeys(self.added) if i in self.letters]
+			return list(self.letters.values())
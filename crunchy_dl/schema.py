@@ -1,25 +1,31 @@
+import functools
+from typing import Any
 from typing import Dict
-from cerberus import DocumentError
-import re
+from typing import Tuple
+from cerberus import Validator, DocumentError
+from .governor import parse_rate
+from .selection import parse_ranges
+from .autoscale import HARD_CEILING
+from .urls import SERIES_URL, EPISODE_URL
+from .tracks import parse_languages
+from .staging import parse_size
 import os
 
 def required_type(required: bool, data_type: str) -> Dict[str, str]:
 	return {'required': required, 'type': data_type}
 
 def validate_episode_url_schema(field, value, error) -> bool:
-	valid_url = r'https?://beta\.crunchyroll\.com/((?:\w{1,2}/)?)watch/(\w+)/([\w\-]*)/?(?:\?|$)'
-	validity = re.match(valid_url, value)
+	validity = EPISODE_URL.match(value)
 	if not validity:
-		raise DocumentError("Episode URL is invalid")
 		error(field, "Episode URL is invalid")
+		return False
 	return True
 
 def validate_series_url_schema(field, value, error) -> bool:
-	valid_url = r'https?://beta\.crunchyroll\.com/((?:\w{1,2}/)?)series/(\w+)/([\w\-]*)/?(?:\?|$)'
-	validity = re.match(valid_url, value)
+	validity = SERIES_URL.match(value)
 	if not validity:
-		raise DocumentError("Series URL is invalid")
 		error(field, "Series URL is invalid")
+		return False
 	return True
 
 def valid_thread_input(field, value, error) -> bool:
@@ -33,6 +39,46 @@ def valid_thread_input(field, value, error) -> bool:
 		error(field, f"Valid range for number of threads is (1 - 10), received {threads}")
 	return True
 
+def validate_rate(field, value, error) -> bool:
+	try:
+		parse_rate(value)
+	except ValueError as rate_error:
+		error(field, str(rate_error))
+		return False
+	return True
+
+def validate_season_selection(field, value, error) -> bool:
+	try:
+		parse_ranges(value)
+	except ValueError as selection_error:
+		error(field, str(selection_error))
+		return False
+	return True
+
+def validate_episode_selection(field, value, error) -> bool:
+	try:
+		parse_ranges(value, latest=True)
+	except ValueError as selection_error:
+		error(field, str(selection_error))
+		return False
+	return True
+
+def validate_size(field, value, error) -> bool:
+	try:
+		parse_size(value)
+	except ValueError as size_error:
+		error(field, str(size_error))
+		return False
+	return True
+
+def validate_languages(field, value, error) -> bool:
+	try:
+		parse_languages(value)
+	except ValueError as languages_error:
+		error(field, str(languages_error))
+		return False
+	return True
+
 def validate_destination_path(field, value, error) -> bool:
 	if not os.path.exists(value):
 		raise DocumentError("This path does not exist. Enter a vlid path")
@@ -49,6 +95,9 @@ YT_DLP_ARG_SCHEMA = {
 	}
 }
 
+# 'en-US,de-DE', ['ja-JP'], 'all' or 'none'
+LANGUAGES_SCHEMA = { 'type': ['string', 'list'], 'check_with': validate_languages }
+
 EPISODE_SCHEMA = {
 	'url': {
 		'required': True,
@@ -60,7 +109,11 @@ EPISODE_SCHEMA = {
 		'required': False,
 		'schema': YT_DLP_ARG_SCHEMA,
 		'default': []
-	}
+	},
+	'priority': { 'type': 'number', 'min': 0.01, 'default': 1 },
+	'source': { 'type': 'string' },
+	'subtitles': LANGUAGES_SCHEMA,
+	'audio': LANGUAGES_SCHEMA
 }
 
 SERIES_SCHEMA = {
@@ -72,6 +125,12 @@ SERIES_SCHEMA = {
 	'season': { 'type': 'integer', 'default': 1 },
 	'start': { 'type': 'integer', 'default': 1 }, 
 	'end': { 'type': 'integer', 'default': 1 },	
+	'seasons': { 'type': ['integer', 'string', 'list'], 'check_with': validate_season_selection },
+	'episodes': { 'type': ['integer', 'string', 'list'], 'check_with': validate_episode_selection },
+	'priority': { 'type': 'number', 'min': 0.01, 'default': 1 },
+	'source': { 'type': 'string' },
+	'subtitles': LANGUAGES_SCHEMA,
+	'audio': LANGUAGES_SCHEMA,
 	'args': {
         'type': 'list',
         'required': False, 
@@ -90,11 +149,153 @@ CONFIG_SCHEMA = {
 	},
 	'ffmpeg_location': required_type(True, 'string'),
 	'verbosity': { 'type': 'boolean', 'default': False },
+	'subtitles': LANGUAGES_SCHEMA,
+	'audio': LANGUAGES_SCHEMA,
 	'threads': {
 		'required': False,
 		'type': "integer",
+		'default': 5,
 		'check_with': valid_thread_input,
 	},
+	'extract_threads': {
+		'required': False,
+		'type': "integer",
+		'check_with': valid_thread_input,
+	},
+	'engine': { 'type': 'string', 'allowed': ['threads', 'async'], 'default': 'threads' },
+	'concurrency': { 'type': 'integer', 'min': 1, 'max': 1000 },
+	'download_threads': {
+		'required': False,
+		'type': "integer",
+		'check_with': valid_thread_input,
+	},
+	'autoscale': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'enabled': { 'type': 'boolean', 'default': True },
+			'min_workers': { 'type': 'integer', 'min': 1, 'max': HARD_CEILING, 'default': 1 },
+			'max_workers': { 'type': 'integer', 'min': 1, 'max': HARD_CEILING, 'default': 10 },
+			'interval': { 'type': 'number', 'min': 0.1, 'default': 5 },
+			'max_error_rate': { 'type': 'number', 'min': 0, 'max': 1, 'default': 0.2 },
+		}
+	},
+	'retry': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'attempts': { 'type': 'integer', 'min': 1, 'default': 3 },
+			'backoff': { 'type': 'number', 'min': 0, 'default': 1 },
+			'max_backoff': { 'type': 'number', 'min': 0 },
+			'dead_letter': { 'type': 'string' },
+		}
+	},
+	'cache': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'enabled': { 'type': 'boolean', 'default': True },
+			'path': { 'type': 'string' },
+			'ttl': { 'type': 'integer', 'min': 0 },
+			'max_bytes': { 'type': 'integer', 'min': 0 },
+		}
+	},
+	'journal': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'enabled': { 'type': 'boolean', 'default': True },
+			'path': { 'type': 'string' },
+		}
+	},
+	'trace': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'enabled': { 'type': 'boolean', 'default': False },
+			'file': { 'type': 'string' },
+			'slowest': { 'type': 'integer', 'min': 0 },
+		}
+	},
+	'index': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'enabled': { 'type': 'boolean', 'default': True },
+			'path': { 'type': 'string' },
+		}
+	},
+	'queue': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'path': { 'type': 'string' },
+			'lease': { 'type': 'number', 'min': 1 },
+			'heartbeat': { 'type': 'number', 'min': 0.1 },
+			'poll': { 'type': 'number', 'min': 0.1 },
+			'max_attempts': { 'type': 'integer', 'min': 1 },
+			'worker_id': { 'type': 'string' },
+			'follow': { 'type': 'boolean' },
+		}
+	},
+	'staging': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'path': { 'type': 'string' },
+			'reserve': { 'type': ['string', 'number'], 'check_with': validate_size },
+			'default_size': { 'type': ['string', 'number'], 'check_with': validate_size },
+		}
+	},
+	'serve': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'socket': { 'type': 'string' },
+			'host': { 'type': 'string' },
+			'port': { 'type': 'integer', 'min': 0, 'max': 65535 },
+		}
+	},
+	'watermarks': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'path': { 'type': 'string' },
+		}
+	},
+	'bandwidth': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'limit': { 'type': ['string', 'number'], 'check_with': validate_rate },
+			'burst': { 'type': ['string', 'number'], 'check_with': validate_rate },
+		}
+	},
+	'progress': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'format': { 'type': 'string', 'allowed': ['text', 'json', 'none'], 'default': 'text' },
+			'file': { 'type': 'string' },
+			'interval': { 'type': 'number', 'min': 0.05 },
+		}
+	},
+	'postprocess': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'workers': { 'type': 'integer', 'min': 0 },
+		}
+	},
+	'fragments': {
+		'required': False,
+		'type': 'dict',
+		'schema': {
+			'threads': { 'type': 'integer', 'min': 1 },
+			'in_flight': { 'type': 'integer', 'min': 1 },
+			'retries': { 'type': 'integer', 'min': 0 },
+		}
+	},
 	'download': {
 		'required': True,
 		'type': 'dict',
@@ -115,6 +316,11 @@ CONFIG_SCHEMA = {
 			}
 		},
 	},
+	'include': {
+		'required': False,
+		'type': 'list',
+		'schema': { 'type': 'string' }
+	},
 	'history':{
 		'required': False,
 		'type': 'list',
@@ -126,10 +332,72 @@ CONFIG_SCHEMA = {
 				'queue':{
 					'type': 'list',
 					'required': True,
-					'anyof_schema': [SERIES_SCHEMA, EPISODE_SCHEMA],
+					'schema': {
+						'type': 'dict',
+						'anyof_schema': [SERIES_SCHEMA, EPISODE_SCHEMA],
+					},
 				}	
 			}
 		},
 
 	}
 }
+
+# every file of a multi-file run, checked on its own: settings may live in any one of them
+MANIFEST_SCHEMA = {
+	key: {rule: value for rule, value in rules.items() if rule not in ('required', 'default')}
+	for key, rules in CONFIG_SCHEMA.items()
+}
+
+class ConfigValidator(Validator):
+	"""
+	Reports a `check_with` callback that raises DocumentError as an error on its field,
+	so one pass finds every bad entry instead of stopping at the first.
+	"""
+	def _validate_check_with(self, checks, field, value):
+		"""
+		{'oneof': [
+			{'type': 'callable'},
+			{'type': 'list',
+			 'schema': {'oneof': [{'type': 'callable'},
+								  {'type': 'string'}]}},
+			{'type': 'string'}
+		]}
+		"""
+		try:
+			super()._validate_check_with(checks, field, value)
+		except DocumentError as error:
+			self._error(field, str(error))
+
+SCHEMAS = {"config": CONFIG_SCHEMA, "manifest": MANIFEST_SCHEMA, "series": SERIES_SCHEMA, "episode": EPISODE_SCHEMA}
+
+@functools.lru_cache(maxsize=None)
+def checked_schema(name: str) -> Any:
+	"""
+	Building a validator checks its schema, so each schema is checked once per process
+	and the validators built from it share the result.
+	"""
+	return ConfigValidator(SCHEMAS[name]).schema
+
+def config_validator(manifest: bool = False) -> ConfigValidator:
+	"""
+	Validator for a whole config, or with `manifest` for one file of a multi-file run.
+	A validator keeps the document and errors of its last run, so every call gets its own.
+	"""
+	return ConfigValidator(checked_schema("manifest" if manifest else "config"))
+
+def entry_validator(kind: str) -> ConfigValidator:
+	return ConfigValidator(checked_schema(kind))
+
+def parse_job(document: Any) -> Tuple[str, Dict[str, Any]]:
+	"""
+	Kind ("series" or "episode") and normalized entry of a job submitted to `crunchy serve`,
+	which takes the same fields as a series or episode entry of a config file.
+	"""
+	if not isinstance(document, dict) or not isinstance(document.get("url"), str):
+		raise ValueError("A job is an object with the url of a series or an episode")
+	kind = "series" if SERIES_URL.match(document["url"]) else "episode"
+	validator = entry_validator(kind)
+	if not validator.validate(document):
+		raise ValueError(f"Invalid {kind} job: {validator.errors}")
+	return kind, validator.document
@@ -0,0 +1,111 @@
+from __future__ import annotations
+import re
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from .pool import args_key
+
+Ranges = List[Tuple[int, int]]
+# season number -> (episode ranges, latest N episodes)
+Selection = Dict[int, Tuple[Ranges, Optional[int]]]
+
+RANGE = re.compile(r"(\d+)\s*(?:-\s*(\d+)?)?$")
+LATEST = re.compile(r"(?:latest|last)\s*(\d+)$", re.IGNORECASE)
+
+def merge_ranges(ranges: Iterable[Tuple[int, int]]) -> Ranges:
+	merged = []
+	for start, end in sorted(ranges):
+		if merged and start <= merged[-1][1] + 1:
+			merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+		else:
+			merged.append((start, end))
+	return merged
+
+def parse_ranges(spec: Any, latest: bool = False) -> Tuple[Ranges, Optional[int]]:
+	"""
+	Parses selections like `3`, `1-3,7,10-12` or `latest 5` (with `latest` allowed).
+	A reversed range such as `5-2` selects only its start.
+	:returns: tuple -- Merged (start, end) ranges and the latest N count, if any
+	"""
+	if isinstance(spec, int) and not isinstance(spec, bool): spec = str(spec)
+	if isinstance(spec, (list, tuple)): spec = ",".join(str(part) for part in spec)
+	if not isinstance(spec, str):
+		raise ValueError(f"'{spec}' is not a selection")
+	text = spec.strip()
+	if text.startswith("(") and text.endswith(")"): text = text[1:-1]
+	ranges = []
+	count = None
+	for part in text.split(","):
+		part = part.strip()
+		match = RANGE.match(part)
+		if match:
+			start = int(match.group(1))
+			end = max(start, int(match.group(2) or start))
+			if start == 0:
+				raise ValueError(f"'{spec}' selects episode or season 0, numbering starts at 1")
+			ranges.append((start, end))
+			continue
+		match = LATEST.match(part) if latest else None
+		if match and int(match.group(1)) > 0:
+			count = max(count or 0, int(match.group(1)))
+			continue
+		expected = "'1-3,7,10-12' or 'latest 5'" if latest else "'1-3,7'"
+		raise ValueError(f"'{spec}' is not a selection. Expected forms like {expected}.")
+	return (merge_ranges(ranges), count)
+
+def selection(series: Dict[str, Any]) -> Selection:
+	"""
+	Selection of a series entry: `seasons` and `episodes` take the selection grammar and
+	override the single `season` and `start`/`end` fields.
+	"""
+	if series.get("selection") is not None: return series["selection"]
+	if series.get("seasons") is not None:
+		seasons, _ = parse_ranges(series["seasons"])
+	else:
+		seasons = [(series.get("season", 1), series.get("season", 1))]
+	if series.get("episodes") is not None:
+		ranges, latest = parse_ranges(series["episodes"], latest=True)
+	else:
+		ranges, latest = ([(series.get("start", 1), series.get("end", 1))], None)
+	return {season: (ranges, latest) for start, end in seasons for season in range(start, end + 1)}
+
+def merge_selections(selections: Iterable[Selection]) -> Selection:
+	merged = {}
+	for chosen in selections:
+		for season, (ranges, latest) in chosen.items():
+			previous_ranges, previous_latest = merged.get(season, ([], None))
+			if previous_latest or latest: latest = max(previous_latest or 0, latest or 0)
+			merged[season] = (merge_ranges(previous_ranges + ranges), latest)
+	return merged
+
+def dump_selection(chosen: Selection) -> List[List[Any]]:
+	"""
+	A selection as JSON keeps it: seasons stay numbers and ranges come back as tuples.
+	"""
+	return [[season, [list(bounds) for bounds in ranges], latest] for season, (ranges, latest) in sorted(chosen.items())]
+
+def load_selection(dumped: List[List[Any]]) -> Selection:
+	return {season: ([tuple(bounds) for bounds in ranges], latest) for season, ranges, latest in dumped}
+
+def merge_series(series: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+	"""
+	Folds every entry for the same series URL (and yt-dlp args) into one, so each show is
+	extracted once per run. The merged entry keeps the highest priority.
+	"""
+	merged = {}
+	for entry in series:
+		key = (entry["url"], args_key(entry.get("args")))
+		if key not in merged:
+			merged[key] = {**entry, "selection": selection(entry)}
+			continue
+		current = merged[key]
+		current["selection"] = merge_selections([current["selection"], selection(entry)])
+		current["priority"] = max(current.get("priority", 1), entry.get("priority", 1))
+	return list(merged.values())
+
+def in_ranges(number: float, ranges: Ranges) -> bool:
+	return any(start <= number <= end for start, end in ranges)
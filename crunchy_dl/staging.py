@@ -0,0 +1,179 @@
+from __future__ import annotations
+import glob
+import os
+import re
+import shutil
+import threading
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Optional
+from typing import Union
+
+from .governor import RATE_UNITS
+
+DEFAULT_SIZE = 1024 ** 3
+DEFAULT_RESERVE = 256 * 1024 ** 2
+# muxing writes a second copy of the video next to the first
+MUX_FACTOR = 2
+# leftovers of unfinished downloads and muxes (.part, .part-Frag3, .ytdl, .temp.mp4), never moved
+PARTIAL_MARKERS = (".part", ".ytdl", ".temp.")
+
+def parse_size(size: Union[str, int, float]) -> float:
+	if isinstance(size, (int, float)):
+		value = float(size)
+	else:
+		match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?\s*$", size, re.IGNORECASE)
+		if not match:
+			raise ValueError(f"Expected a size like 500M or 2G, received {size}")
+		value = float(match.group(1)) * RATE_UNITS[match.group(2).upper()]
+	if value < 0:
+		raise ValueError(f"Expected a size of at least 0, received {size}")
+	return value
+
+class StagingFull(OSError):
+	"""
+	An episode that cannot fit in the staging directory even with nothing else in it.
+	"""
+
+def estimate(info: Dict[str, Any]) -> Optional[int]:
+	"""
+	Expected size of an extracted episode from its selected formats, None when unknown.
+	"""
+	formats = info.get("requested_formats") or [info]
+	sizes = [media.get("filesize") or media.get("filesize_approx") for media in formats]
+	if not all(sizes): return None
+	return int(sum(sizes))
+
+class Staging:
+	"""
+	Local directory (SSD, tmpfs) that episodes are downloaded and muxed in before being
+	moved to the destination in one go: a rename on the same filesystem, otherwise one
+	sequential copy to a temporary name that is renamed into place, so the destination
+	never shows a partial file.
+
+	`admit` holds an episode back until its estimated size fits: the free space, less
+	`reserve`, has to cover what the episodes already admitted still have to write.
+	Unknown sizes are taken as the average finished file, or `default_size` at first.
+	"""
+	def __init__(
+		self, directory: str, destination: str, reserve: float = DEFAULT_RESERVE,
+		default_size: float = DEFAULT_SIZE, poll: float = 1.0,
+		free_space: Optional[Callable[[str], int]] = None
+	) -> None:
+		os.makedirs(directory, exist_ok=True)
+		self.directory = os.path.abspath(directory)
+		self.destination = os.path.abspath(destination)
+		self.reserve = reserve
+		self.default_size = default_size
+		self.poll = poll
+		self.free_space = free_space or (lambda path: shutil.disk_usage(path).free)
+		self.waits = 0
+		self.renamed = 0
+		self.copied = 0
+		self.finalised = 0
+		self.finalised_bytes = 0
+		self._reserved = {}
+		self._written = {}
+		self._condition = threading.Condition()
+		self._same_device = os.stat(self.directory).st_dev == os.stat(self.destination).st_dev
+
+	@property
+	def outstanding(self) -> float:
+		"""
+		Bytes the admitted episodes are still expected to write.
+		"""
+		return sum(max(size - self._written.get(episode_id, 0), 0) for episode_id, size in self._reserved.items())
+
+	def _size(self, size: Optional[int], mux: bool) -> float:
+		if size is None:
+			size = self.finalised_bytes / self.finalised if self.finalised else self.default_size
+		return size * (MUX_FACTOR if mux else 1)
+
+	def admit(self, episode_id: str, size: Optional[int], mux: bool = False) -> None:
+		"""
+		Blocks until `episode_id` fits in the staging directory; admitting it again is a no-op.
+		:raises StagingFull: when it could not fit even with no other episode staged
+		"""
+		with self._condition:
+			if episode_id in self._reserved: return
+			needed = self._size(size, mux)
+			waited = False
+			while True:
+				available = self.free_space(self.directory) - self.reserve
+				if self.outstanding + needed <= available: break
+				if not self._reserved:
+					raise StagingFull(
+						f"{episode_id} needs ~{needed / 1024 ** 2:.0f} MiB in {self.directory}, "
+						f"only {max(available, 0) / 1024 ** 2:.0f} MiB are free"
+					)
+				waited = True
+				# space frees up as other episodes finish, or as something else on the disk is removed
+				self._condition.wait(self.poll)
+			if waited: self.waits += 1
+			self._reserved[episode_id] = needed
+
+	def written(self, episode_id: str, size: int) -> None:
+		with self._condition:
+			if episode_id in self._reserved:
+				self._written[episode_id] = self._written.get(episode_id, 0) + size
+
+	def release(self, episode_id: str) -> None:
+		with self._condition:
+			self._reserved.pop(episode_id, None)
+			self._written.pop(episode_id, None)
+			self._condition.notify_all()
+
+	def target(self, path: str) -> str:
+		return os.path.join(self.destination, os.path.relpath(os.path.abspath(path), self.directory))
+
+	def _move(self, path: str) -> str:
+		target = self.target(path)
+		if os.path.exists(target):
+			raise FileExistsError(f"{target} already exists, {path} was left in the staging directory")
+		os.makedirs(os.path.dirname(target), exist_ok=True)
+		if self._same_device:
+			os.replace(path, target)
+			self.renamed += 1
+		else:
+			temp = f"{target}.part"
+			shutil.copyfile(path, temp)
+			shutil.copystat(path, temp)
+			os.replace(temp, target)
+			os.remove(path)
+			self.copied += 1
+		return target
+
+	def finalise(self, path: str) -> str:
+		"""
+		Moves a finished episode, and any subtitle files left beside it, to the destination.
+		Files outside the staging directory are left where they are.
+		:raises FileExistsError: when the episode is already at the destination, nothing is overwritten
+		:returns: str -- Final path of the episode
+		"""
+		path = os.path.abspath(path)
+		if os.path.commonpath([path, self.directory]) != self.directory: return path
+		size = os.path.getsize(path)
+		base = os.path.splitext(path)[0]
+		sidecars = [
+			sidecar for sidecar in glob.glob(f"{glob.escape(base)}.*")
+			if sidecar != path and not any(marker in sidecar[len(base):] for marker in PARTIAL_MARKERS)
+		]
+		target = self._move(path)
+		for sidecar in sidecars:
+			try:
+				self._move(sidecar)
+			except FileExistsError:
+				# the subtitle already at the destination is kept
+				os.remove(sidecar)
+		with self._condition:
+			self.finalised += 1
+			self.finalised_bytes += size
+		return target
+
+	def report(self) -> str:
+		return (
+			f"[STAGING] {self.finalised} episodes ({self.finalised_bytes / 1024 ** 3:.1f} GiB) moved to {self.destination}: "
+			f"{self.renamed} files renamed, {self.copied} copied, "
+			f"{self.waits} held back for space"
+		)
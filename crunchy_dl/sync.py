@@ -0,0 +1,96 @@
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+from time import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+DEFAULT_SYNC_PATH = os.path.join(os.path.expanduser("~"), ".cache", "crunchy_dl", "sync.sqlite3")
+MARK_FIELDS = ("episode_id", "season_number", "episode_number", "title", "synced")
+
+def position(entry: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+	if entry.get("season_number") is None or entry.get("episode_number") is None: return None
+	return (entry["season_number"], entry["episode_number"])
+
+def is_newer(entry: Dict[str, Any], mark: Dict[str, Any]) -> bool:
+	return entry["id"] != mark["episode_id"] and position(entry) > (mark["season_number"], mark["episode_number"])
+
+class SeasonsFrom:
+	"""
+	Season numbers from `first` onwards, for listing a show from a mark's season.
+	Seasons without a number are never in it.
+	"""
+	__slots__ = ("first",)
+
+	def __init__(self, first: float) -> None:
+		self.first = first
+
+	def __contains__(self, number: Any) -> bool:
+		return isinstance(number, (int, float)) and number >= self.first
+
+class Watermarks:
+	"""
+	Per-series high-water mark for `crunchy sync`: the newest episode seen so far.
+	Marks found during a run are staged and only written by `commit`, once the
+	new episodes have been handed to the downloader.
+	"""
+	def __init__(self, path: str = DEFAULT_SYNC_PATH) -> None:
+		if path != ":memory:":
+			os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		self.path = path
+		self.staged = {}
+		self._lock = threading.Lock()
+		self._db = sqlite3.connect(path, check_same_thread=False)
+		self._db.execute(
+			"CREATE TABLE IF NOT EXISTS marks ("
+			"url TEXT PRIMARY KEY, episode_id TEXT NOT NULL, season_number REAL NOT NULL, "
+			"episode_number REAL NOT NULL, title TEXT, synced REAL NOT NULL)"
+		)
+		self._db.commit()
+
+	def get(self, url: str) -> Optional[Dict[str, Any]]:
+		with self._lock:
+			row = self._db.execute(
+				f"SELECT {', '.join(MARK_FIELDS)} FROM marks WHERE url = ?", (url,)
+			).fetchone()
+		return dict(zip(MARK_FIELDS, row)) if row else None
+
+	def stage(self, url: str, newest: Optional[Dict[str, Any]], new: List[Dict[str, Any]]) -> None:
+		with self._lock:
+			self.staged[url] = (newest, new)
+
+	def commit(self) -> None:
+		now = time()
+		with self._lock:
+			for url, (newest, _) in self.staged.items():
+				if newest is None: continue
+				self._db.execute(
+					"INSERT OR REPLACE INTO marks (url, episode_id, season_number, episode_number, title, synced) "
+					"VALUES (?, ?, ?, ?, ?, ?)",
+					(url, newest["id"], newest["season_number"], newest["episode_number"], newest.get("title"), now)
+				)
+			self._db.commit()
+			self.staged = {}
+
+	def report(self) -> List[Dict[str, Any]]:
+		"""
+		What changed since the previous sync, one row per series staged in this run.
+		"""
+		rows = []
+		for url, (newest, new) in sorted(self.staged.items()):
+			mark = self.get(url)
+			rows.append({
+				"url": url,
+				"since": mark["synced"] if mark else None,
+				"previous": mark,
+				"newest": newest,
+				"new": new,
+			})
+		return rows
+
+	def close(self) -> None:
+		self._db.close()
@@ -0,0 +1,146 @@
+from __future__ import annotations
+import contextlib
+import json
+import os
+import threading
+from time import perf_counter_ns
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from prettytable import PrettyTable
+
+SUBTITLE_EXTS = ("vtt", "ass", "srt", "ssa", "ttml", "json")
+PERCENTILES = (50, 90, 99)
+NULL_SPAN = contextlib.nullcontext()
+
+# (stage, item, start ns, end ns, thread id, thread name)
+SpanRecord = Tuple[str, Optional[str], int, int, int, str]
+
+def percentile(durations: List[int], rank: int) -> int:
+	return durations[min(len(durations) - 1, max(0, -(-len(durations) * rank // 100) - 1))]
+
+class Span:
+	__slots__ = ("tracer", "stage", "item", "start")
+
+	def __init__(self, tracer: Tracer, stage: str, item: Optional[str]) -> None:
+		self.tracer = tracer
+		self.stage = stage
+		self.item = item
+
+	def __enter__(self) -> Span:
+		self.start = perf_counter_ns()
+		return self
+
+	def __exit__(self, *exc) -> None:
+		self.tracer.record(self.stage, self.item, self.start)
+
+class Tracer:
+	"""
+	Wall-clock spans per stage (login, extract, episode, media, mux, ...) and item.
+	A disabled tracer hands out one shared null context and records nothing, so the
+	instrumentation can stay in place on every run.
+	"""
+	def __init__(self, enabled: bool = True) -> None:
+		self.enabled = enabled
+		self.origin = perf_counter_ns()
+		self.spans = []
+		self._open = {}
+		self._lock = threading.Lock()
+
+	def span(self, stage: str, item: Optional[str] = None) -> Any:
+		if not self.enabled: return NULL_SPAN
+		return Span(self, stage, item)
+
+	def record(self, stage: str, item: Optional[str], start: int, end: Optional[int] = None) -> None:
+		if not self.enabled: return
+		thread = threading.current_thread()
+		with self._lock:
+			self.spans.append((stage, item, start, end or perf_counter_ns(), thread.ident, thread.name))
+
+	def begin(self, key: Any) -> None:
+		with self._lock:
+			self._open.setdefault(key, perf_counter_ns())
+
+	def end(self, key: Any, stage: str, item: Optional[str]) -> None:
+		with self._lock:
+			start = self._open.pop(key, None)
+		if start is not None: self.record(stage, item, start)
+
+	def hook(self, status: Dict[str, Any]) -> None:
+		"""
+		yt-dlp progress hook: a "media" or "subtitles" span from the first progress
+		report of a file until it is finished.
+		"""
+		filename = status.get("filename") or ""
+		info = status.get("info_dict") or {}
+		stage = "subtitles" if filename.rsplit(".", 1)[-1] in SUBTITLE_EXTS else "media"
+		if status["status"] == "downloading":
+			self.begin((stage, filename))
+		else:
+			self.end((stage, filename), stage, info.get("id"))
+
+	def postprocessor_hook(self, status: Dict[str, Any]) -> None:
+		info = status.get("info_dict") or {}
+		stage = "mux" if status.get("postprocessor") == "EmbedSubtitle" else "postprocess"
+		key = (stage, info.get("id"), status.get("postprocessor"))
+		if status["status"] == "started": self.begin(key)
+		elif status["status"] == "finished": self.end(key, stage, info.get("id"))
+
+	def stats(self) -> Dict[str, Dict[str, float]]:
+		durations = {}
+		with self._lock:
+			for stage, _, start, end, _, _ in self.spans:
+				durations.setdefault(stage, []).append(end - start)
+		stats = {}
+		for stage, values in durations.items():
+			values.sort()
+			stats[stage] = {
+				"count": len(values),
+				"total": sum(values) / 1e9,
+				**{f"p{rank}": percentile(values, rank) / 1e9 for rank in PERCENTILES},
+				"max": values[-1] / 1e9,
+			}
+		return stats
+
+	def slowest(self, count: int = 5) -> List[SpanRecord]:
+		with self._lock:
+			spans = list(self.spans)
+		return sorted(spans, key=lambda span: span[2] - span[3])[:count]
+
+	def report(self, slowest: int = 5) -> str:
+		table = PrettyTable(["Stage", "Count", "Total (s)"] + [f"p{rank} (s)" for rank in PERCENTILES] + ["Max (s)"])
+		for stage, stats in sorted(self.stats().items(), key=lambda item: -item[1]["total"]):
+			table.add_row(
+				[stage, stats["count"], f"{stats['total']:.2f}"] +
+				[f"{stats[f'p{rank}']:.3f}" for rank in PERCENTILES] + [f"{stats['max']:.3f}"]
+			)
+		slow = PrettyTable(["Stage", "Item", "Seconds", "Thread"], max_width = 60)
+		for stage, item, start, end, _, thread in self.slowest(slowest):
+			slow.add_row([stage, item or "", f"{(end - start) / 1e9:.3f}", thread])
+		return f"{table}\nSlowest spans\n{slow}"
+
+	def chrome_trace(self, path: str) -> None:
+		"""
+		Writes the spans in Chrome trace event format, for chrome://tracing or Perfetto.
+		Each worker thread is one track.
+		"""
+		pid = os.getpid()
+		with self._lock:
+			spans = list(self.spans)
+		events = []
+		threads = {}
+		for stage, item, start, end, ident, name in spans:
+			if ident not in threads:
+				threads[ident] = len(threads) + 1
+				events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": threads[ident], "args": {"name": name}})
+			events.append({
+				"name": f"{stage} {item}" if item else stage, "cat": stage, "ph": "X", "pid": pid, "tid": threads[ident],
+				"ts": (start - self.origin) / 1e3, "dur": (end - start) / 1e3, "args": {"item": item},
+			})
+		with open(path, "w", encoding="utf-8") as f:
+			json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+NULL_TRACER = Tracer(enabled=False)
@@ -0,0 +1,146 @@
+from __future__ import annotations
+import concurrent.futures
+import os
+import re
+import threading
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+# yt-dlp ignores params it does not know, so the wanted audio languages travel with the
+# other per-entry params and reach the downloader that handles the entry
+AUDIO_PARAM = "crunchy_audio"
+
+def parse_languages(spec: Any) -> Optional[List[str]]:
+	"""
+	Language selection: a list or comma separated string of codes or yt-dlp style patterns
+	('en-US', 'es-.*', 'all', '-fr-FR'), or 'none'. None (not set) inherits the run's setting.
+	"""
+	if spec is None: return None
+	items = spec if isinstance(spec, list) else str(spec).split(",")
+	languages = [str(item).strip() for item in items if str(item).strip()]
+	if languages == ["none"]: return []
+	for language in languages:
+		try:
+			re.compile(language.lstrip("-"))
+		except re.error:
+			raise ValueError(f"'{language}' is not a language code or pattern")
+	if not languages: raise ValueError(f"'{spec}' selects no languages, use 'none' to skip every track")
+	return languages
+
+def track_params(subtitles: Optional[List[str]], audio: Optional[List[str]]) -> Dict[str, Any]:
+	"""
+	yt-dlp params for a subtitle and audio selection; an empty subtitle list writes none.
+	"""
+	params = {}
+	if subtitles is not None:
+		params["writesubtitles"] = bool(subtitles)
+		params["subtitleslangs"] = subtitles
+	if audio is not None:
+		params[AUDIO_PARAM] = audio
+	return params
+
+def with_tracks(entry: Dict[str, Any]) -> Dict[str, Any]:
+	"""
+	A config entry with its own `subtitles`/`audio` selection folded into its args.
+	"""
+	params = track_params(parse_languages(entry.get("subtitles")), parse_languages(entry.get("audio")))
+	if not params: return entry
+	return {**entry, "args": list(entry.get("args") or []) + [params]}
+
+def audio_language(info: Dict[str, Any]) -> Optional[str]:
+	for media in [info] + list(info.get("requested_formats") or []) + list(info.get("formats") or []):
+		if media.get("language") or media.get("audio_locale"):
+			return media.get("language") or media.get("audio_locale")
+	return None
+
+def audio_wanted(language: Optional[str], wanted: Optional[List[str]]) -> bool:
+	"""
+	Whether an audio track in `language` is selected; 'ja' selects 'ja-JP'. An unknown
+	language is kept, only tracks known to be unwanted are skipped.
+	"""
+	if wanted is None or language is None: return True
+	# only exclusions ('-en-US') keep everything else
+	keep = all(pattern.startswith("-") for pattern in wanted)
+	for pattern in wanted:
+		discard = pattern.startswith("-")
+		pattern = pattern.lstrip("-")
+		if pattern == "all" or re.match(f"(?:{pattern})(?:-.*)?$", language, re.IGNORECASE):
+			keep = not discard
+	return keep
+
+class TrackStats:
+	"""
+	What track selection left out during a run, for the summary at its end.
+	"""
+	def __init__(self) -> None:
+		self.subtitles_available = 0
+		self.subtitles_selected = 0
+		self.subtitles_fetched = 0
+		self.subtitle_bytes = 0
+		self.audio_skipped = 0
+		self.audio_bytes = 0
+		self._lock = threading.Lock()
+
+	def subtitles(self, available: int, selected: int) -> None:
+		with self._lock:
+			self.subtitles_available += available
+			self.subtitles_selected += selected
+
+	def fetched(self, size: int) -> None:
+		with self._lock:
+			self.subtitles_fetched += 1
+			self.subtitle_bytes += size
+
+	def skipped_audio(self, size: Optional[int]) -> None:
+		with self._lock:
+			self.audio_skipped += 1
+			self.audio_bytes += size or 0
+
+	def report(self) -> Optional[str]:
+		lines = []
+		skipped = self.subtitles_available - self.subtitles_selected
+		if skipped:
+			# unfetched tracks are estimated at the size of the fetched ones
+			average = self.subtitle_bytes / self.subtitles_fetched if self.subtitles_fetched else 0
+			saved = f", ~{skipped * average / 1024:.0f} KiB" if average else ""
+			lines.append(
+				f"[TRACKS] {self.subtitles_selected} of {self.subtitles_available} subtitle tracks selected: "
+				f"{skipped} requests{saved} and their muxing saved"
+			)
+		if self.audio_skipped:
+			saved = f", ~{self.audio_bytes / 1024 ** 2:.1f} MiB not downloaded" if self.audio_bytes else ""
+			lines.append(f"[TRACKS] {self.audio_skipped} episodes skipped for their audio language{saved}")
+		return "\n".join(lines) or None
+
+class SubtitleFetcher:
+	"""
+	Fetches the selected subtitle files of every episode on one shared thread pool while
+	the episode's video downloads, instead of one after another before it.
+	"""
+	def __init__(self, workers: int = 8, stats: Optional[TrackStats] = None) -> None:
+		self.workers = workers
+		self.stats = stats or TrackStats()
+		self._executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="subtitles")
+
+	def _fetch(self, path: str, load: Callable[[], bytes]) -> str:
+		if os.path.exists(path): return path
+		data = load()
+		temp = f"{path}.part"
+		with open(temp, "wb") as f:
+			f.write(data)
+		os.replace(temp, path)
+		self.stats.fetched(len(data))
+		return path
+
+	def submit(self, path: str, load: Callable[[], bytes]) -> concurrent.futures.Future:
+		"""
+		Writes what `load` returns to `path` unless it is already there.
+		:returns: Future -- resolves to `path`
+		"""
+		return self._executor.submit(self._fetch, path, load)
+
+	def close(self) -> None:
+		self._executor.shutdown(wait=True)
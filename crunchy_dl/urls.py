@@ -0,0 +1,10 @@
+import re
+
+# compiled once; config validation matches every entry of large configs against these
+SERIES_URL = re.compile(r'https?://beta\.crunchyroll\.com/((?:\w{1,2}/)?)series/(\w+)/([\w\-]*)/?(?:\?|$)')
+EPISODE_URL = re.compile(r'https?://beta\.crunchyroll\.com/((?:\w{1,2}/)?)watch/(\w+)/([\w\-]*)/?(?:\?|$)')
+CONTENT_ID = re.compile(r'https?://beta\.crunchyroll\.com/(?:\w{1,2}/)?(?:series|watch)/(\w+)')
+
+def content_id(url: str) -> str:
+	match = CONTENT_ID.match(url)
+	return match.group(1) if match else url
@@ -0,0 +1,114 @@
+from __future__ import unicode_literals
+from ..crunchy_dl import aio
+from ..crunchy_dl.governor import BandwidthGovernor
+from ..crunchy_dl.progress import ProgressAggregator
+from ..crunchy_dl.tracks import TrackStats
+from ..benchmarks.media_server import MediaServer
+import os
+import threading
+import pytest
+
+pytest.importorskip("aiohttp")
+
+class FakeDownloader:
+	def __init__(self, server, destination):
+		self.server = server
+		self.destination = destination
+		self.progress = ProgressAggregator("none")
+		self.governor = BandwidthGovernor()
+		self.tracks = TrackStats()
+		self.journal = None
+		self.finished = {}
+		self.finishes = []
+		self.fallbacks = []
+		self.muxed = []
+		self.threads = 0
+		self._lock = threading.Lock()
+
+	def flow(self, episode_id):
+		return (episode_id, 1)
+
+	def prepare(self, url, args):
+		with self._lock: self.threads = max(self.threads, threading.active_count())
+		episode = url.rsplit("/", 1)[-1]
+		return {
+			"id": episode, "ext": "mp4", "protocol": "m3u8_native",
+			"url": self.server.playlist_url(episode),
+			"filepath": os.path.join(self.destination, f"{episode}.mp4"),
+			"requested_subtitles": {"en": {"ext": "vtt", "url": f"{self.server.url}/{episode}/en.vtt"}},
+		}
+
+	def select_tracks(self, episode_id, info, args):
+		return True
+
+	def admit(self, episode_id, info):
+		return True
+
+	def download(self, url, args, info = None):
+		self.fallbacks.append((url, info["protocol"]))
+
+	def mux(self, episode_id, info):
+		self.muxed.append((info["requested_downloads"][0]["filepath"], info["requested_subtitles"]["en"]["filepath"]))
+		self.finish(episode_id, True)
+
+	def finish(self, episode_id, ok, error=None):
+		with self._lock:
+			self.finished[episode_id] = (ok, error)
+			self.finishes.append(episode_id)
+
+def expected(server, episode):
+	return b"".join(server.fragment(episode, i, server.fragment_size) for i in range(server.fragments))
+
+def entries(count):
+	return [({"id": f"ep{i}", "url": f"https://beta.crunchyroll.com/watch/ep{i}"}, []) for i in range(count)]
+
+def test_async_engine_downloads_many_episodes(tmp_path):
+	with MediaServer(fragments = 8, fragment_size = 2048, latency = 0.01) as server:
+		downloader = FakeDownloader(server, str(tmp_path))
+		engine = aio.AsyncEngine(downloader, extract_workers = 4, concurrency = 100, requests = 200)
+		engine.run(entries(60))
+		for i in range(60):
+			assert (tmp_path / f"ep{i}.mp4").read_bytes() == expected(server, f"ep{i}")
+			assert (tmp_path / f"ep{i}.en.vtt").read_text().startswith("WEBVTT")
+	assert all(ok for ok, _ in downloader.finished.values()) and len(downloader.finished) == 60
+	assert len(downloader.muxed) == 60
+	assert engine.peak_in_flight > 4
+	# 60 episodes and hundreds of requests never need more than the small executor
+	assert downloader.threads < 20
+
+def test_async_engine_retries_and_fails(tmp_path):
+	failures = {"/ep0/segment2.ts": 1, "/ep1/segment2.ts": 10}
+	with MediaServer(fragments = 4, fragment_size = 256, failures = failures) as server:
+		downloader = FakeDownloader(server, str(tmp_path))
+		engine = aio.AsyncEngine(downloader, retries = 2, backoff = 0)
+		engine.run(entries(2))
+		assert (tmp_path / "ep0.mp4").read_bytes() == expected(server, "ep0")
+	assert downloader.finished["ep0"] == (True, None)
+	assert downloader.finished["ep1"][0] == False
+	assert not (tmp_path / "ep1.mp4").exists()
+
+def test_async_engine_resolve_and_collect(tmp_path):
+	def extract(meta_data, args):
+		return ([{"id": meta_data["id"], "url": "u"}], args)
+
+	engine = aio.AsyncEngine(FakeDownloader(None, str(tmp_path)))
+	resolved = engine.collect(engine.resolve([(extract, {"id": "a"}, [1]), (extract, {"id": "b"}, [2])]))
+	assert sorted(resolved, key=lambda item: item[0]["id"]) == [({"id": "a", "url": "u"}, [1]), ({"id": "b", "url": "u"}, [2])]
+
+def test_async_engine_falls_back_to_yt_dlp(tmp_path):
+	downloader = FakeDownloader(None, str(tmp_path))
+	downloader.prepare = lambda url, args: {"id": "x", "protocol": "http_dash_segments", "filepath": "x.mp4"}
+	aio.AsyncEngine(downloader).run(entries(1))
+	assert downloader.fallbacks == [("https://beta.crunchyroll.com/watch/ep0", "http_dash_segments")]
+
+def test_a_failed_fallback_is_finished_once(tmp_path):
+	downloader = FakeDownloader(None, str(tmp_path))
+	downloader.prepare = lambda url, args: {"id": "ep0", "protocol": "http_dash_segments", "filepath": "x.mp4"}
+
+	def download(url, args, info = None):
+		# like Downloader, which finishes the episode before raising
+		downloader.finish("ep0", False, RuntimeError("yt-dlp failed"))
+		raise RuntimeError("yt-dlp failed")
+	downloader.download = download
+	aio.AsyncEngine(downloader).run(entries(1))
+	assert downloader.finishes == ["ep0"]
@@ -0,0 +1,106 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.autoscale import AutoScaler, WorkerLimit, HARD_CEILING
+from ..crunchy_dl.pipeline import Pipeline
+from ..benchmarks.media_server import MediaServer
+import threading
+import urllib.request
+from time import sleep
+
+def scaler(**options):
+	return AutoScaler(lambda: 0, lambda: (0, 0), **options)
+
+def test_grows_while_throughput_improves_and_backs_off():
+	auto = scaler(min_workers = 1, max_workers = 8)
+	assert auto.step(100, 1, 0, backlog = 10) == 2
+	assert auto.step(200, 2, 0, backlog = 10) == 3
+	assert auto.step(290, 3, 0, backlog = 10) == 4
+	# the fourth worker added nothing, so it goes again
+	assert auto.step(292, 3, 0, backlog = 10) == 3
+	assert auto.step(291, 3, 0, backlog = 10) == 3
+	assert [(d["from"], d["to"]) for d in auto.decisions] == [(1, 2), (2, 3), (3, 4), (4, 3)]
+	assert auto.peak_workers == 4
+
+def test_probes_after_quiet_intervals():
+	auto = scaler(min_workers = 2, max_workers = 8, probe_every = 2)
+	auto.step(100, 1, 0, backlog = 5)
+	auto.step(100, 1, 0, backlog = 5)
+	assert auto.workers == 2
+	assert auto.step(100, 1, 0, backlog = 5) == 2
+	assert auto.step(100, 1, 0, backlog = 5) == 3
+	assert auto.decisions[-1]["reason"] == "probing"
+
+def test_errors_halve_and_bounds_hold():
+	lines = []
+	auto = scaler(min_workers = 2, max_workers = 100, log = lines.append)
+	assert auto.max_workers == HARD_CEILING
+	auto.limit.resize(16)
+	assert auto.step(1000, 2, 3, backlog = 10) == 8
+	assert auto.step(1000, 0, 4, backlog = 10) == 4
+	assert auto.step(1000, 0, 4, backlog = 10) == 2
+	assert auto.step(1000, 0, 4, backlog = 10) == 2
+	assert lines[0].startswith("[AUTOSCALE] 16 -> 8 workers: 3/5 episodes failed")
+	# nothing waiting, nothing to gain from more workers
+	assert scaler().step(1000, 5, 0, backlog = 0) == 1
+
+def test_worker_limit_resize():
+	limit = WorkerLimit(1)
+	limit.acquire()
+	acquired = threading.Event()
+
+	def worker():
+		limit.acquire()
+		acquired.set()
+
+	thread = threading.Thread(target = worker)
+	thread.start()
+	assert not acquired.wait(0.05)
+	limit.resize(2)
+	assert acquired.wait(1)
+	thread.join()
+	assert limit.active == 2
+
+def run(server, episodes, workers = 1):
+	done = {"bytes": 0, "ok": 0, "failed": 0}
+	lock = threading.Lock()
+	running = {"now": 0, "peak": 0}
+
+	def download(url, args):
+		with lock:
+			running["now"] += 1
+			running["peak"] = max(running["peak"], running["now"])
+		try:
+			with urllib.request.urlopen(url) as response:
+				size = len(response.read())
+			with lock:
+				done["bytes"] += size
+				done["ok"] += 1
+		except OSError:
+			with lock: done["failed"] += 1
+		finally:
+			with lock: running["now"] -= 1
+
+	auto = AutoScaler(
+		lambda: done["bytes"], lambda: (done["ok"], done["failed"]),
+		min_workers = 1, max_workers = 6, interval = 0.15, probe_every = 2
+	)
+	auto.limit.resize(workers)
+	pipeline = Pipeline(download, download_workers = 1, scaler = auto)
+	pipeline.run(({"id": f"E{i}", "url": server.video_url(f"E{i}")}, None) for i in range(episodes))
+	return auto, done, running["peak"]
+
+def test_scales_up_against_paced_server():
+	# each response is paced, so throughput grows with the number of workers
+	with MediaServer(fragments = 4, fragment_size = 16 * 1024, bandwidth = 256 * 1024) as server:
+		auto, done, peak = run(server, 60)
+	assert done["ok"] == 60
+	assert auto.peak_workers >= 3
+	assert peak <= auto.peak_workers <= 6
+	assert any(decision["from"] < decision["to"] for decision in auto.decisions)
+
+def test_scales_down_on_errors():
+	with MediaServer(fragments = 4, fragment_size = 16 * 1024, latency = 0.05) as server:
+		server.failures = {f"/E{i}/video.mp4": 1 for i in range(60)}
+		auto, done, _ = run(server, 60, workers = 6)
+	assert done["failed"] == 60
+	assert auto.decisions and auto.workers < 6
+	assert all(decision["to"] < decision["from"] for decision in auto.decisions)
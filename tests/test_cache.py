@@ -0,0 +1,46 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.cache import MetadataCache, compact
+import pytest
+
+ENTRIES = [
+	{"id": "G1", "season_number": 1, "episode_number": 1, "title": "One", "url": "u1", "formats": [{"url": "x"}]},
+	{"id": "G2", "season_number": 1, "episode_number": 2, "title": "Two", "url": "u2"},
+]
+
+@pytest.fixture
+def cache_path(tmp_path):
+	return str(tmp_path / "metadata.sqlite3")
+
+def test_metadata_cache_hit_and_miss(cache_path):
+	cache = MetadataCache(cache_path)
+	assert cache.get("series:G1") is None
+	cache.set("series:G1", ENTRIES)
+	assert cache.get("series:G1") == [compact(entry) for entry in ENTRIES]
+	assert cache.stats() == {"hits": 1, "misses": 1}
+
+def test_metadata_cache_persists(cache_path):
+	MetadataCache(cache_path).set("series:G1", ENTRIES)
+	assert len(MetadataCache(cache_path).get("series:G1")) == 2
+
+def test_metadata_cache_drops_heavy_fields(cache_path):
+	cache = MetadataCache(cache_path)
+	cache.set("series:G1", ENTRIES)
+	assert "formats" not in cache.get("series:G1")[0]
+
+def test_metadata_cache_ttl(cache_path):
+	cache = MetadataCache(cache_path, ttl=-1)
+	cache.set("series:G1", ENTRIES)
+	assert cache.get("series:G1") is None
+
+def test_metadata_cache_refresh(cache_path):
+	MetadataCache(cache_path).set("series:G1", ENTRIES)
+	cache = MetadataCache(cache_path, refresh=True)
+	assert cache.get("series:G1") is None
+	assert cache.misses == 1
+
+def test_metadata_cache_eviction(cache_path):
+	cache = MetadataCache(cache_path, max_bytes=400)
+	for i in range(5):
+		cache.set(f"series:{i}", ENTRIES)
+	assert cache.get("series:0") is None
+	assert cache.get("series:4") is not None
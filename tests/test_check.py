@@ -0,0 +1,78 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.check import load, duplicates, describe, check
+from ..crunchy_dl.selection import selection
+
+CONFIG = """username: user
+password: pass
+ffmpeg_location: ffmpeg
+destination: {destination}
+threads: {threads}
+download:
+  series:
+    - url: https://beta.crunchyroll.com/series/GYQ4MKDZ6/gintama
+      seasons: 1-2
+      episodes: 1-3
+    - url: {series_url}
+      episodes: {episodes}
+  episodes:
+    - url: https://beta.crunchyroll.com/watch/GYK5PJV7R/enter-naruto-uzumaki
+    - url: {episode_url}
+"""
+
+def config(tmp_path, **fields):
+	values = {
+		"destination": tmp_path, "threads": 5, "episodes": "7",
+		"series_url": "https://beta.crunchyroll.com/series/G79H23V24/sabikui-bisco",
+		"episode_url": "https://beta.crunchyroll.com/watch/GRWEXZWJR/gintama-part-1",
+	}
+	values.update(fields)
+	return CONFIG.format(**values)
+
+def test_every_error_reported_with_its_line(tmp_path):
+	document, _, errors = load(config(
+		tmp_path, destination = tmp_path / "missing", threads = 40,
+		series_url = "https://example.com/series/x", episodes = "1-x", episode_url = "bad"
+	))
+	assert document is None
+	assert [(line, where) for line, where, _ in errors] == [
+		(4, "destination"), (5, "threads"), (11, "download.series.1.url"),
+		(12, "download.series.1.episodes"), (15, "download.episodes.1.url"),
+	]
+	assert "received 40" in errors[1][2]
+
+def test_yaml_syntax_error_line():
+	_, _, errors = load("username: user\ndownload: [1\npassword: pass\n")
+	assert len(errors) == 1 and errors[0][0] == 3
+
+def test_duplicates_and_overlaps(tmp_path):
+	text = config(tmp_path, series_url = "https://beta.crunchyroll.com/series/GYQ4MKDZ6/gintama", episodes = "3-5")
+	text += "    - url: https://beta.crunchyroll.com/watch/GYK5PJV7R/enter-naruto-uzumaki\n"
+	document, root, errors = load(text)
+	assert errors == []
+	warnings = duplicates([("config.yaml", document, root)])
+	assert [(line, where) for _, line, where, _ in warnings] == [(11, "download.series.1"), (16, "download.episodes.2")]
+	assert "merged" in warnings[0][3]
+
+	document, root, _ = load(config(tmp_path, series_url = "https://beta.crunchyroll.com/series/GYQ4MKDZ6/gintama", episodes = "4-5"))
+	assert duplicates([("config.yaml", document, root)]) == []
+
+def test_describe():
+	assert describe(selection({"seasons": "1-2,4", "episodes": "1-3,7"})) == "S1-2: 1-3,7 | S4: 1-3,7"
+	assert describe(selection({"episodes": "latest 5"})) == "S1: latest 5"
+
+def test_check_prints_queue(tmp_path, capsys):
+	path = tmp_path / "config.yaml"
+	path.write_text(config(tmp_path))
+	assert check([str(path)]) == 0
+	output = capsys.readouterr().out
+	assert "GYQ4MKDZ6" in output and "S1-2: 1-3" in output
+	assert output.splitlines()[-1].endswith("is valid: 2 series, 2 episodes, 0 warnings")
+
+	# overlapping entries of one series are one row of the queue and one series in the summary
+	path.write_text(config(tmp_path, series_url = "https://beta.crunchyroll.com/series/GYQ4MKDZ6/gintama", episodes = "3-5"))
+	assert check([str(path)]) == 0
+	assert capsys.readouterr().out.splitlines()[-1].endswith("is valid: 1 series, 2 episodes, 1 warnings")
+
+	path.write_text(config(tmp_path, threads = 0))
+	assert check([str(path)]) == 1
+	assert f"{path}:5: error: threads:" in capsys.readouterr().out
@@ -0,0 +1,56 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.cli import argument_parsing, main
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = """
+username: user
+password: pass
+ffmpeg_location: ffmpeg
+destination: {destination}
+download:
+  series:
+    - url: https://beta.crunchyroll.com/series/GYQ4MKDZ6/gintama
+      episodes: 1-3
+  episodes:
+    - url: https://beta.crunchyroll.com/watch/GYK5PJV7R/enter-naruto-uzumaki
+"""
+
+def loaded_after(*argv):
+	"""
+	Runs the command line in a fresh interpreter and reports which heavy packages it imported.
+	"""
+	code = (
+		"import sys\nfrom crunchy_dl.cli import main\nmain(sys.argv[1:])\n"
+		"print(sorted(name for name in ('yt_dlp', 'cerberus', 'yaml', 'cfscrape', 'aiohttp') if name in sys.modules))"
+	)
+	output = subprocess.run([sys.executable, "-c", code, *argv], cwd = ROOT, capture_output = True, text = True, check = True)
+	return output.stdout.splitlines()
+
+def test_version_and_check_skip_heavy_imports(tmp_path):
+	assert loaded_after("--version") == ["0.1.0", "[]"]
+	config = tmp_path / "config.yaml"
+	config.write_text(CONFIG.format(destination = tmp_path))
+	*_, check, loaded = loaded_after("config", str(config), "--check")
+	assert check.endswith("is valid: 1 series, 1 episodes, 0 warnings")
+	assert loaded == "['cerberus', 'yaml']"
+
+def test_single_pass_parse(capsys):
+	args, yt_dlp_args = argument_parsing(["config", "config.yaml", "--dry-run", "--no-color"])
+	assert (args.action, args.config_files, args.dry_run, args.check) == ("config", ["config.yaml"], True, False)
+	assert yt_dlp_args == ["--no-color"]
+	args, _ = argument_parsing([
+		"series", "-u", "user", "-p", "pass", "-f", "ffmpeg", "-v",
+		"-l", "https://beta.crunchyroll.com/series/GYQ4MKDZ6/gintama"
+	])
+	assert args.verbosity
+	assert capsys.readouterr().out == ""
+
+def test_missing_action():
+	with pytest.raises(SystemExit):
+		argument_parsing([])
+	assert main(["--version"]) == 0
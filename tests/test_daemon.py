@@ -0,0 +1,174 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.daemon import Daemon, EventStream, build_server, events
+from ..crunchy_dl.retry import CANCELLED, Cancelled, DeadLetters, classify
+from ..crunchy_dl.main import Downloader
+from ..crunchy_dl.schema import parse_job
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import pytest
+
+SERIES = "https://beta.crunchyroll.com/series/GYQ4MKDZ6/gintama"
+
+def episode(episode_id):
+	return {"id": episode_id, "url": f"https://beta.crunchyroll.com/watch/{episode_id}/x", "title": episode_id}
+
+class FakeDownloader:
+	"""
+	Finishes an episode when the test releases it, like main.Downloader reporting to its worker.
+	"""
+	def __init__(self):
+		self.cancelled = set()
+		self.worker = None
+		self.started = []
+		self.release = threading.Event()
+
+	def cancel(self, episode_id):
+		self.cancelled.add(episode_id)
+
+	def download(self, url, args):
+		episode_id = url.split("/")[4]
+		self.started.append(episode_id)
+		self.release.wait(5)
+		self.worker.finished(episode_id, episode_id not in self.cancelled and episode_id != "GBAD")
+
+def build(**resolved):
+	dl = FakeDownloader()
+	calls = []
+
+	def resolve(entry, args):
+		calls.append(time.monotonic())
+		if entry["url"] in resolved: return resolved[entry["url"]], args
+		raise ValueError("unavailable")
+
+	daemon = Daemon(dl, {"series": resolve, "episode": resolve}, extract_workers = 2, download_workers = 2)
+	dl.worker = daemon
+	return daemon, dl, calls
+
+def wait(predicate, timeout = 5):
+	deadline = time.monotonic() + timeout
+	while not predicate():
+		assert time.monotonic() < deadline
+		time.sleep(0.005)
+
+def test_jobs_run_on_warm_pools():
+	daemon, dl, calls = build(**{SERIES: [episode("GA"), episode("GB")], "https://e/GC": [episode("GC")]})
+	start = time.monotonic()
+	job = daemon.submit("series", {"url": SERIES})
+	wait(lambda: calls)
+	assert calls[0] - start < 0.5
+	wait(lambda: len(dl.started) == 2)
+	assert daemon.job(job.id)["state"] == "downloading"
+	# an episode another job is downloading is not downloaded twice
+	again = daemon.submit("series", {"url": SERIES})
+	wait(lambda: daemon.job(again.id)["state"] == "done")
+	assert daemon.job(again.id)["episodes"] == {"GA": "duplicate", "GB": "duplicate"}
+	dl.release.set()
+	wait(lambda: daemon.job(job.id)["state"] == "done")
+	assert daemon.job(job.id)["episodes"] == {"GA": "done", "GB": "done"}
+	failed = daemon.submit("episode", {"url": "https://e/missing"})
+	wait(lambda: daemon.job(failed.id)["state"] == "failed")
+	assert daemon.job(failed.id)["error"] == "unavailable"
+	assert daemon.status()["jobs"]["done"] == 2
+	daemon.close()
+
+def test_cancel():
+	daemon, dl, _ = build(**{SERIES: [episode("GA"), episode("GB"), episode("GC")]})
+	job = daemon.submit("series", {"url": SERIES})
+	wait(lambda: len(dl.started) == 2)
+	daemon.cancel(job.id)
+	assert dl.cancelled == {"GA", "GB", "GC"}
+	dl.release.set()
+	wait(lambda: daemon.job(job.id)["state"] == "cancelled")
+	daemon.close()
+
+def test_resubmitting_a_cancelled_episode():
+	daemon, dl, _ = build(**{SERIES: [episode("GA")]})
+	job = daemon.submit("series", {"url": SERIES})
+	wait(lambda: dl.started == ["GA"])
+	daemon.cancel(job.id)
+	dl.release.set()
+	wait(lambda: daemon.job(job.id)["state"] == "cancelled")
+	again = daemon.submit("series", {"url": SERIES})
+	wait(lambda: daemon.job(again.id)["state"] == "done")
+	assert dl.started == ["GA", "GA"] and dl.cancelled == set()
+	daemon.close()
+
+def test_cancelled_episodes_are_not_dead_lettered(tmp_path):
+	letters = DeadLetters(str(tmp_path / "dead_letter.json"))
+	downloader = Downloader(
+		{"username": "user", "password": "pass", "verbosity": False, "ffmpeg_location": None, "destination": "."},
+		pool = object(), dead_letters = letters
+	)
+	downloader.cancel("GA")
+	downloader.download("https://beta.crunchyroll.com/watch/GA/x", None)
+	with pytest.raises(Cancelled):
+		downloader._governor_hook({"status": "downloading", "info_dict": {"id": "GA"}})
+	assert downloader.outcomes() == (0, 1) and letters.report() == []
+	assert classify(Cancelled("GA")) == CANCELLED
+
+def request(base, method, path, body = None):
+	data = json.dumps(body).encode() if body is not None else None
+	try:
+		with urllib.request.urlopen(urllib.request.Request(base + path, data, method = method)) as response:
+			return response.status, json.loads(response.read())
+	except urllib.error.HTTPError as error:
+		return error.code, json.loads(error.read())
+
+def test_http_api():
+	daemon, dl, _ = build(**{"https://beta.crunchyroll.com/watch/GA/x": [episode("GA")]})
+	server = build_server(daemon, parse_job, port = 0)
+	threading.Thread(target = server.serve_forever, daemon = True).start()
+	base = "http://%s:%d" % server.server_address[:2]
+	stream = urllib.request.urlopen(base + "/events")
+	assert "status" in json.loads(stream.readline())
+
+	status, job = request(base, "POST", "/jobs", {"url": "https://beta.crunchyroll.com/watch/GA/x"})
+	assert status == 201 and job["kind"] == "episode"
+	assert request(base, "POST", "/jobs", {"url": "https://example.com"})[0] == 400
+	assert request(base, "GET", "/jobs/nothing")[0] == 404
+	dl.release.set()
+	received = []
+	for event in events(stream):
+		received.append(event)
+		if event.get("job") == job["id"] and event["state"] == "done" and "episode" not in event: break
+	assert [event["state"] for event in received if event.get("job")] == ["queued", "resolving", "downloading", "done", "done"]
+	assert request(base, "GET", f"/jobs/{job['id']}")[1]["episodes"] == {"GA": "done"}
+	assert [listed["id"] for listed in request(base, "GET", "/jobs")[1]] == [job["id"]]
+	assert request(base, "DELETE", f"/jobs/{job['id']}")[1]["state"] == "done"
+	assert request(base, "GET", "/status")[1]["jobs"]["done"] == 1
+	server.shutdown()
+	server.server_close()
+	daemon.close()
+	assert stream.read() == b""
+
+def test_unix_socket(tmp_path):
+	path = str(tmp_path / "api.sock")
+	daemon, _, _ = build()
+	server = build_server(daemon, parse_job, socket_path = path)
+	assert oct(os.stat(path).st_mode & 0o777) == "0o600"
+	server.server_close()
+	daemon.close()
+	assert not os.path.exists(path)
+
+def test_event_stream_drops_for_slow_clients():
+	stream = EventStream(backlog = 2)
+	subscriber = stream.subscribe()
+	stream.write('{"a": 1}\n{"a": 2}\n{"a": 3}\n')
+	assert (subscriber.get_nowait(), subscriber.get_nowait(), stream.dropped) == ('{"a": 1}', '{"a": 2}', 1)
+
+def test_jobs_parsed_concurrently_keep_their_own_url():
+	mixed = []
+
+	def submit(thread):
+		for number in range(300):
+			url = f"https://beta.crunchyroll.com/watch/G{thread}X{number}/x"
+			kind, entry = parse_job({"url": url, "priority": number % 5 + 1})
+			if entry["url"] != url: mixed.append(url)
+	threads = [threading.Thread(target = submit, args = (thread,)) for thread in range(8)]
+	for thread in threads: thread.start()
+	for thread in threads: thread.join()
+	assert mixed == []
@@ -0,0 +1,65 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.fragments import FragmentPool, FragmentError, parse_m3u8
+from ..benchmarks.media_server import MediaServer
+import concurrent.futures
+import urllib.request
+import pytest
+
+def fetch(url: str) -> bytes:
+	with urllib.request.urlopen(url) as response:
+		return response.read()
+
+def expected(episode: str, server: MediaServer) -> bytes:
+	return b"".join(server.fragment(episode, i, server.fragment_size) for i in range(server.fragments))
+
+def test_parse_m3u8():
+	manifest = "#EXTM3U\n#EXTINF:4.0,\nseg0.ts\n#EXTINF:4.0,\nhttp://cdn/seg1.ts\n#EXT-X-ENDLIST\n"
+	assert parse_m3u8(manifest, "http://host/a/playlist.m3u8") == ["http://host/a/seg0.ts", "http://cdn/seg1.ts"]
+	assert parse_m3u8("#EXTM3U\n#EXT-X-KEY:METHOD=AES-128,URI=\"k\"\nseg0.ts\n", "http://host/") is None
+	assert parse_m3u8("#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\nlow.m3u8\n", "http://host/") is None
+	assert parse_m3u8("<html>", "http://host/") is None
+
+def test_fragment_pool_reassembles_in_order(tmp_path):
+	pool = FragmentPool(workers = 4, max_in_flight = 4)
+	with MediaServer(fragments = 20, fragment_size = 1024, latency = 0.01) as server:
+		url = server.playlist_url("ep1")
+		urls = parse_m3u8(fetch(url).decode(), url)
+		seen = []
+		size = pool.download(urls, str(tmp_path / "ep1.ts"), fetch, lambda index, size: seen.append(index))
+		assert (tmp_path / "ep1.ts").read_bytes() == expected("ep1", server)
+	assert size == 20 * 1024
+	assert seen == list(range(1, 21))
+	pool.close()
+
+def test_fragment_pool_global_limit(tmp_path):
+	pool = FragmentPool(workers = 8, max_in_flight = 3)
+	with MediaServer(fragments = 10, fragment_size = 512, latency = 0.02) as server:
+		with concurrent.futures.ThreadPoolExecutor(max_workers = 3) as executor:
+			futures = []
+			for episode in ("a", "b", "c"):
+				url = server.playlist_url(episode)
+				urls = parse_m3u8(fetch(url).decode(), url)
+				futures.append(executor.submit(pool.download, urls, str(tmp_path / f"{episode}.ts"), fetch))
+			for future in futures: future.result()
+		for episode in ("a", "b", "c"):
+			assert (tmp_path / f"{episode}.ts").read_bytes() == expected(episode, server)
+	assert pool.peak_in_flight <= 3
+	assert pool.in_flight == 0
+	pool.close()
+
+def test_fragment_pool_retries(tmp_path):
+	pool = FragmentPool(workers = 2, max_in_flight = 2, retries = 2, backoff = 0)
+	with MediaServer(fragments = 5, fragment_size = 256, failures = {"/ep/segment3.ts": 2}) as server:
+		url = server.playlist_url("ep")
+		pool.download(parse_m3u8(fetch(url).decode(), url), str(tmp_path / "ep.ts"), fetch)
+		assert (tmp_path / "ep.ts").read_bytes() == expected("ep", server)
+	pool.close()
+
+def test_fragment_pool_gives_up(tmp_path):
+	pool = FragmentPool(workers = 2, max_in_flight = 2, retries = 1, backoff = 0)
+	with MediaServer(fragments = 5, fragment_size = 256, failures = {"/ep/segment1.ts": 5}) as server:
+		url = server.playlist_url("ep")
+		with pytest.raises(FragmentError):
+			pool.download(parse_m3u8(fetch(url).decode(), url), str(tmp_path / "ep.ts"), fetch)
+	assert pool.in_flight == 0
+	pool.close()
@@ -0,0 +1,65 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.governor import BandwidthGovernor, parse_rate
+from time import monotonic
+import threading
+import pytest
+
+@pytest.mark.parametrize(
+	('_input', 'expected'),
+	(('500', 500), ('500K', 500 * 1024), ('2.5M', 2.5 * 1024 ** 2), ('1G', 1024 ** 3),
+	 ('4MB/s', 4 * 1024 ** 2), ('3k', 3 * 1024), (1000, 1000))
+)
+def test_parse_rate(_input, expected):
+	assert parse_rate(_input) == expected
+
+@pytest.mark.parametrize(('_input'), ('', 'fast', '-5M', '0', '5T', 0))
+def test_parse_rate_error(_input):
+	with pytest.raises(ValueError):
+		parse_rate(_input)
+
+def test_governor_unlimited_only_accounts():
+	governor = BandwidthGovernor()
+	start = monotonic()
+	for _ in range(100): governor.consume(1024 ** 2)
+	assert monotonic() - start < 0.5
+	assert governor.total_bytes == 100 * 1024 ** 2
+	assert governor.bytes_per_second() > 0
+
+def test_governor_limits_rate():
+	governor = BandwidthGovernor(rate = 100_000, burst = 10_000)
+	start = monotonic()
+	threads = [threading.Thread(target=lambda: [governor.consume(5_000) for _ in range(6)]) for _ in range(2)]
+	for thread in threads: thread.start()
+	for thread in threads: thread.join()
+	# 60KB at 100KB/s with a 10KB burst needs at least 0.5s
+	assert monotonic() - start >= 0.45
+	assert governor.total_bytes == 60_000
+
+def test_governor_weighted_share():
+	governor = BandwidthGovernor(rate = 200_000, burst = 2_000)
+	granted = {"urgent": 0, "normal": 0}
+	stop = threading.Event()
+
+	def worker(flow, weight):
+		while not stop.is_set():
+			governor.consume(1_000, flow, weight)
+			granted[flow] += 1_000
+
+	threads = [
+		threading.Thread(target=worker, args=("urgent", 3)),
+		threading.Thread(target=worker, args=("normal", 1)),
+	]
+	for thread in threads: thread.start()
+	threading.Event().wait(0.6)
+	stop.set()
+	for thread in threads: thread.join()
+	assert granted["urgent"] > 2 * granted["normal"]
+
+def test_governor_set_rate_releases_waiters():
+	governor = BandwidthGovernor(rate = 1, burst = 1)
+	governor.consume(1)
+	thread = threading.Thread(target=governor.consume, args=(1_000_000,))
+	thread.start()
+	governor.set_rate(None)
+	thread.join(1)
+	assert not thread.is_alive()
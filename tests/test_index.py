@@ -0,0 +1,66 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.index import DownloadIndex, file_hash
+from ..crunchy_dl.main import Downloader, skip
+from time import perf_counter
+import os
+
+ARGS = {"username": "user", "password": "pass", "verbosity": False, "ffmpeg_location": None, "destination": "."}
+
+def media(directory, name, data = b"VIDEO"):
+	path = directory / name
+	path.parent.mkdir(parents=True, exist_ok=True)
+	path.write_bytes(data)
+	return str(path)
+
+def test_index_add_and_lookup(tmp_path):
+	index = DownloadIndex(str(tmp_path / "index.sqlite3"))
+	path = media(tmp_path, "Episode 1 [G1].mp4")
+	index.add("G1", path)
+	assert index.lookup("G1") == {"episode_id": "G1", "path": path, "size": 5, "hash": file_hash(path)}
+	assert index.has("G1") and not index.has("G2")
+	os.remove(path)
+	# a moved or deleted file no longer counts as downloaded
+	assert not index.has("G1")
+	assert index.count() == 0
+	index.close()
+
+def test_file_hash_samples(tmp_path):
+	large = media(tmp_path, "large.mkv", os.urandom(5 * 1024 * 1024))
+	copy = media(tmp_path, "copy.mkv", open(large, "rb").read())
+	assert file_hash(large) == file_hash(copy)
+	assert file_hash(large) != file_hash(media(tmp_path, "small.mkv", b"x"))
+
+def test_index_scan(tmp_path):
+	library = tmp_path / "library"
+	for number in range(200):
+		media(library / f"season {number % 3}", f"Episode {number} [G{number}].mkv", f"episode {number}".encode())
+	media(library, "notes.txt")
+	index = DownloadIndex(str(tmp_path / "index.sqlite3"))
+	assert index.scan([str(library)], workers = 8) == (200, 0)
+	assert index.count() == 200 and index.has("G150")
+
+	# renamed files are matched by hash, unchanged files are not read again
+	os.rename(library / "season 1" / "Episode 1 [G1].mkv", library / "renamed.mkv")
+	media(library, "unknown.mkv", b"something else")
+	assert index.scan([str(library)]) == (200, 1)
+	assert index.lookup("G1")["path"] == str(library / "renamed.mkv")
+	index.close()
+
+def test_index_lookup_scales(tmp_path):
+	index = DownloadIndex(str(tmp_path / "index.sqlite3"))
+	index._store([(f"G{number}", f"/library/{number}.mkv", number, "hash", 0.0, 0.0) for number in range(50000)])
+	start = perf_counter()
+	for number in range(0, 50000, 25):
+		assert index.lookup(f"G{number}", verify = False)["size"] == number
+	assert perf_counter() - start < 1
+	index.close()
+
+def test_indexed_episodes_skipped_and_recorded(tmp_path):
+	index = DownloadIndex(str(tmp_path / "index.sqlite3"))
+	downloader = Downloader(ARGS, index = index)
+	path = media(tmp_path, "Episode 1 [G1].mp4")
+	downloader.finish("G1", True, filepath = path)
+	downloader.finish("G2", False, filepath = path)
+	resolved = [({"id": "G1"}, None), ({"id": "G2"}, None)]
+	assert [entry["id"] for entry, _ in skip(resolved, index.has)] == ["G2"]
+	index.close()
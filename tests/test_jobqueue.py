@@ -0,0 +1,120 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.jobqueue import JobQueue, Worker
+import multiprocessing
+import threading
+import time
+import pytest
+
+def entry(episode_id: str, priority: float = 1):
+	return {
+		"id": episode_id, "url": f"https://beta.crunchyroll.com/watch/{episode_id}/x", "title": episode_id,
+		"season_number": 1, "episode_number": 1, "priority": priority, "formats": [],
+	}
+
+@pytest.fixture
+def queue_path(tmp_path):
+	return str(tmp_path / "queue.sqlite3")
+
+def test_claims_by_priority_once(queue_path):
+	queue = JobQueue(queue_path)
+	assert queue.put([(entry("GA"), []), (entry("GB", 2), [{"format": "best"}]), (entry("GC"), [])]) == 3
+	assert queue.put([(entry("GA"), [])]) == 0
+	other = JobQueue(queue_path)
+	first, args = queue.claim("one")
+	assert first["id"] == "GB" and args == [{"format": "best"}] and "formats" not in first
+	assert other.claim("two")[0]["id"] == "GA"
+	assert queue.claim("one")[0]["id"] == "GC"
+	assert other.claim("two") is None
+	assert not other.complete("GA", "one") and other.complete("GA", "two")
+	assert queue.fail("GB", "one", "boom")
+	assert queue.counts() == {"queued": 0, "leased": 1, "done": 1, "failed": 1}
+	# re-running the coordinator queues failed jobs again and keeps finished ones
+	assert queue.put([(entry("GA"), []), (entry("GB", 2), [])]) == 1
+	assert queue.counts()["queued"] == 1
+
+def test_expired_leases_are_taken_over(queue_path):
+	queue = JobQueue(queue_path, max_attempts = 2)
+	queue.put([(entry("GA"), [])])
+	queue.claim("dead", lease = 0.05)
+	assert queue.claim("alive") is None
+	time.sleep(0.1)
+	assert queue.claim("alive", lease = 0.05)[0]["id"] == "GA"
+	assert queue.reclaimed == 1
+	# the first worker comes back: its lease is gone and its result is ignored
+	assert queue.heartbeat("dead", ["GA"]) == set()
+	assert not queue.complete("GA", "dead")
+	time.sleep(0.1)
+	assert queue.claim("third") is None
+	failed = queue.jobs(["failed"])
+	assert [(job["id"], job["error"]) for job in failed] == [("GA", "lease expired 2 times")]
+
+def test_heartbeat_and_release(queue_path):
+	queue = JobQueue(queue_path)
+	queue.put([(entry("GA"), []), (entry("GB"), [])])
+	queue.claim("one", lease = 0.1)
+	queue.claim("one", lease = 0.1)
+	time.sleep(0.06)
+	assert queue.heartbeat("one", ["GA", "GB"], lease = 10) == {"GA", "GB"}
+	time.sleep(0.06)
+	assert queue.claim("two") is None
+	queue.release("one", ["GB"])
+	job = queue.claim("two")
+	assert job[0]["id"] == "GB" and queue.jobs(["leased"])[1]["attempts"] == 1
+
+def test_worker_holds_at_most_its_capacity(queue_path):
+	queue = JobQueue(queue_path)
+	queue.put([(entry(f"G{number}"), []) for number in range(5)])
+	worker = Worker(queue, "node", capacity = 2, poll = 0.05)
+	claims = worker.claims(done = lambda episode_id: episode_id == "G4")
+	seen = [next(claims)[0]["id"], next(claims)[0]["id"]]
+	third = []
+	thread = threading.Thread(target = lambda: third.append(next(claims)))
+	thread.start()
+	thread.join(0.2)
+	# both slots are taken, nothing else is leased until one finishes
+	assert thread.is_alive() and queue.counts()["leased"] == 2
+	worker.finished(seen[0], True)
+	thread.join(1)
+	worker.finished(seen[1], False, "boom")
+	worker.finished(third[0][0]["id"], True)
+	seen.append(next(claims)[0]["id"])
+	worker.finished(seen[-1], True)
+	assert list(claims) == []
+	assert queue.counts() == {"queued": 0, "leased": 0, "done": 4, "failed": 1}
+	assert (worker.completed, worker.failed) == (3, 1)
+
+def work(path, name, results):
+	queue = JobQueue(path)
+	worker = Worker(queue, name, capacity = 2, lease = 5, poll = 0.05)
+	worker.start()
+	for entry, args in worker.claims():
+		time.sleep(0.01)
+		results.put((name, entry["id"]))
+		worker.finished(entry["id"], True)
+	worker.close()
+	queue.close()
+
+def test_worker_processes_share_the_queue(queue_path):
+	queue = JobQueue(queue_path)
+	queue.put([(entry(f"G{number}"), []) for number in range(40)])
+	context = multiprocessing.get_context("fork")
+	results = context.Queue()
+	processes = [context.Process(target = work, args = (queue_path, f"node{n}", results)) for n in range(3)]
+	for process in processes: process.start()
+	done = [results.get(timeout = 30) for _ in range(40)]
+	for process in processes: process.join(30)
+	assert sorted(episode_id for _, episode_id in done) == sorted(f"G{number}" for number in range(40))
+	assert len({name for name, _ in done}) > 1
+	assert queue.counts() == {"queued": 0, "leased": 0, "done": 40, "failed": 0}
+
+def test_status_command(tmp_path, queue_path, capsys):
+	from ..crunchy_dl.cli import main
+	queue = JobQueue(queue_path)
+	queue.put([(entry("GA"), []), (entry("GB"), [])])
+	queue.claim("node", lease = 600)
+	config = tmp_path / "config.yaml"
+	config.write_text(f"username: user\npassword: pass\nffmpeg_location: ffmpeg\ndestination: {tmp_path}\ndownload: {{}}\n")
+	assert main(["coordinate", str(config), "--queue", queue_path, "--status"]) == 0
+	out = capsys.readouterr().out
+	assert "GA" in out and "node" in out and "GB" not in out
+	assert out.strip().endswith(f"[QUEUE] {queue_path}: 1 queued, 1 leased, 0 done, 0 failed")
@@ -0,0 +1,68 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.journal import Journal
+from ..crunchy_dl.schema import CONFIG_SCHEMA
+from cerberus import Validator
+import pytest
+
+def entry(episode_id: str, number: int):
+	return {
+		"id": episode_id, "url": f"https://beta.crunchyroll.com/watch/{episode_id}/x",
+		"title": f"Episode {number}", "season_number": 1, "episode_number": number, "formats": [],
+	}
+
+@pytest.fixture
+def journal_path(tmp_path):
+	return str(tmp_path / "journal.jsonl")
+
+def test_journal_replays_state(journal_path):
+	journal = Journal(journal_path)
+	for number, episode_id in enumerate(("GA", "GB", "GC"), 1):
+		journal.resolved(entry(episode_id, number), [])
+	journal.update("GA", "downloading")
+	journal.update("GA", "done")
+	journal.update("GB", "downloading")
+	journal.close()
+
+	journal = Journal(journal_path)
+	assert journal.is_done("GA")
+	assert not journal.is_done("GB")
+	assert sorted(e["id"] for e, _ in journal.pending()) == ["GB", "GC"]
+	assert "formats" not in journal.pending()[0][0]
+
+def test_journal_ignores_torn_line(journal_path):
+	journal = Journal(journal_path)
+	journal.resolved(entry("GA", 1), [])
+	journal.close()
+	with open(journal_path, "a") as f:
+		f.write('{"id": "GA", "sta')
+	journal = Journal(journal_path)
+	assert [e["id"] for e, _ in journal.pending()] == ["GA"]
+	# records written after the torn line are still there on the next replay
+	journal.resolved(entry("GB", 2), [])
+	journal.close()
+	assert [e["id"] for e, _ in Journal(journal_path).pending()] == ["GA", "GB"]
+
+def test_journal_rejects_unknown_state(journal_path):
+	with pytest.raises(ValueError):
+		Journal(journal_path).update("GA", "exploded")
+
+def test_journal_compact(journal_path):
+	journal = Journal(journal_path)
+	journal.resolved(entry("GA", 1), [])
+	for state in ("downloading", "muxing", "done"):
+		journal.update("GA", state)
+	journal.compact()
+	journal.close()
+	with open(journal_path) as f:
+		assert len(f.readlines()) == 1
+	assert Journal(journal_path).is_done("GA")
+
+def test_journal_history_matches_schema(journal_path):
+	journal = Journal(journal_path)
+	journal.resolved(entry("GA", 1), [])
+	journal.resolved(entry("GB", 2), [])
+	journal.update("GA", "done")
+	history = journal.history()
+	assert len(history) == 1 and history[0]["completed"] == False
+	assert history[0]["queue"] == [{"url": entry("GB", 2)["url"], "args": []}]
+	assert Validator({"history": CONFIG_SCHEMA["history"]}).validate({"history": history})
@@ -0,0 +1,118 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.manifest import walk, read, merge, load_manifest
+from ..crunchy_dl.pipeline import FairQueue, round_robin
+from ..crunchy_dl.check import check
+from cerberus import DocumentError
+import concurrent.futures
+import threading
+import pytest
+
+MAIN = """username: user
+password: pass
+ffmpeg_location: ffmpeg
+destination: {destination}
+threads: 4
+include:
+  - team/*.yml
+download:
+  series:
+    - url: https://beta.crunchyroll.com/series/GYQ4MKDZ6/gintama
+      episodes: 1-3
+"""
+
+ALICE = """threads: 8
+download:
+  series:
+    - url: https://beta.crunchyroll.com/series/GYQ4MKDZ6/gintama
+      episodes: 2-5
+  episodes:
+    - url: https://beta.crunchyroll.com/watch/GYK5PJV7R/enter-naruto-uzumaki
+"""
+
+BOB = """include: [alice.yml]
+download:
+  episodes:
+    - url: https://beta.crunchyroll.com/fr/watch/GYK5PJV7R/enter-naruto-uzumaki
+    - url: https://beta.crunchyroll.com/watch/GRWEXZWJR/gintama-1
+"""
+
+def manifest(tmp_path):
+	(tmp_path / "team").mkdir()
+	(tmp_path / "main.yml").write_text(MAIN.format(destination = tmp_path))
+	(tmp_path / "team" / "alice.yml").write_text(ALICE)
+	(tmp_path / "team" / "bob.yml").write_text(BOB)
+	return str(tmp_path / "main.yml")
+
+def test_includes_are_followed_once(tmp_path):
+	main = manifest(tmp_path)
+	assert [path.rsplit("/", 1)[1] for path, _ in walk([main], read)] == ["main.yml", "alice.yml", "bob.yml"]
+	(tmp_path / "team" / "alice.yml").write_text("include: [bob.yml]\n")
+	with pytest.raises(DocumentError):
+		walk([main], read)
+	with pytest.raises(DocumentError):
+		walk([str(tmp_path / "missing*.yml")], read)
+
+def test_settings_from_first_file_and_entries_from_all(tmp_path):
+	config, warnings = load_manifest([manifest(tmp_path)])
+	assert config["threads"] == 4
+	assert [warning for _, warning in warnings] == [f"threads is already set by {tmp_path}/main.yml, this value is ignored"]
+	assert [entry["source"].rsplit("/", 1)[1] for entry in config["download"]["series"]] == ["main.yml", "alice.yml"]
+	# the same episode by another URL form is queued once
+	assert [entry["url"].rsplit("/", 1)[1] for entry in config["download"]["episodes"]] == ["enter-naruto-uzumaki", "gintama-1"]
+
+def test_settings_may_live_in_any_file(tmp_path):
+	main = manifest(tmp_path)
+	(tmp_path / "team" / "alice.yml").write_text("download: {}\n")
+	credentials = tmp_path / "secrets.yml"
+	credentials.write_text("username: user\npassword: pass\nffmpeg_location: ffmpeg\n")
+	(tmp_path / "main.yml").write_text(MAIN.format(destination = tmp_path).split("username: user\npassword: pass\nffmpeg_location: ffmpeg\n")[1])
+	with pytest.raises(DocumentError):
+		load_manifest([main])
+	config, _ = load_manifest([main, str(credentials)])
+	assert config["username"] == "user"
+
+def test_check_reports_across_files(tmp_path, capsys):
+	assert check([manifest(tmp_path)]) == 0
+	output = capsys.readouterr().out
+	assert "alice.yml:4: warning: download.series.0: overlaps download.series.0 in" in output
+	assert "bob.yml:4: warning: download.episodes.0: duplicates download.episodes.0 in" in output
+	assert output.splitlines()[-1] == "[CONFIG] 3 files are valid: 1 series, 2 episodes, 3 warnings"
+
+def test_round_robin():
+	assert round_robin(["a1", "a2", "a3", "b1", "c1", "c2"], lambda item: item[0]) == ["a1", "b1", "c1", "a2", "c2", "a3"]
+
+def test_fair_queue_shares_workers_between_sources():
+	started = []
+	release = threading.Event()
+	with concurrent.futures.ThreadPoolExecutor(max_workers = 1) as executor:
+		def submit(entry, args):
+			return executor.submit(lambda: (started.append(entry["id"]), release.wait(5)))
+		queue = FairQueue(submit, window = 1)
+		# the first file resolves everything before the second file's only episode arrives
+		for number in range(4):
+			queue.put({"id": f"a{number}", "source": "a.yml"}, None)
+		queue.put({"id": "b0", "source": "b.yml"}, None)
+		release.set()
+		queue.drain()
+	assert started == ["a0", "a1", "b0", "a2", "a3"]
+	assert len(queue.futures) == 5
+
+def test_fair_queue_hands_out_finished_futures_without_recursion():
+	held = [concurrent.futures.Future() for _ in range(4)]
+
+	def submit(entry, args):
+		if held: return held.pop(0)
+		future = concurrent.futures.Future()
+		future.set_result(None)
+		return future
+	queue = FairQueue(submit, window = 4)
+	pending = list(held)
+	for number in range(3000):
+		queue.put({"id": f"a{number}", "source": "a.yml"}, None)
+	# each done callback runs inline for an episode that finishes at once, e.g. a cancelled one
+	pending[0].set_result(None)
+	drained = threading.Thread(target = queue.drain, daemon = True)
+	drained.start()
+	drained.join(5)
+	assert not drained.is_alive()
+	assert len(queue.futures) == 3000 and queue._in_flight == 3
@@ -0,0 +1,35 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.pipeline import Pipeline
+import threading
+
+def entry(episode_id: str):
+	return {"id": episode_id, "url": f"https://beta.crunchyroll.com/watch/{episode_id}/x"}
+
+def test_pipeline_downloads_before_slow_extraction_finishes():
+	slow_release = threading.Event()
+	downloaded = []
+
+	def fast_extract(meta_data, args):
+		return ([entry("FAST1"), entry("FAST2")], args)
+
+	def slow_extract(meta_data, args):
+		assert slow_release.wait(5)
+		return ([entry("SLOW1")], args)
+
+	def download(url, args):
+		downloaded.append(url)
+		if len(downloaded) == 2: slow_release.set()
+
+	pipeline = Pipeline(download, extract_workers = 2, download_workers = 2)
+	futures = pipeline.run(pipeline.resolve([(slow_extract, {}, []), (fast_extract, {}, [])]))
+	assert len(futures) == 3
+	assert [future.exception() for future in futures] == [None] * 3
+	assert downloaded[-1].endswith("SLOW1/x")
+
+def test_pipeline_preview_mode():
+	queued = []
+	pipeline = Pipeline(lambda url, args: None, extract_workers = 1, download_workers = 1)
+	resolved = list(pipeline.resolve([(lambda m, a: ([entry("A"), entry("B")], a), {}, ["arg"])]))
+	assert resolved == [(entry("A"), ["arg"]), (entry("B"), ["arg"])]
+	pipeline.run(resolved, on_queued=lambda e, a: queued.append(e["id"]))
+	assert queued == ["A", "B"]
@@ -0,0 +1,84 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.pool import SessionPool, is_auth_error
+from http.cookiejar import Cookie, CookieJar
+import concurrent.futures
+import threading
+import pytest
+
+def make_cookie(name: str, value: str) -> Cookie:
+	return Cookie(
+		0, name, value, None, False, ".crunchyroll.com", True, True, "/", True,
+		False, None, False, None, None, {}
+	)
+
+class StubDownloader:
+	def __init__(self, args):
+		self.args = args
+		self.cookiejar = CookieJar()
+
+class StubHTTPError(Exception):
+	def __init__(self, code):
+		self.code = code
+
+class StubExtractorError(Exception):
+	def __init__(self, cause):
+		self.cause = cause
+
+class StubExtractor:
+	logins = 0
+	lock = threading.Lock()
+	expire_next = False
+
+	def __init__(self, downloader):
+		self._downloader = downloader
+
+	def _perform_login(self, username, password):
+		with StubExtractor.lock:
+			StubExtractor.logins += 1
+		self._downloader.cookiejar.set_cookie(make_cookie("etp_rt", f"{username}-{StubExtractor.logins}"))
+
+	def _real_extract(self, url):
+		if StubExtractor.expire_next:
+			StubExtractor.expire_next = False
+			raise StubExtractorError(StubHTTPError(401))
+		cookies = {c.name: c.value for c in self._downloader.cookiejar}
+		return {"url": url, "token": cookies.get("etp_rt")}
+
+@pytest.fixture(autouse=True)
+def reset_stub():
+	StubExtractor.logins = 0
+	StubExtractor.expire_next = False
+
+def test_session_pool_logs_in_once():
+	pool = SessionPool(StubDownloader, "user", "pass")
+	with concurrent.futures.ThreadPoolExecutor(max_workers = 4) as executor:
+		results = list(executor.map(lambda i: pool.extract(StubExtractor, f"url-{i}"), range(40)))
+	assert StubExtractor.logins == 1
+	assert pool.logins == 1
+	assert all(result["token"] == "user-1" for result in results)
+
+def test_session_pool_reuses_worker_downloader():
+	pool = SessionPool(StubDownloader, "user", "pass")
+	assert pool.downloader(["a"]) is pool.downloader(["a"])
+	assert pool.downloader(["a"]) is not pool.downloader(["b"])
+
+def test_session_pool_reauthenticates_on_expiry():
+	invalidated = []
+	pool = SessionPool(StubDownloader, "user", "pass", on_invalidate=lambda: invalidated.append(True))
+	assert pool.extract(StubExtractor, "first")["token"] == "user-1"
+	StubExtractor.expire_next = True
+	assert pool.extract(StubExtractor, "second")["token"] == "user-2"
+	assert StubExtractor.logins == 2
+	assert invalidated == [True]
+
+def test_session_pool_ttl():
+	pool = SessionPool(StubDownloader, "user", "pass", ttl=0)
+	pool.extract(StubExtractor, "first")
+	pool.extract(StubExtractor, "second")
+	assert StubExtractor.logins == 2
+
+def test_is_auth_error():
+	assert is_auth_error(StubExtractorError(StubHTTPError(401)))
+	assert is_auth_error(StubExtractorError(StubHTTPError(403)))
+	assert not is_auth_error(StubExtractorError(StubHTTPError(404)))
+	assert not is_auth_error(ValueError("boom"))
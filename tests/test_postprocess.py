@@ -0,0 +1,87 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.postprocess import PostProcessPool, embed_subtitles, ffmpeg_binary
+import subprocess
+import sys
+import threading
+import pytest
+
+FAKE_FFMPEG = """#!{python}
+import sys
+args = sys.argv[1:]
+inputs = [args[i + 1] for i, arg in enumerate(args) if arg == "-i"]
+if any("broken" in path for path in inputs):
+    sys.exit(1)
+with open(args[-1], "wb") as out:
+    for path in inputs:
+        out.write(open(path, "rb").read())
+    out.write(" ".join(args).encode())
+"""
+
+@pytest.fixture
+def ffmpeg(tmp_path):
+	path = tmp_path / "ffmpeg"
+	path.write_text(FAKE_FFMPEG.format(python=sys.executable))
+	path.chmod(0o755)
+	return str(path)
+
+def media(tmp_path, name):
+	video = tmp_path / f"{name}.mp4"
+	video.write_bytes(b"VIDEO")
+	sub = tmp_path / f"{name}.en.ass"
+	sub.write_bytes(b"SUB")
+	return str(video), [("en", str(sub))]
+
+def test_ffmpeg_binary(tmp_path):
+	assert ffmpeg_binary(None) == "ffmpeg"
+	assert ffmpeg_binary(str(tmp_path)) == str(tmp_path / "ffmpeg")
+	assert ffmpeg_binary("/opt/ffmpeg-6") == "/opt/ffmpeg-6"
+
+def test_embed_subtitles(tmp_path, ffmpeg):
+	video, subtitles = media(tmp_path, "ep1")
+	assert embed_subtitles(ffmpeg, video, subtitles) == video
+	output = open(video, "rb").read()
+	assert output.startswith(b"VIDEOSUB")
+	assert b"-c:s mov_text" in output and b"language=en" in output
+	assert not (tmp_path / "ep1.en.ass").exists()
+	assert not (tmp_path / "ep1.temp.mp4").exists()
+
+def test_embed_subtitles_failure_keeps_original(tmp_path, ffmpeg):
+	video, _ = media(tmp_path, "broken")
+	with pytest.raises(subprocess.CalledProcessError):
+		embed_subtitles(ffmpeg, video, [("en", str(tmp_path / "broken.en.ass"))])
+	assert open(video, "rb").read() == b"VIDEO"
+
+def test_postprocess_pool(tmp_path, ffmpeg):
+	pool = PostProcessPool(ffmpeg, workers = 2)
+	results = []
+	lock = threading.Lock()
+
+	def callback(error):
+		with lock: results.append(error)
+
+	for name in ("a", "b", "c", "broken"):
+		pool.submit(*media(tmp_path, name), callback)
+	pool.close()
+	assert pool.depth == 0
+	assert pool.completed == 3 and pool.failed == 1
+	assert sum(error is None for error in results) == 3
+
+def test_slow_callbacks_do_not_hold_up_other_results(tmp_path, ffmpeg):
+	pool = PostProcessPool(ffmpeg, workers = 2)
+	arrived = []
+	released = threading.Event()
+	waited = []
+	lock = threading.Lock()
+
+	def callback(error):
+		with lock:
+			arrived.append(error)
+			first = len(arrived) == 1
+		# the first result blocks, like a finish() copying to a slow destination, until the second arrives
+		if first: waited.append(released.wait(5))
+		else: released.set()
+
+	for name in ("a", "b"):
+		pool.submit(*media(tmp_path, name), callback)
+	pool.close()
+	assert waited == [True] and len(arrived) == 2
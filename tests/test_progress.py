@@ -0,0 +1,106 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.progress import ProgressAggregator, format_bytes, format_eta
+from ..crunchy_dl.main import session
+import concurrent.futures
+import io
+import json
+import pytest
+
+def status(episode_id, state, filename, done, total=None, speed=None):
+	return {
+		"status": state, "filename": filename, "downloaded_bytes": done,
+		"total_bytes": total, "speed": speed, "info_dict": {"id": episode_id},
+	}
+
+class TTY(io.StringIO):
+	def isatty(self):
+		return True
+
+def test_format_helpers():
+	assert format_bytes(512) == "512.0B"
+	assert format_bytes(3 * 1024 ** 2) == "3.0MiB"
+	assert format_eta(None) == "--:--"
+	assert format_eta(75) == "01:15"
+	assert format_eta(3725) == "1:02:05"
+
+def test_progress_rejects_unknown_format():
+	with pytest.raises(ValueError):
+		ProgressAggregator("xml")
+
+def test_progress_aggregates_concurrent_hooks():
+	progress = ProgressAggregator("none")
+
+	def worker(episode):
+		progress.queued(episode, f"Episode {episode}")
+		for done in range(0, 1001, 100):
+			progress.hook(status(episode, "downloading", f"{episode}.mp4", done, 1000, 50.0))
+		progress.hook(status(episode, "finished", f"{episode}.mp4", 1000, 1000))
+		progress.state(episode, "done")
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers = 8) as executor:
+		list(executor.map(worker, [f"E{i}" for i in range(32)]))
+	progress.drain()
+	summary = progress.summary()
+	assert summary["states"] == {"done": 32}
+	assert summary["downloaded_bytes"] == 32 * 1000
+
+def test_progress_episode_speed_and_eta():
+	progress = ProgressAggregator("none")
+	progress.hook(status("E1", "downloading", "video.mp4", 400, 1000, 100.0))
+	progress.hook(status("E1", "downloading", "audio.m4a", 100, 200, 50.0))
+	progress.drain()
+	episode = progress.episodes["E1"]
+	assert episode.state == "downloading"
+	assert episode.downloaded_bytes == 500
+	assert episode.total_bytes == 1200
+	assert episode.speed == 150.0
+	assert episode.eta == pytest.approx(700 / 150)
+	progress.postprocessor_hook({"status": "started", "info_dict": {"id": "E1"}})
+	progress.drain()
+	assert episode.state == "muxing"
+
+def test_progress_json_lines():
+	stream = io.StringIO()
+	progress = ProgressAggregator("json", stream, interval = 10)
+	progress.start()
+	progress.queued("E1", "First")
+	progress.hook(status("E1", "downloading", "video.mp4", 10, 100, 5.0))
+	progress.state("E1", "done")
+	progress.stop()
+	lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+	assert lines[0]["id"] == "E1" and lines[0]["state"] == "done" and lines[0]["title"] == "First"
+	assert lines[-1]["summary"]["states"] == {"done": 1}
+
+def test_progress_text_redraws_in_place():
+	stream = TTY()
+	progress = ProgressAggregator("text", stream)
+	progress.hook(status("E1", "downloading", "video.mp4", 10, 100, 5.0))
+	progress.render()
+	progress.render()
+	output = stream.getvalue()
+	assert "[0/1 done, 0 failed]" in output
+	assert "\x1b[2F" in output
+
+def test_progress_text_without_tty():
+	stream = io.StringIO()
+	progress = ProgressAggregator("text", stream)
+	progress.queued("E1", "First")
+	progress.state("E1", "done")
+	progress.render()
+	assert stream.getvalue() == "[DONE] First\n"
+
+class FakeSessionPool:
+	def __init__(self, build_downloader, username, password, on_invalidate = None, tracer = None):
+		pass
+
+def test_session_json_progress_without_scaler(tmp_path):
+	config = {
+		"username": "user", "password": "pass", "verbosity": False, "ffmpeg_location": None,
+		"destination": str(tmp_path), "threads": 2, "yes": True, "download": {},
+		"cache": {"enabled": False}, "journal": {"enabled": False}, "index": {"enabled": False},
+		"postprocess": {"workers": 0}, "retry": {"dead_letter": str(tmp_path / "dead_letter.json")},
+		"progress": {"format": "json", "file": str(tmp_path / "progress.jsonl"), "interval": 0.01},
+	}
+	session(config, pool_class = FakeSessionPool)
+	lines = [json.loads(line) for line in (tmp_path / "progress.jsonl").read_text().splitlines()]
+	assert lines[-1]["summary"]["queues"] == {"download queue": 0}
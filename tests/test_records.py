@@ -0,0 +1,70 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.records import EpisodeRecord, pages
+from ..crunchy_dl.main import AnimeEpisode, Downloader
+import inspect
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARGS = {"username": "user", "password": "pass", "verbosity": False, "ffmpeg_location": None, "destination": "."}
+
+def info(number):
+	return {
+		"id": f"G{number}", "title": f"Episode {number}", "season_number": 1, "episode_number": number,
+		"series_id": "GSERIES", "description": "x" * 300, "thumbnails": [{"url": f"https://img/{number}/{size}"} for size in range(8)],
+		"formats": [{"format_id": f"hls-{height}", "url": f"https://cdn/{number}/{height}.m3u8", "height": height} for height in range(20)],
+	}
+
+class FakePool:
+	def extract(self, ie_class, url, args=None):
+		return info(1)
+
+def test_record_reads_like_its_info():
+	record = EpisodeRecord.from_info(info(3), url = "https://beta.crunchyroll.com/watch/G3/", priority = 2)
+	assert record["id"] == "G3" and record.get("episode_number") == 3 and record.get("priority", 1) == 2
+	# unset fields are absent, as they would be from a dict
+	assert "source" not in record and record.get("source") is None and "formats" not in record
+	assert record == {
+		"id": "G3", "url": "https://beta.crunchyroll.com/watch/G3/", "title": "Episode 3", "season_number": 1,
+		"episode_number": 3, "series_id": "GSERIES", "priority": 2,
+	}
+	assert not hasattr(record, "__dict__")
+
+def test_episode_extraction_keeps_a_record():
+	dl = AnimeEpisode(ARGS, pool=FakePool(), index=False)
+	data, _ = dl.extract_info({"url": "https://beta.crunchyroll.com/watch/G1/", "source": "a.yaml"}, None)
+	assert isinstance(data[0], EpisodeRecord)
+	assert data[0]["source"] == "a.yaml" and data[0]["priority"] == 1 and "formats" not in data[0]
+
+def test_preview_is_printed_a_page_at_a_time(capsys):
+	taken = []
+
+	def entries():
+		for number in range(1, 6):
+			taken.append(number)
+			yield EpisodeRecord.from_info(info(number))
+	assert [len(page) for page in pages(range(5), 2)] == [2, 2, 1]
+	Downloader(ARGS, pool=FakePool(), index=False).stdout(entries(), page_size = 2)
+	output = capsys.readouterr().out
+	assert output.count("| id |") == 3 and "Episode 5" in output
+	assert output.splitlines()[-1] == "[PREVIEW] 5 episodes" and taken == [1, 2, 3, 4, 5]
+
+def peak_growth(keep):
+	"""
+	Peak RSS growth in KiB of a fresh interpreter holding 20000 extracted episodes as `keep` makes them.
+	"""
+	code = (
+		f"import resource\nfrom crunchy_dl.records import EpisodeRecord\n{inspect.getsource(info)}\n"
+		"before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+		f"held = [{keep} for number in range(20000)]\n"
+		"print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)"
+	)
+	output = subprocess.run([sys.executable, "-c", code], cwd = ROOT, capture_output = True, text = True, check = True)
+	return int(output.stdout.strip())
+
+def test_records_bound_peak_memory():
+	records = peak_growth("EpisodeRecord.from_info(info(number))")
+	infos = peak_growth("info(number)")
+	assert records * 10 < infos
+	assert records < 16 * 1024
@@ -0,0 +1,187 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.retry import (
+	AUTH, NETWORK, POSTPROCESS, UNAVAILABLE, UNKNOWN, DeadLetters, RetryPolicy, StageFailure, backoff_delay, classify
+)
+from ..crunchy_dl.main import Downloader, session
+import io
+import sys
+import urllib.error
+import pytest
+import yt_dlp.utils
+
+ARGS = {"username": "user", "password": "pass", "verbosity": False, "ffmpeg_location": None, "destination": "."}
+
+def http_error(code):
+	return urllib.error.HTTPError("http://cdn/ep.mp4", code, "error", {}, io.BytesIO())
+
+def wrapped(error):
+	"""
+	Raises `error` the way yt-dlp reports it: a DownloadError holding an ExtractorError.
+	"""
+	try:
+		try:
+			raise error
+		except Exception as cause:
+			raise yt_dlp.utils.ExtractorError("Unable to download webpage", cause = cause)
+	except yt_dlp.utils.ExtractorError:
+		return yt_dlp.utils.DownloadError("ERROR: Unable to download webpage", sys.exc_info())
+
+def test_classify():
+	assert classify(http_error(503)) == NETWORK
+	assert classify(wrapped(http_error(503))) == NETWORK
+	assert classify(wrapped(http_error(401))) == AUTH
+	assert classify(wrapped(http_error(404))) == UNAVAILABLE
+	assert classify(urllib.error.URLError(ConnectionResetError())) == NETWORK
+	assert classify(yt_dlp.utils.GeoRestrictedError("This video is not available from your location")) == UNAVAILABLE
+	assert classify(yt_dlp.utils.PostProcessingError("ffmpeg exited with code 1")) == POSTPROCESS
+	assert classify(ValueError("bad data")) == UNKNOWN
+
+def test_backoff_delay_is_jittered_and_capped():
+	delays = [backoff_delay(attempt, 1.0, cap = 5.0) for attempt in range(10) for _ in range(20)]
+	assert all(0 <= delay <= 5.0 for delay in delays)
+	assert len(set(delays)) > 100
+
+def test_policy_retries_transient_errors_only():
+	retried = []
+	errors = [http_error(503), http_error(401)]
+
+	def flaky():
+		if errors: raise errors.pop(0)
+		return "ok"
+
+	policy = RetryPolicy(attempts = 3, backoff = 0)
+	assert policy.call("media", flaky, retried.append) == "ok"
+	assert retried == [NETWORK, AUTH] and policy.retries == 2
+
+	with pytest.raises(StageFailure) as failure:
+		policy.call("extract", lambda: (_ for _ in ()).throw(http_error(404)))
+	assert (failure.value.stage, failure.value.failure, failure.value.attempts) == ("extract", UNAVAILABLE, 1)
+
+	with pytest.raises(StageFailure) as failure:
+		policy.call("media", lambda: (_ for _ in ()).throw(http_error(502)))
+	assert failure.value.attempts == 3
+
+def test_dead_letters_persist(tmp_path):
+	path = str(tmp_path / "dead_letter.json")
+	letters = DeadLetters(path)
+	letters.add({"id": "G1", "url": "https://beta.crunchyroll.com/watch/G1/x"}, [{"format": "best"}], "media", NETWORK, http_error(503), 3)
+	letters.add({"id": "G2", "url": "https://beta.crunchyroll.com/watch/G2/x"}, None, "mux", POSTPROCESS, ValueError("x"))
+	letters.discard("G2")
+	reopened = DeadLetters(path)
+	assert reopened.pending() == [({"id": "G1", "url": "https://beta.crunchyroll.com/watch/G1/x"}, [{"format": "best"}])]
+	assert reopened.report()[0]["stage"] == "media" and reopened.report()[0]["attempts"] == 3
+	assert reopened.report(only_added = True) == []
+
+class FakeYoutubeDL:
+	def __init__(self, media_errors):
+		self.media_errors = media_errors
+		self.extractions = 0
+		self.fetches = 0
+		self._download_retcode = 0
+		self.filepath = None
+
+	def extract_info(self, url, download = False):
+		self.extractions += 1
+		return {"id": "G1", "title": "Episode 1", "season_number": 1, "episode_number": 1}
+
+	def prepare_filename(self, info):
+		return "Episode 1 [G1].mp4"
+
+	def sanitize_info(self, info, remove_private_keys = False):
+		return dict(info)
+
+	def process_ie_result(self, info, download = True):
+		self.fetches += 1
+		if self.media_errors: raise self.media_errors.pop(0)
+		return info
+
+class FakePool:
+	def __init__(self, dl):
+		self.dl = dl
+		self.invalidated = 0
+
+	def downloader(self, args = None):
+		return self.dl
+
+	def invalidate(self):
+		self.invalidated += 1
+
+def build(tmp_path, *media_errors):
+	dl = FakeYoutubeDL(list(media_errors))
+	letters = DeadLetters(str(tmp_path / "dead_letter.json"))
+	downloader = Downloader(ARGS, pool = FakePool(dl), retry = RetryPolicy(3, backoff = 0), dead_letters = letters)
+	return downloader, dl, letters
+
+def test_only_the_failed_stage_is_retried(tmp_path):
+	downloader, dl, letters = build(tmp_path, wrapped(http_error(503)), wrapped(http_error(500)))
+	downloader.download("https://beta.crunchyroll.com/watch/G1/episode-1", None)
+	assert (dl.extractions, dl.fetches) == (1, 3)
+	assert downloader.outcomes() == (1, 0) and letters.pending() == []
+
+def test_auth_errors_log_in_again(tmp_path):
+	downloader, dl, _ = build(tmp_path, wrapped(http_error(403)))
+	downloader.download("https://beta.crunchyroll.com/watch/G1/episode-1", None)
+	# the media urls are signed for the old session, so extraction runs again too
+	assert downloader.pool.invalidated == 1 and (dl.extractions, dl.fetches) == (2, 2)
+
+def test_permanent_failures_are_dead_lettered(tmp_path):
+	downloader, dl, letters = build(tmp_path, wrapped(http_error(404)))
+	downloader.download("https://beta.crunchyroll.com/watch/G1/episode-1", [{"format": "best"}])
+	assert dl.fetches == 1 and downloader.outcomes() == (0, 1)
+	letter, = letters.report(only_added = True)
+	assert (letter["stage"], letter["failure"], letter["attempts"]) == ("media", UNAVAILABLE, 1)
+	assert letter["entry"]["title"] == "Episode 1" and letter["args"] == [{"format": "best"}]
+	# a later successful run clears it
+	dl.media_errors = []
+	downloader.download("https://beta.crunchyroll.com/watch/G1/episode-1", [{"format": "best"}])
+	assert DeadLetters(letters.path).pending() == []
+
+SERIES_URL = "https://beta.crunchyroll.com/series/GYQ4MKDZ6/gintama"
+EPISODE_URL = "https://beta.crunchyroll.com/watch/GYK5PJV7R/enter-naruto-uzumaki"
+
+class ListingPool:
+	"""
+	Session pool whose series listing keeps failing while `down` and whose episode fails once.
+	"""
+	down = True
+
+	def __init__(self, build_downloader, username, password, on_invalidate = None, tracer = None):
+		self.episode_calls = 0
+
+	def invalidate(self):
+		pass
+
+	def run(self, ie_class, func, args = None):
+		if ListingPool.down: raise urllib.error.URLError("connection reset")
+		return [{"id": f"GS1E{number}", "season_number": 1, "episode_number": number, "title": f"S1E{number}"} for number in range(1, 6)]
+
+	def extract(self, ie_class, url, args = None):
+		self.episode_calls += 1
+		if self.episode_calls == 1: raise urllib.error.URLError("timed out")
+		return {"id": "GYK5PJV7R", "title": "Enter Naruto", "season_number": 1, "episode_number": 1}
+
+def test_failed_listings_are_dead_lettered_and_retried(tmp_path, capsys):
+	ListingPool.down = True
+	config = {
+		"username": "user", "password": "pass", "verbosity": False, "ffmpeg_location": None,
+		"destination": str(tmp_path), "threads": 2, "dry_run": True,
+		"download": {
+			"series": [{"url": SERIES_URL, "seasons": "1", "episodes": "2-3", "args": []}],
+			"episodes": [{"url": EPISODE_URL, "args": []}],
+		},
+		"cache": {"enabled": False}, "journal": {"enabled": False}, "index": {"enabled": False},
+		"retry": {"attempts": 2, "backoff": 0, "dead_letter": str(tmp_path / "dead_letter.json")},
+		"progress": {"format": "none"},
+	}
+	session(config, pool_class = ListingPool)
+	output = capsys.readouterr().out
+	# the episode listing succeeded on its second attempt and the run carried on
+	assert "GYK5PJV7R" in output and "[PREVIEW] 1 episodes" in output
+	[letter] = DeadLetters(str(tmp_path / "dead_letter.json")).report()
+	assert (letter["id"], letter["stage"], letter["failure"], letter["attempts"]) == ("GYQ4MKDZ6", "list", NETWORK, 2)
+
+	ListingPool.down = False
+	session({**config, "retry_failed": True}, pool_class = ListingPool)
+	output = capsys.readouterr().out
+	assert "GS1E2" in output and "GS1E3" in output and "GS1E4" not in output
+	assert DeadLetters(str(tmp_path / "dead_letter.json")).report() == []
@@ -0,0 +1,38 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.selection import merge_series, parse_ranges, selection
+from ..crunchy_dl.schema import SERIES_SCHEMA
+from cerberus import Validator
+import pytest
+
+URL = "https://beta.crunchyroll.com/series/GRDQPM1ZY/one-piece"
+
+def test_parse_ranges():
+	assert parse_ranges("1-3,7,10-12") == ([(1, 3), (7, 7), (10, 12)], None)
+	assert parse_ranges([1, "3-4", 2]) == ([(1, 4)], None)
+	assert parse_ranges(5) == ([(5, 5)], None)
+	assert parse_ranges("latest 3, 1", latest=True) == ([(1, 1)], 3)
+	with pytest.raises(ValueError):
+		parse_ranges("latest 3")
+
+def test_selection_defaults_to_single_season_fields():
+	assert selection({"url": URL, "season": 2, "start": 3, "end": 9}) == {2: ([(3, 9)], None)}
+	assert selection({"url": URL, "season": 2, "seasons": "1-2", "episodes": "last 4"}) == {1: ([], 4), 2: ([], 4)}
+
+def test_merge_series():
+	merged = merge_series([
+		{"url": URL, "season": 1, "start": 1, "end": 3, "args": []},
+		{"url": URL, "seasons": "1,3", "episodes": "3-6,latest 2", "priority": 2, "args": []},
+		{"url": URL, "season": 1, "start": 9, "end": 9, "args": [{"arg": "format", "value": "best"}]},
+	])
+	assert len(merged) == 2
+	assert merged[0]["selection"] == {1: ([(1, 6)], 2), 3: ([(3, 6)], 2)}
+	assert merged[0]["priority"] == 2
+	assert merged[1]["selection"] == {1: ([(9, 9)], None)}
+
+def test_series_schema_selection():
+	validator = Validator(SERIES_SCHEMA)
+	assert validator.validate({"url": URL, "seasons": "1-3", "episodes": "1-3,7,latest 2"})
+	assert validator.validate({"url": URL, "seasons": [1, 2], "episodes": 4})
+	assert not validator.validate({"url": URL, "episodes": "1-x"})
+	assert "episodes" in validator.errors
+	assert not validator.validate({"url": URL, "seasons": "latest 2"})
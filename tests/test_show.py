@@ -0,0 +1,166 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.main import AnimeShow, CrunchyrollSeasonShowIE
+from ..crunchy_dl.cache import MetadataCache
+from ..crunchy_dl.selection import merge_series
+from ..crunchy_dl.sync import Watermarks, SeasonsFrom
+
+ARGS = {"username": "user", "password": "pass", "verbosity": False, "ffmpeg_location": None, "destination": "."}
+
+class FakeExtractor:
+	def __init__(self, seasons, episodes):
+		self.seasons = seasons
+		self.episodes = episodes
+		self.listed = []
+		self.touched = 0
+
+	def season_entries(self, url, seasons):
+		wanted = {self.seasons} if seasons is None else seasons
+
+		def entries():
+			for season in range(1, self.seasons + 1):
+				if season not in wanted: continue
+				self.listed.append(season)
+				for number in range(1, self.episodes + 1):
+					self.touched += 1
+					yield {"id": f"S{season}E{number}", "season_number": season, "episode_number": number}
+		return entries()
+
+class FakePool:
+	def __init__(self, extractor):
+		self.extractor = extractor
+		self.calls = 0
+
+	def run(self, ie_class, func, args=None):
+		self.calls += 1
+		return func(self.extractor)
+
+def show(seasons = 10, episodes = 120, cache = None, watermarks = None):
+	extractor = FakeExtractor(seasons, episodes)
+	pool = FakePool(extractor)
+	return AnimeShow(ARGS, pool=pool, cache=cache, watermarks=watermarks), extractor, pool
+
+def meta(season, start, end):
+	return {"url": "https://beta.crunchyroll.com/series/GRDQPM1ZY/one-piece", "season": season, "start": start, "end": end}
+
+def test_show_only_lists_requested_season_and_stops_after_end():
+	anime, extractor, _ = show()
+	data, args = anime.extract_info(meta(4, 3, 5), ["arg"])
+	assert [entry["id"] for entry in data] == ["S4E3", "S4E4", "S4E5"]
+	assert all(entry["priority"] == 1 for entry in data)
+	assert args == ["arg"]
+	assert extractor.listed == [4]
+	# one entry past `end` tells iteration to stop
+	assert extractor.touched == 6
+
+def test_show_missing_season():
+	anime, extractor, _ = show(seasons = 2)
+	assert anime.extract_info(meta(3, 1, 5), None) == ([], None)
+	assert extractor.touched == 0
+
+def test_show_caches_each_season(tmp_path):
+	cache = MetadataCache(str(tmp_path / "cache.sqlite"))
+	anime, extractor, pool = show(cache = cache)
+	first, _ = anime.extract_info(meta(2, 1, 2), None)
+	second, _ = anime.extract_info(meta(2, 100, 120), None)
+	assert [entry["id"] for entry in first] == ["S2E1", "S2E2"]
+	assert len(second) == 21
+	assert pool.calls == 1 and extractor.listed == [2]
+	anime.extract_info(meta(3, 1, 1), None)
+	assert pool.calls == 2 and extractor.listed == [2, 3]
+	cache.close()
+
+def test_show_multi_season_and_latest():
+	anime, extractor, _ = show(seasons = 5, episodes = 24)
+	selection = {"url": meta(1, 1, 1)["url"], "seasons": "2-3", "episodes": "1-2,5,latest 2"}
+	data, _ = anime.extract_info(selection, None)
+	assert [entry["id"] for entry in data] == [
+		"S2E1", "S2E2", "S2E5", "S2E23", "S2E24", "S3E1", "S3E2", "S3E5", "S3E23", "S3E24"
+	]
+	assert extractor.listed == [2, 3]
+
+def test_show_merged_selection_extracts_once():
+	anime, extractor, pool = show(seasons = 3, episodes = 24)
+	url = meta(1, 1, 1)["url"]
+	merged = merge_series([
+		{"url": url, "season": 1, "start": 1, "end": 3, "args": []},
+		{"url": url, "seasons": [1, 2], "episodes": "2-4", "priority": 3, "args": []},
+	])
+	assert len(merged) == 1
+	data, _ = anime.extract_info(merged[0], [])
+	assert [entry["id"] for entry in data] == ["S1E1", "S1E2", "S1E3", "S1E4", "S2E2", "S2E3", "S2E4"]
+	assert all(entry["priority"] == 3 for entry in data)
+	# only as far as the last wanted episode of each season
+	assert extractor.touched == 10
+
+def test_sync_queues_only_new_episodes():
+	watermarks = Watermarks(":memory:")
+	anime, extractor, pool = show(seasons = 3, episodes = 10, watermarks = watermarks)
+	data, _ = anime.sync_info(meta(3, 1, 2), None)
+	# the first sync takes the configured selection and marks the newest episode
+	assert [entry["id"] for entry in data] == ["S3E1", "S3E2"]
+	watermarks.commit()
+	assert watermarks.get(meta(3, 1, 2)["url"])["episode_id"] == "S3E10"
+
+	extractor.episodes = 12
+	extractor.listed = []
+	data, _ = anime.sync_info(meta(3, 1, 2), None)
+	assert [entry["id"] for entry in data] == ["S3E11", "S3E12"]
+	assert extractor.listed == [3]
+	[row] = watermarks.report()
+	assert row["previous"]["episode_id"] == "S3E10" and row["newest"]["id"] == "S3E12"
+	watermarks.commit()
+
+	extractor.seasons = 4
+	extractor.episodes = 1
+	extractor.listed = []
+	data, _ = anime.sync_info(meta(3, 1, 2), None)
+	assert [entry["id"] for entry in data] == ["S4E1"]
+	assert extractor.listed == [3, 4]
+
+def test_sync_without_changes_keeps_mark():
+	watermarks = Watermarks(":memory:")
+	anime, extractor, _ = show(seasons = 1, episodes = 5, watermarks = watermarks)
+	anime.sync_info(meta(1, 1, 1), None)
+	watermarks.commit()
+	data, _ = anime.sync_info(meta(1, 1, 1), None)
+	assert data == []
+	watermarks.commit()
+	assert watermarks.get(meta(1, 1, 1)["url"])["episode_number"] == 5
+
+class OfflineShowIE(CrunchyrollSeasonShowIE):
+	_VALID_URL = CrunchyrollSeasonShowIE._VALID_URL
+	SEASONS = [{"id": "SP", "season_number": None}, {"id": "S1", "season_number": 1}, {"id": "S2", "season_number": 2}]
+
+	def _get_cookies(self, url):
+		return {"etp_rt": "token"}
+
+	def _get_params(self, lang):
+		return "https://api", "/bucket", {}
+
+	def _download_json(self, url, display_id, note = None, query = None):
+		if "/seasons?" in url: return {"items": self.SEASONS}
+		season = url.rsplit("=", 1)[1]
+		return {"items": [{"id": f"{season}E1", "slug_title": "episode", "sequence_number": 1}]}
+
+def test_seasons_from_a_mark_skip_unnumbered_seasons():
+	assert None not in SeasonsFrom(2) and 2.5 in SeasonsFrom(2) and 1 not in SeasonsFrom(2)
+	extractor = OfflineShowIE()
+	entries = extractor.season_entries("https://beta.crunchyroll.com/series/GYQ4MKDZ6/gintama", SeasonsFrom(1))
+	assert [entry["id"] for entry in entries] == ["S1E1", "S2E1"]
+
+class DubbedExtractor(FakeExtractor):
+	def season_entries(self, url, seasons):
+		# the unwanted dub of every episode is listed first
+		return iter([
+			{"id": f"{dub}E{number}", "season_number": 1, "episode_number": number, "audio_locale": dub}
+			for dub in ("ja-JP", "en-US") for number in range(1, self.episodes + 1)
+		])
+
+def test_show_selects_the_wanted_dub_of_each_episode():
+	extractor = DubbedExtractor(1, 5)
+	anime = AnimeShow({**ARGS, "audio": "en-US"}, pool=FakePool(extractor))
+	data, _ = anime.extract_info(meta(1, 2, 3), None)
+	assert [entry["id"] for entry in data] == ["en-USE2", "en-USE3"]
+	data, _ = anime.extract_info({**meta(1, 1, 1), "episodes": "latest 1"}, None)
+	assert [entry["id"] for entry in data] == ["en-USE5"]
+	assert anime.tracks.audio_skipped == 0
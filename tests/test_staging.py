@@ -0,0 +1,130 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.staging import Staging, StagingFull, estimate, parse_size
+from ..crunchy_dl.retry import DeadLetters
+from ..crunchy_dl.main import Downloader
+import os
+import threading
+import pytest
+
+ARGS = {"username": "user", "password": "pass", "verbosity": False, "ffmpeg_location": None}
+
+def test_parse_size_and_estimate():
+	assert parse_size("512M") == 512 * 1024 ** 2 and parse_size("1.5GiB") == 1.5 * 1024 ** 3 and parse_size(10) == 10
+	with pytest.raises(ValueError):
+		parse_size("lots")
+	assert estimate({"requested_formats": [{"filesize": 100}, {"filesize_approx": 20}]}) == 120
+	assert estimate({"filesize": None}) is None
+
+def test_admission_waits_for_space(tmp_path):
+	free = [1000]
+	staging = Staging(str(tmp_path / "stage"), str(tmp_path), reserve = 100, default_size = 300, poll = 0.01, free_space = lambda path: free[0])
+	staging.admit("GA", 400)
+	staging.admit("GA", 400)
+	staging.admit("GB", None)
+	admitted = threading.Event()
+	thread = threading.Thread(target = lambda: (staging.admit("GC", 200, mux = True), admitted.set()))
+	thread.start()
+	assert not admitted.wait(0.1)
+	# what the admitted episodes have written is already out of the free space
+	staging.written("GA", 400)
+	free[0] = 600
+	assert not admitted.wait(0.1)
+	staging.release("GA")
+	free[0] = 1000
+	assert admitted.wait(1)
+	assert staging.waits == 1
+	staging.release("GB")
+	staging.release("GC")
+	with pytest.raises(StagingFull):
+		staging.admit("GD", 2000)
+
+def test_finalise_moves_the_episode_and_its_leftovers(tmp_path):
+	destination = tmp_path / "library"
+	destination.mkdir()
+	staging = Staging(str(tmp_path / "stage"), str(destination))
+	season = tmp_path / "stage" / "Show"
+	season.mkdir()
+	(season / "Episode 1 [G1].mp4").write_bytes(b"video")
+	(season / "Episode 1 [G1].en-US.vtt").write_text("WEBVTT")
+	(season / "Episode 1 [G1].temp.mp4").write_bytes(b"mux")
+	(season / "Episode 10 [G10].mp4.part").write_bytes(b"partial")
+	assert staging.finalise(str(season / "Episode 1 [G1].mp4")) == str(destination / "Show" / "Episode 1 [G1].mp4")
+	assert sorted(os.listdir(destination / "Show")) == ["Episode 1 [G1].en-US.vtt", "Episode 1 [G1].mp4"]
+	assert sorted(os.listdir(season)) == ["Episode 1 [G1].temp.mp4", "Episode 10 [G10].mp4.part"]
+	# across filesystems it is copied to a temporary name and renamed into place
+	staging._same_device = False
+	(season / "Episode 2 [G2].mkv").write_bytes(b"video 2")
+	staging.finalise(str(season / "Episode 2 [G2].mkv"))
+	assert (destination / "Show" / "Episode 2 [G2].mkv").read_bytes() == b"video 2"
+	assert not (season / "Episode 2 [G2].mkv").exists()
+	assert (staging.renamed, staging.copied, staging.finalised, staging.finalised_bytes) == (2, 1, 2, 12)
+	assert staging.finalise(str(tmp_path / "elsewhere.mp4")) == str(tmp_path / "elsewhere.mp4")
+
+def test_finalise_never_overwrites(tmp_path):
+	staging = Staging(str(tmp_path / "stage"), str(tmp_path))
+	(tmp_path / "Episode 1 [G1].mp4").write_bytes(b"kept")
+	(tmp_path / "stage" / "Episode 1 [G1].mp4").write_bytes(b"new")
+	with pytest.raises(FileExistsError):
+		staging.finalise(str(tmp_path / "stage" / "Episode 1 [G1].mp4"))
+	assert (tmp_path / "Episode 1 [G1].mp4").read_bytes() == b"kept"
+	assert (tmp_path / "stage" / "Episode 1 [G1].mp4").exists()
+
+class FakeYoutubeDL:
+	def __init__(self, home, size):
+		self.home = home
+		self.size = size
+		self._download_retcode = 0
+		self.filepath = None
+
+	def extract_info(self, url, download = False):
+		return {"id": "G1", "title": "Episode 1", "ext": "mp4", "filesize": self.size}
+
+	def prepare_filename(self, info):
+		return os.path.join(self.home, "Episode 1 [G1].mp4")
+
+	def sanitize_info(self, info, remove_private_keys = False):
+		return dict(info)
+
+	def process_ie_result(self, info, download = True):
+		with open(info["filepath"], "wb") as f: f.write(b"x" * 10)
+		self.filepath = info["filepath"]
+		return info
+
+class FakePool:
+	def __init__(self, dl):
+		self.dl = dl
+
+	def downloader(self, args = None):
+		return self.dl
+
+def test_downloads_are_staged(tmp_path):
+	stage = tmp_path / "stage"
+	staging = Staging(str(stage), str(tmp_path), reserve = 0, free_space = lambda path: 100)
+	letters = DeadLetters(str(tmp_path / "dead_letter.json"))
+	dl = FakeYoutubeDL(str(stage), 50)
+	downloader = Downloader({**ARGS, "destination": str(tmp_path)}, pool = FakePool(dl), staging = staging, dead_letters = letters)
+	assert downloader.config["paths"] == {"home": str(stage)}
+	downloader.download("https://beta.crunchyroll.com/watch/G1/episode-1", None)
+	assert (tmp_path / "Episode 1 [G1].mp4").exists() and os.listdir(stage) == []
+	assert staging.outstanding == 0
+	os.remove(tmp_path / "Episode 1 [G1].mp4")
+	dl.size = 500
+	downloader.download("https://beta.crunchyroll.com/watch/G1/episode-1", None)
+	assert [(letter["stage"], letter["failure"]) for letter in letters.report()] == [("staging", "unknown")]
+
+def test_episodes_at_the_destination_are_not_downloaded_again(tmp_path):
+	(tmp_path / "Episode 1 [G1].mp4").write_bytes(b"kept")
+	staging = Staging(str(tmp_path / "stage"), str(tmp_path), reserve = 0, free_space = lambda path: 100)
+	dl = FakeYoutubeDL(str(tmp_path / "stage"), 50)
+	downloader = Downloader({**ARGS, "destination": str(tmp_path)}, pool = FakePool(dl), staging = staging)
+	downloader.download("https://beta.crunchyroll.com/watch/G1/episode-1", None)
+	assert dl.filepath is None and downloader.outcomes() == (1, 0)
+	assert (tmp_path / "Episode 1 [G1].mp4").read_bytes() == b"kept" and staging.outstanding == 0
+
+def test_prepared_info_is_not_extracted_again(tmp_path):
+	dl = FakeYoutubeDL(str(tmp_path), 50)
+	downloader = Downloader({**ARGS, "destination": str(tmp_path)}, pool = FakePool(dl))
+	info = downloader.prepare("https://beta.crunchyroll.com/watch/G1/episode-1", None)
+	dl.extract_info = None
+	downloader.download("https://beta.crunchyroll.com/watch/G1/episode-1", None, info)
+	assert dl.filepath == str(tmp_path / "Episode 1 [G1].mp4") and downloader.outcomes() == (1, 0)
@@ -0,0 +1,66 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.trace import NULL_SPAN, Tracer, percentile
+import json
+import threading
+from time import perf_counter, sleep
+
+def test_spans_and_stats():
+	tracer = Tracer()
+	for item in ("a", "b", "c"):
+		with tracer.span("extract", item):
+			sleep(0.01 if item != "c" else 0.03)
+	with tracer.span("login"):
+		pass
+	stats = tracer.stats()
+	assert stats["extract"]["count"] == 3 and stats["login"]["count"] == 1
+	assert 0.05 <= stats["extract"]["total"] < 1
+	assert stats["extract"]["max"] >= 0.03
+	assert tracer.slowest(1)[0][:2] == ("extract", "c")
+	report = tracer.report()
+	assert "extract" in report and "login" in report and "Slowest spans" in report
+
+def test_percentile():
+	values = list(range(1, 101))
+	assert [percentile(values, rank) for rank in (50, 90, 99)] == [50, 90, 99]
+	assert percentile([7], 99) == 7
+
+def test_disabled_tracer_records_nothing():
+	tracer = Tracer(enabled = False)
+	assert tracer.span("media", "a") is NULL_SPAN
+	start = perf_counter()
+	for _ in range(100000):
+		with tracer.span("media", "a"):
+			pass
+	assert perf_counter() - start < 1
+	tracer.record("media", "a", 0)
+	assert tracer.spans == [] and tracer.stats() == {}
+
+def test_hooks():
+	tracer = Tracer()
+	info = {"id": "G1"}
+	for status in ("downloading", "downloading", "finished"):
+		tracer.hook({"status": status, "filename": "ep.mp4", "info_dict": info})
+	tracer.hook({"status": "downloading", "filename": "ep.en.vtt", "info_dict": info})
+	tracer.hook({"status": "finished", "filename": "ep.en.vtt", "info_dict": info})
+	tracer.postprocessor_hook({"status": "started", "postprocessor": "EmbedSubtitle", "info_dict": info})
+	tracer.postprocessor_hook({"status": "finished", "postprocessor": "EmbedSubtitle", "info_dict": info})
+	assert sorted((stage, item) for stage, item, *_ in tracer.spans) == [("media", "G1"), ("mux", "G1"), ("subtitles", "G1")]
+
+def test_chrome_trace(tmp_path):
+	tracer = Tracer()
+
+	def work(item):
+		with tracer.span("episode", item):
+			sleep(0.01)
+
+	threads = [threading.Thread(target=work, args=(f"G{i}",), name=f"worker-{i}") for i in range(3)]
+	for thread in threads: thread.start()
+	for thread in threads: thread.join()
+	path = tmp_path / "trace.json"
+	tracer.chrome_trace(str(path))
+	events = json.loads(path.read_text())["traceEvents"]
+	spans = [event for event in events if event["ph"] == "X"]
+	names = {event["args"]["name"] for event in events if event["ph"] == "M"}
+	assert len(spans) == 3 and names == {"worker-0", "worker-1", "worker-2"}
+	assert all(event["dur"] >= 10000 and event["ts"] >= 0 for event in spans)
+	assert len({event["tid"] for event in spans}) == 3
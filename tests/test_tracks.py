@@ -0,0 +1,94 @@
+from __future__ import unicode_literals
+from ..crunchy_dl.tracks import (
+	AUDIO_PARAM, SubtitleFetcher, TrackStats, audio_wanted, parse_languages, track_params, with_tracks
+)
+from ..crunchy_dl.main import Downloader
+import pytest
+
+ARGS = {"username": "user", "password": "pass", "verbosity": False, "ffmpeg_location": None, "destination": "."}
+
+def test_parse_languages():
+	assert parse_languages(None) is None
+	assert parse_languages("en-US, de-DE") == ["en-US", "de-DE"]
+	assert parse_languages(["ja-JP"]) == ["ja-JP"]
+	assert parse_languages("none") == []
+	for spec in ("(", ",", ""):
+		with pytest.raises(ValueError):
+			parse_languages(spec)
+
+def test_track_params_and_entries():
+	assert track_params([], None) == {"writesubtitles": False, "subtitleslangs": []}
+	assert track_params(None, ["ja"]) == {AUDIO_PARAM: ["ja"]}
+	entry = {"url": "u", "args": [{"format": "best"}], "subtitles": "en-US"}
+	assert with_tracks(entry)["args"] == [{"format": "best"}, {"writesubtitles": True, "subtitleslangs": ["en-US"]}]
+	assert with_tracks({"url": "u", "args": []}) == {"url": "u", "args": []}
+
+def test_audio_wanted():
+	assert audio_wanted("ja-JP", ["ja"]) and audio_wanted("ja-JP", ["en-US", "ja-JP"])
+	assert not audio_wanted("en-US", ["ja-JP"])
+	assert audio_wanted("ja-JP", ["-en-US"]) and not audio_wanted("en-US", ["-en-.*"])
+	# nothing selected, or a language the extractor did not report, keeps the episode
+	assert audio_wanted("en-US", None) and audio_wanted(None, ["ja-JP"])
+
+def test_fetcher_skips_existing_files(tmp_path):
+	stats = TrackStats()
+	fetcher = SubtitleFetcher(2, stats)
+	present = tmp_path / "ep.de.vtt"
+	present.write_text("old")
+	paths = [fetcher.submit(str(tmp_path / "ep.en.vtt"), lambda: b"WEBVTT"), fetcher.submit(str(present), lambda: b"new")]
+	assert [future.result() for future in paths] == [str(tmp_path / "ep.en.vtt"), str(present)]
+	fetcher.close()
+	assert (tmp_path / "ep.en.vtt").read_bytes() == b"WEBVTT" and present.read_text() == "old"
+	assert (stats.subtitles_fetched, stats.subtitle_bytes) == (1, 6)
+	stats.subtitles(available = 10, selected = 1)
+	assert stats.report() == "[TRACKS] 1 of 10 subtitle tracks selected: 9 requests, ~0 KiB and their muxing saved"
+
+class FakeYoutubeDL:
+	def __init__(self, destination, language):
+		self.destination = destination
+		self.language = language
+		self.processed = []
+		self._download_retcode = 0
+		self.filepath = None
+
+	def extract_info(self, url, download = False):
+		return {
+			"id": "G1", "title": "Episode 1", "ext": "mp4", "language": self.language,
+			"subtitles": {lang: [{"ext": "vtt", "data": "WEBVTT"}] for lang in ("en-US", "de-DE", "fr-FR")},
+			"requested_subtitles": {"en-US": {"ext": "vtt", "data": "WEBVTT"}},
+		}
+
+	def prepare_filename(self, info):
+		return str(self.destination / "Episode 1 [G1].mp4")
+
+	def sanitize_info(self, info, remove_private_keys = False):
+		return dict(info)
+
+	def process_ie_result(self, info, download = True):
+		self.processed.append(info)
+		return info
+
+class FakePool:
+	def __init__(self, dl):
+		self.dl = dl
+
+	def downloader(self, args = None):
+		return self.dl
+
+def test_downloader_selects_tracks(tmp_path):
+	stats = TrackStats()
+	fetcher = SubtitleFetcher(2, stats)
+	dl = FakeYoutubeDL(tmp_path, "en-US")
+	downloader = Downloader({**ARGS, "audio": "ja-JP"}, pool = FakePool(dl), subtitles = fetcher)
+	downloader.download("https://beta.crunchyroll.com/watch/G1/episode-1", None)
+	# the dub is skipped before any media request
+	assert dl.processed == [] and downloader.outcomes() == (1, 0) and stats.audio_skipped == 1
+
+	dl.language = "ja-JP"
+	downloader.download("https://beta.crunchyroll.com/watch/G1/episode-1", None)
+	fetcher.close()
+	# yt-dlp downloads the media only, the selected subtitle was fetched alongside it
+	assert dl.processed[0]["subtitles"] == {}
+	assert (tmp_path / "Episode 1 [G1].en-US.vtt").read_text() == "WEBVTT"
+	assert (stats.subtitles_available, stats.subtitles_selected) == (3, 1)
+	assert downloader.config["subtitleslangs"] == ["all"] and "allsubtitles" not in downloader.config
@@ -69,9 +69,11 @@ def test_positive_int_type_error(_input):
 
 @pytest.mark.parametrize(
 	('_input', 'expected'),
-	(('5-4', (5, 5)),('1-1', (1, 1)), ('(5-4)', (5, 5)), 
-	 ('6-8', (6, 8)), ('(6-8)', (6, 8)), ('10-1', (10, 10)),
-	 ('5-', (5, 5)), ('10', (10, 10)), ('(10, 10)', (10, 10))
+	(('5-4', ([(5, 5)], None)),('1-1', ([(1, 1)], None)), ('(5-4)', ([(5, 5)], None)), 
+	 ('6-8', ([(6, 8)], None)), ('(6-8)', ([(6, 8)], None)), ('10-1', ([(10, 10)], None)),
+	 ('5-', ([(5, 5)], None)), ('10', ([(10, 10)], None)), ('(10, 10)', ([(10, 10)], None)),
+	 ('1-3,7,10-12', ([(1, 3), (7, 7), (10, 12)], None)), ('4-6, 1-5', ([(1, 6)], None)),
+	 ('latest 5', ([], 5)), ('1-2,last 3', ([(1, 2)], 3))
 ))
 def test_series_episode_range_type(_input, expected):
 	assert series_episode_range_type(_input) == expected
@@ -79,7 +81,7 @@ def test_series_episode_range_type(_input, expected):
 @pytest.mark.parametrize(
 	('_input'),
 	(('5--4'), ('-1-1'), ('(5-4)))'), ('68)))'), ('10-----1'),
-	 ('444j44'), ('rrrrr'), (''), ('0'), ('10-pp')
+	 ('444j44'), ('rrrrr'), (''), ('0'), ('10-pp'), ('1,,2'), ('latest 0'), ('latest')
 ))
 def test_series_episode_range_type_error(_input):
 	with pytest.raises(ArgumentTypeError):